@@ -0,0 +1,98 @@
+/*
+ * bench-inference.mjs
+ * Copyright (C) 2025 stantonik <stantonik@stantonik-mba.local>
+ *
+ * Distributed under terms of the MIT license.
+ */
+
+// Headless per-call timings of an exported model module:
+//   node scripts/bench-inference.mjs <model.js> <model.webgpu.safetensors> [calls] [batch]
+// Runs on a real adapter when there is one (navigator.gpu, e.g. Deno, or the optional `webgpu` package
+// under node), else on a mock device that only counts the WebGPU calls every inference makes.
+
+import { readFile } from 'node:fs/promises';
+import { pathToFileURL } from 'node:url';
+
+const getGPU = async () => {
+    if (globalThis.navigator?.gpu) return navigator.gpu;
+    try {
+        const { create, globals } = await import('webgpu');
+        Object.assign(globalThis, globals);
+        return create([]);
+    } catch {
+        return null;
+    }
+};
+
+const mockDevice = (counts) => {
+    Object.assign(globalThis, {
+        GPUBufferUsage: { MAP_READ: 1, MAP_WRITE: 2, COPY_SRC: 4, COPY_DST: 8, UNIFORM: 64, STORAGE: 128 },
+        GPUShaderStage: { COMPUTE: 4 },
+        GPUMapMode: { READ: 1, WRITE: 2 },
+    });
+    const count = (name, fn = () => ({})) => (...args) => {
+        counts[name] = (counts[name] || 0) + 1;
+        return fn(...args);
+    };
+    const buffer = ({ size }) => {
+        const data = new ArrayBuffer(Math.ceil(size / 4) * 4);
+        return { size, getMappedRange: count("getMappedRange", () => data), unmap: count("unmap"), mapAsync: count("mapAsync", async () => {}) };
+    };
+    const pass = { setPipeline: count("setPipeline"), setBindGroup: count("setBindGroup"), dispatchWorkgroups: count("dispatchWorkgroups"), end: count("end") };
+    return {
+        createBuffer: count("createBuffer", buffer),
+        createBindGroupLayout: count("createBindGroupLayout"),
+        createPipelineLayout: count("createPipelineLayout"),
+        createShaderModule: count("createShaderModule"),
+        createComputePipelineAsync: count("createComputePipelineAsync", async () => ({})),
+        createBindGroup: count("createBindGroup"),
+        createCommandEncoder: count("createCommandEncoder", () => ({
+            beginComputePass: count("beginComputePass", () => pass),
+            copyBufferToBuffer: count("copyBufferToBuffer"),
+            finish: count("finish"),
+        })),
+        queue: { submit: count("submit"), writeBuffer: count("writeBuffer") },
+    };
+};
+
+const [modulePath, weightsPath, calls = "200", batch = "1"] = process.argv.slice(2);
+if (!weightsPath) {
+    console.error("usage: bench-inference.mjs <model.js> <model.webgpu.safetensors> [calls] [batch]");
+    process.exit(1);
+}
+
+const gpu = await getGPU();
+const counts = {};
+let device;
+if (gpu) {
+    const adapter = await gpu.requestAdapter({ powerPreference: "high-performance" });
+    device = await adapter.requestDevice({ requiredFeatures: adapter.features.has("shader-f16") ? ["shader-f16"] : [] });
+} else {
+    device = mockDevice(counts);
+}
+
+const model = (await import(pathToFileURL(modulePath).href)).default;
+const bytes = new Uint8Array(await readFile(weightsPath));
+const net = model.streamed ? await model.load(device, weightsPath, { bytes }) : await model.setupNet(device, bytes);
+
+const n = Number(calls), b = Number(batch);
+const input = new Float32Array(b * 28 * 28), batchArg = new Int32Array([b]);
+for (let i = 0; i < 10; i++) await net(input, batchArg);
+
+for (const k of Object.keys(counts)) delete counts[k];
+const wall = [], sums = {};
+for (let i = 0; i < n; i++) {
+    const start = performance.now();
+    await net(input, batchArg);
+    wall.push(performance.now() - start);
+    for (const [k, v] of Object.entries(net.callTimings || {})) sums[k] = (sums[k] || 0) + v;
+}
+wall.sort((x, y) => x - y);
+
+console.log(`${modulePath} on ${gpu ? "WebGPU" : "a mock device"}, batch ${b}, ${n} calls`);
+console.log(`  wall     mean ${(wall.reduce((x, y) => x + y, 0) / n).toFixed(4)} ms  median ${wall[n >> 1].toFixed(4)} ms`);
+for (const [k, v] of Object.entries(sums)) console.log(`  ${k.padEnd(8)} mean ${(v / n).toFixed(4)} ms`);
+if (!gpu) {
+    const perCall = Object.entries(counts).map(([k, v]) => `${k} ${v / n}`).join(", ");
+    console.log(`  WebGPU calls per inference: ${perCall}`);
+}
@@ -24,6 +24,13 @@ const overlayCtx = overlay.getContext("2d");
 
 const rootStyles = getComputedStyle(document.documentElement);
 
+// Fired on the canvas whenever its pixels change (stroke segment, clear)
+const notifyChange = () => canvas.dispatchEvent(new Event("canvaschange"));
+
+export function onCanvasChange(listener) {
+    canvas.addEventListener("canvaschange", listener);
+}
+
 
 export function setupCanvas() {
     let drawing = false;
@@ -145,6 +152,7 @@ export function setupCanvas() {
 
         lastX = x;
         lastY = y;
+        notifyChange();
     };
 
     // Setup event listeners
@@ -184,7 +192,7 @@ export function setupCanvas() {
         },
         clear: {
             svg: clearSvg,
-            cb: () => { ctx.clearRect(0, 0, canvas.width, canvas.height); },
+            cb: () => { ctx.clearRect(0, 0, canvas.width, canvas.height); notifyChange(); },
         }
     };
 
@@ -225,19 +233,9 @@ export function setupCanvas() {
 
 }
 
-export function getCanvasImageData(width, height) {
-    // create an offscreen canvas
-    const offCanvas = document.createElement("canvas");
-    offCanvas.width = width;
-    offCanvas.height = height;
-    const offCtx = offCanvas.getContext("2d");
-
-    // draw the original canvas scaled into the offscreen canvas
-    offCtx.drawImage(canvas, 0, 0, width, height);
-
-    // get the pixel data
-    const imageData = offCtx.getImageData(0, 0, width, height);
-    return imageData;
+// snapshot of the canvas for the inference worker, downscaled there
+export function getCanvasBitmap() {
+    return createImageBitmap(canvas);
 }
 
 function updateOverlay(x, y) {
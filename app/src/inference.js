@@ -6,7 +6,9 @@
  */
 
 // Yliess HATI code (edited)
-let net;
+// The net, its GPUDevice and the input preprocessing live in a worker (inference.worker.js);
+// this side only sends canvas bitmaps and gets the results back.
+import InferenceWorker from './inference.worker.js?worker&inline';
 
 const modelUrl = "models";
 
@@ -20,62 +22,68 @@ const error = (err) => {
     throw new Error(err);
 };
 
-const timer = async (func, label = "") => {
-    const start = performance.now();
-    const out = await func();
-    const delta = (performance.now() - start).toFixed(1);
-    console.log(`${delta} ms ${label}`);
-    timerText.innerHTML = `${delta} ms ${label}`;
-    return out;
-};
+const worker = new InferenceWorker();
+const pending = new Map();
+let nextId = 0;
 
-const getDevice = async () => {
-    if (!navigator.gpu) error("WebGPU not supported.");
-    const adapter = await navigator.gpu.requestAdapter();
-    return await adapter.requestDevice({
-        requiredFeatures: ["shader-f16"],
-        powerPreference: "high-performance",
-    });
+worker.onmessage = ({ data: { id, result, error } }) => {
+    const { resolve, reject } = pending.get(id);
+    pending.delete(id);
+    if (error !== undefined) reject(new Error(error));
+    else resolve(result);
 };
 
+const call = (message, transfer = []) => new Promise((resolve, reject) => {
+    const id = nextId++;
+    pending.set(id, { resolve, reject });
+    worker.postMessage({ id, ...message }, transfer);
+});
+
+let loading = 0;
+let ready = false;
+
 const loadNet = async (modelName) => {
-    const jsPath = `${modelUrl}/${modelName}/${modelName}.js`;
-    const netPath = `${modelUrl}/${modelName}/${modelName}.webgpu.safetensors`;
+    const token = ++loading;
 
     try {
         statusText.innerHTML = "fetching model...";
-        const device = await getDevice();
-
-        // Fetch the JS module as text
-        const response = await fetch(jsPath);
-        if (!response.ok) throw new Error(`Failed to fetch ${jsPath}`);
-        const code = await response.text();
-
-        // Create a blob and import it as a module
-        const blob = new Blob([code], { type: "text/javascript" });
-        const blobUrl = URL.createObjectURL(blob);
-        const module = await import(/* @vite-ignore */blobUrl);
-        URL.revokeObjectURL(blobUrl);
 
-        const tinygrad = module.default;
-
-        // Load the weights
-        net = await timer(() => tinygrad.load(device, netPath), "(fetch + compilation)");
+        // Nets come from the model cache: in memory, from Cache Storage or fetched. Streamed modules
+        // resolve once the pipelines are compiled and their first call waits for the weights in flight.
+        // The worker resolves urls against its own (blob) location, it gets an absolute one
+        const { source, loadTime, firstPrediction, timings, current } = await call({
+            type: "load",
+            modelUrl: new URL(modelUrl, document.baseURI).href,
+            model: modelName,
+        });
+        if (token !== loading || !current) return; // another model was picked meanwhile
+        ready = true;
+        modelSelect.dispatchEvent(new Event("modelready"));
+
+        const breakdown = timings ? Object.entries(timings).map(([k, v]) => `${k} ${v.toFixed(1)} ms`).join(", ") : "";
+        console.log(`${modelName} from ${source}: ${loadTime.toFixed(1)} ms load, ${firstPrediction.toFixed(1)} ms to first prediction`, breakdown);
+        timerText.innerHTML = `${loadTime.toFixed(1)} ms (load from ${source}), ${firstPrediction.toFixed(1)} ms (first prediction)`;
 
         statusText.innerHTML = "ready to classify";
     } catch (e) {
-        error(e);
+        if (token === loading) error(e);
     }
 };
 
-export const makePrediction = async (image) => {
-    if (!net) error("Net not loaded yet.");
-    const res = await timer(
-        () => net(new Float32Array(image)),
-        "(inference)",
-    );
-    const logits = Array.from(new Float32Array(res[0]));
-    return logits;
+// Sends a canvas snapshot (transferred, not copied) and resolves to { skipped } when the downscaled
+// input did not change since the last call, else to { inferenceMs, logits, probabilities, input }
+export const makePrediction = async (bitmap, force = false) => {
+    if (!ready) {
+        bitmap.close();
+        error("Net not loaded yet.");
+    }
+    const start = performance.now();
+    const res = await call({ type: "predict", bitmap, force }, [bitmap]);
+    if (!res.skipped) {
+        const roundTrip = (performance.now() - start).toFixed(1);
+        timerText.innerHTML = `${res.inferenceMs.toFixed(1)} ms (inference), ${roundTrip} ms (round trip)`;
+    }
+    return res;
 };
 
 export const setupInference = async () => {
@@ -88,5 +96,3 @@ export const setupInference = async () => {
     modelSelect.addEventListener("change", (e) => loadNet(e.target.value));
     await loadNet(modelSelect.value);
 };
-
-
@@ -0,0 +1,67 @@
+/*
+ * inference.worker.js
+ * Copyright (C) 2025 stantonik <stantonik@stantonik-mba.local>
+ *
+ * Distributed under terms of the MIT license.
+ */
+
+// Owns the GPUDevice and the loaded net. Receives canvas snapshots as transferred ImageBitmaps,
+// downscales and preprocesses them on an OffscreenCanvas, runs the net and transfers back the
+// logits, probabilities and input; the main thread is left with drawing and the chart.
+import { loadModel } from './modelCache';
+import { cvtImageToMNISTInput, hashInput, softmax } from './mnist';
+
+let net = null;
+let loading = 0;
+let lastHash = null;
+
+const offCanvas = new OffscreenCanvas(28, 28);
+const offCtx = offCanvas.getContext("2d", { willReadFrequently: true });
+
+const handlers = {
+    load: async ({ modelUrl, model }) => {
+        const token = ++loading;
+        const start = performance.now();
+        const { net: loaded, source } = await loadModel(modelUrl, model);
+        const loadTime = performance.now() - start;
+        // streamed nets wait for the weights still in flight here
+        await loaded(new Float32Array(28 * 28), new Int32Array([1]));
+        const firstPrediction = performance.now() - start;
+        if (token === loading) {
+            net = loaded;
+            lastHash = null;
+        }
+        return { source, loadTime, firstPrediction, timings: loaded.timings, current: token === loading };
+    },
+
+    // force runs even when the input did not change (a restart)
+    predict: async ({ bitmap, force }) => {
+        offCtx.clearRect(0, 0, 28, 28);
+        offCtx.drawImage(bitmap, 0, 0, 28, 28);
+        bitmap.close();
+        const input = cvtImageToMNISTInput(offCtx.getImageData(0, 0, 28, 28));
+        const hash = hashInput(input);
+        if (!force && hash === lastHash) return { skipped: true };
+        if (!net) throw new Error("Net not loaded yet.");
+
+        const start = performance.now();
+        const res = await net(input, new Int32Array([1]));
+        const inferenceMs = performance.now() - start;
+        lastHash = hash;
+        // models exported with a symbolic batch return rows for their max batch, the first one is ours
+        const logits = new Float32Array(res[0].subarray(0, 10));
+        const probabilities = Float32Array.from(softmax(Array.from(logits)));
+        return { inferenceMs, logits, probabilities, input };
+    },
+};
+
+self.onmessage = async ({ data: { id, type, ...args } }) => {
+    try {
+        const result = await handlers[type](args);
+        // typed arrays go back without a copy
+        const transfer = Object.values(result).filter((v) => ArrayBuffer.isView(v)).map((v) => v.buffer);
+        self.postMessage({ id, result }, transfer);
+    } catch (e) {
+        self.postMessage({ id, error: String(e && e.message || e) });
+    }
+};
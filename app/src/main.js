@@ -7,9 +7,9 @@
 
 import './style.css';
 import Chart from 'chart.js/auto'
-import { getCanvasImageData, setupCanvas } from './drawing';
+import { getCanvasBitmap, onCanvasChange, setupCanvas } from './drawing';
 import { setupInference, makePrediction } from './inference';
-import { cvtImageToMNISTInput, cvtMNISTInputToImage, softmax, indexArray, makeImageLink, PALETTE } from './utils';
+import { cvtMNISTInputToImage, indexArray, makeImageLink, PALETTE } from './utils';
 
 let loopRunning = false;
 let predictionsChart;
@@ -102,37 +102,99 @@ await setupInference();
 
 setupPredictions();
 
-async function loopInference() {
+// Inference scheduler: runs only when the canvas changed, debounced on stroke events, with at most
+// one inference in flight and nothing at all while idle. The worker skips inputs it has already seen
+const DEBOUNCE_MS = 30;   // quiet time after the last stroke event
+const MAX_WAIT_MS = 50;   // while drawing continuously, still predict at least this often
+
+let timer = null;
+let firstChange = 0;
+let inFlight = false;
+let dirty = false;
+let force = false;
+let lastInput = null;
+let pendingP = null;
+
+function scheduleInference() {
     if (!loopRunning) return;
+    const now = performance.now();
+    if (timer === null) firstChange = now;
+    clearTimeout(timer);
+    timer = setTimeout(runInference, now - firstChange >= MAX_WAIT_MS ? 0 : DEBOUNCE_MS);
+}
 
-    const imageData = getCanvasImageData(28, 28);
-    const input = cvtImageToMNISTInput(imageData);
+function renderPredictions(p) {
+    if (pendingP === null) {
+        requestAnimationFrame(() => {
+            if (loopRunning) updatePredictions(pendingP);
+            pendingP = null;
+        });
+    }
+    pendingP = p;
+}
 
-    // Download to preview input
-    const link = document.getElementById("check-input")
-    link.href = makeImageLink(cvtMNISTInputToImage(input, 28, 28), 28, 28);
-    link.download = "input";
+async function runInference() {
+    timer = null;
+    if (!loopRunning) return;
+    if (inFlight) {
+        // picked up as soon as the current one is done
+        dirty = true;
+        return;
+    }
 
-    const logits = await makePrediction(input);
-    const p = softmax(logits);
-    const pIdx = indexArray(p);
-    console.log(p);
-    console.log(pIdx);
-    updatePredictions(pIdx);
+    inFlight = true;
+    const forced = force;
+    force = false;
+    try {
+        const res = await makePrediction(await getCanvasBitmap(), forced);
+        if (!res.skipped && loopRunning) {
+            lastInput = res.input;
+            renderPredictions(indexArray(res.probabilities));
+        }
+    } catch (e) {
+        console.error(e);
+    } finally {
+        inFlight = false;
+        if (dirty) {
+            dirty = false;
+            runInference();
+        }
+    }
+}
 
-    setTimeout(loopInference, 200); // call again after 0.2s
+function stopInference() {
+    clearTimeout(timer);
+    timer = null;
+    dirty = false;
+    updatePredictions();
 }
 
 // Event listeners
+onCanvasChange(scheduleInference);
+
+// a new model has to see the current drawing again
+document.getElementById("model").addEventListener("modelready", () => {
+    force = true;
+    scheduleInference();
+});
+
+// the input preview is only built when asked for
+const link = document.getElementById("check-input");
+link.download = "input";
+link.addEventListener("click", () => {
+    if (lastInput) link.href = makeImageLink(cvtMNISTInputToImage(lastInput, 28, 28), 28, 28);
+});
+
 document.getElementById("run").addEventListener("click", (e) => {
     const btn = e.target;
     if (loopRunning) {
         btn.textContent = "Run Model";
         loopRunning = false;
-        updatePredictions();
+        stopInference();
     } else {
         btn.textContent = "Stop Model";
         loopRunning = true;
-        loopInference();
+        force = true;
+        runInference();
     }
 })
@@ -0,0 +1,42 @@
+/*
+ * mnist.js
+ * Copyright (C) 2025 stantonik <stantonik@stantonik-mba.local>
+ *
+ * Distributed under terms of the MIT license.
+ */
+
+// Input preprocessing and output helpers without DOM access, usable from the inference worker
+
+export function cvtImageToMNISTInput(imageData) {
+    const { data, width, height } = imageData;
+    const grayArray = new Float32Array(width * height);
+
+    for (let i = 0; i < width * height; i++) {
+        const r = data[i * 4 + 0];
+        const g = data[i * 4 + 1];
+        const b = data[i * 4 + 2];
+        // simple average, normalized to [0,1]
+        grayArray[i] = (r + g + b) / (3 * 255) > 0.2 ? 1 : -1;
+    }
+
+    return grayArray;
+}
+
+export function softmax(arr) {
+    const max = Math.max(...arr); // for numerical stability
+    const exps = arr.map(x => Math.exp(x - max));
+    const sum = exps.reduce((a, b) => a + b, 0);
+    return exps.map(v => v / sum);
+}
+
+// FNV-1a over the input bytes, equal inputs skip the GPU. Byte-wise: xoring whole words only
+// flips bit 31 for 1 vs -1, the hash would then only see the parity of the changed pixels
+export function hashInput(input) {
+    const bytes = new Uint8Array(input.buffer, input.byteOffset, input.byteLength);
+    let h = 0x811c9dc5;
+    for (let i = 0; i < bytes.length; i++) {
+        h ^= bytes[i];
+        h = Math.imul(h, 0x01000193);
+    }
+    return h >>> 0;
+}
@@ -0,0 +1,142 @@
+/*
+ * modelCache.js
+ * Copyright (C) 2025 stantonik <stantonik@stantonik-mba.local>
+ *
+ * Distributed under terms of the MIT license.
+ */
+
+// One GPUDevice for the page, compiled nets kept in memory (LRU), and the fetched module / weight
+// files persisted in Cache Storage under the content hashes of <model>.manifest.json: switching
+// back to a model skips everything, a reload skips the network.
+
+const CACHE_NAME = "mnist-models";
+const MAX_NETS = 3;
+
+let devicePromise = null;
+const nets = new Map(); // "<model>@<js hash>:<weights hash>" -> Promise<{ net, source }>, least recently used first
+
+export const getDevice = () => {
+    if (!devicePromise) {
+        devicePromise = (async () => {
+            if (!navigator.gpu) throw new Error("WebGPU not supported.");
+            const adapter = await navigator.gpu.requestAdapter({ powerPreference: "high-performance" });
+            if (!adapter) throw new Error("No WebGPU adapter found.");
+            const device = await adapter.requestDevice({ requiredFeatures: ["shader-f16"] });
+            // every cached net lives on this device
+            device.lost.then(() => {
+                devicePromise = null;
+                nets.clear();
+            });
+            return device;
+        })();
+        devicePromise.catch(() => { devicePromise = null; });
+    }
+    return devicePromise;
+};
+
+// Cache Storage (secure contexts only); entries are keyed by url?v=<hash>
+const openCache = async () => {
+    if (typeof caches === "undefined") return null;
+    return await caches.open(CACHE_NAME).catch(() => null);
+};
+
+const cacheKey = (url, version) => new URL(`${url}?v=${version}`, location.href).href;
+
+const sha256 = async (bytes) => {
+    const digest = new Uint8Array(await crypto.subtle.digest("SHA-256", bytes));
+    return Array.from(digest, (b) => b.toString(16).padStart(2, "0")).join("");
+};
+
+const getCached = async (url, version) => {
+    const cache = version ? await openCache() : null;
+    const res = cache ? await cache.match(cacheKey(url, version)) : null;
+    return res ? new Uint8Array(await res.arrayBuffer()) : null;
+};
+
+const putCached = async (url, version, bytes) => {
+    try {
+        const cache = version ? await openCache() : null;
+        // a file from a half-finished deploy must not be stored under the new version
+        if (!cache || !(await sha256(bytes)).startsWith(version)) return;
+        const key = cacheKey(url, version);
+        for (const req of await cache.keys()) {
+            if (new URL(req.url).pathname === new URL(key).pathname && req.url !== key) await cache.delete(req);
+        }
+        await cache.put(key, new Response(bytes));
+    } catch (e) {
+        console.warn(`not caching ${url}:`, e);
+    }
+};
+
+const fetchBytes = async (url) => {
+    const response = await fetch(url);
+    if (!response.ok) throw new Error(`Failed to fetch ${url}`);
+    return new Uint8Array(await response.arrayBuffer());
+};
+
+// older exports have no manifest, they only get the in-memory cache
+const getManifest = async (dir, name) => {
+    const response = await fetch(`${dir}/${name}.manifest.json`, { cache: "no-cache" }).catch(() => null);
+    return response && response.ok ? await response.json() : {};
+};
+
+const importModule = async (code) => {
+    const blobUrl = URL.createObjectURL(new Blob([code], { type: "text/javascript" }));
+    try {
+        return (await import(/* @vite-ignore */blobUrl)).default;
+    } finally {
+        URL.revokeObjectURL(blobUrl);
+    }
+};
+
+const buildNet = async (jsPath, weightsPath, manifest) => {
+    const device = await getDevice();
+
+    let source = "cache";
+    let code = await getCached(jsPath, manifest.js);
+    if (!code) {
+        source = "network";
+        code = await fetchBytes(jsPath);
+        putCached(jsPath, manifest.js, code);
+    }
+    const tinygrad = await importModule(code);
+
+    const weights = await getCached(weightsPath, manifest.weights);
+    if (!weights) source = "network";
+    let net;
+    if (tinygrad.streamed) {
+        // streamed modules assemble the file from their range requests for us to store
+        net = await tinygrad.load(device, weightsPath, weights ? { bytes: weights } : { keepBytes: Boolean(manifest.weights) });
+        if (!weights) net.weightsReady.then((bytes) => bytes && putCached(weightsPath, manifest.weights, bytes), () => {});
+    } else {
+        const bytes = weights || await fetchBytes(weightsPath);
+        if (!weights) putCached(weightsPath, manifest.weights, bytes);
+        net = await tinygrad.setupNet(device, bytes);
+    }
+    return { net, source };
+};
+
+// resolves to { net, source } where source is "memory", "cache" or "network"
+export const loadModel = async (modelUrl, name) => {
+    const dir = `${modelUrl}/${name}`;
+    const manifest = await getManifest(dir, name);
+    const key = `${name}@${manifest.js}:${manifest.weights}`;
+
+    if (nets.has(key)) {
+        const entry = nets.get(key);
+        nets.delete(key);
+        nets.set(key, entry); // most recently used
+        return { net: (await entry).net, source: "memory" };
+    }
+
+    const entry = buildNet(`${dir}/${name}.js`, `${dir}/${name}.webgpu.safetensors`, manifest);
+    nets.set(key, entry);
+    entry.catch(() => nets.delete(key));
+    while (nets.size > MAX_NETS) {
+        const [evicted, old] = nets.entries().next().value;
+        nets.delete(evicted);
+        // the GPU buffers are not garbage collected with the net; older exports have no destroy()
+        old.then(({ net }) => net.destroy?.(), () => {});
+    }
+    return await entry;
+};
@@ -7,6 +7,9 @@
 
 import './style.css';
 
+// DOM-free helpers live in mnist.js, shared with the inference worker
+export { cvtImageToMNISTInput, softmax } from './mnist';
+
 // Build palette object
 const buildPalette = () => {
     // Helper to read CSS variables from :root
@@ -47,21 +50,6 @@ window.addEventListener('load', () => {
 
 export const refreshPalette = () => Object.assign(PALETTE, buildPalette());
 
-export function cvtImageToMNISTInput(imageData) {
-    const { data, width, height } = imageData;
-    const grayArray = new Float32Array(width * height);
-
-    for (let i = 0; i < width * height; i++) {
-        const r = data[i * 4 + 0];
-        const g = data[i * 4 + 1];
-        const b = data[i * 4 + 2];
-        // simple average, normalized to [0,1]
-        grayArray[i] = (r + g + b) / (3 * 255) > 0.2 ? 1 : -1;
-    }
-
-    return grayArray;
-}
-
 export function cvtMNISTInputToImage(arr, width, height) {
     const imageData = new ImageData(width, height);
     for (let i = 0; i < arr.length; i++) {
@@ -81,13 +69,6 @@ export function indexArray(iterable) {
     );
 }
 
-export function softmax(arr) {
-    const max = Math.max(...arr); // for numerical stability
-    const exps = arr.map(x => Math.exp(x - max));
-    const sum = exps.reduce((a, b) => a + b, 0);
-    return exps.map(v => v / sum);
-}
-
 export function makeImageLink(image, width, height) {
     const tmpCanvas = document.createElement("canvas");
     tmpCanvas.width = width;
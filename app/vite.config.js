@@ -11,6 +11,9 @@ import { viteSingleFile } from 'vite-plugin-singlefile'
 
 export default defineConfig({
     base: "/mnist/",
+    worker: {
+        format: "es",
+    },
     plugins: [
         viteSingleFile(),
     ],
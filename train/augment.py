@@ -0,0 +1,231 @@
+#! /usr/bin/env python3
+# vim:fenc=utf-8
+#
+# Copyright (C) 2025 Stanley Arnaud <stantonik@stantonik-mba.local>
+#
+# Distributed under terms of the MIT license.
+
+from pathlib import Path
+from typing import Optional
+from tinygrad import Tensor, TinyJit, dtypes
+from tinygrad.device import Device
+from tinygrad.helpers import getenv
+from utils import SamplingMod
+import dataset
+import math
+import multiprocessing
+import numpy as np
+import os
+import time
+
+_grids: dict[tuple[int, int, str], Tensor] = {}
+
+def base_grid(H: int, W: int, device=None) -> Tensor:
+    # homogeneous pixel coordinates (1, H*W, 3), built once per shape and device
+    key = (H, W, Device.canonicalize(device))
+    if key not in _grids:
+        y, x = Tensor.arange(H, device=key[2]).float(), Tensor.arange(W, device=key[2]).float()
+        grid = Tensor.stack(x.reshape(1, W).expand(H, W), y.reshape(H, 1).expand(H, W), Tensor.ones(H, W, device=key[2]), dim=-1)
+        _grids[key] = grid.reshape(1, H * W, 3).contiguous().realize()
+    return _grids[key]
+
+def affine_params(angle_deg: Tensor, scale: Tensor, shift_x: Tensor, shift_y: Tensor) -> Tensor:
+    # (B, 2, 3) rotation/scale/shift matrices in a single stack
+    angle = angle_deg * (math.pi / 180.0)
+    cos_a, sin_a = angle.cos() * scale, angle.sin() * scale
+    return Tensor.stack(cos_a, -sin_a, shift_x, sin_a, cos_a, shift_y, dim=1).reshape(-1, 2, 3)
+
+def random_affine(B: int, angle: float, scale: float, shift: float, device=None) -> Tensor:
+    # uniform in [-angle, angle] degrees, [1 - scale, 1 + scale] and [-shift, shift]
+    r = Tensor.rand(4, B, device=device) * 2 - 1
+    return affine_params(r[0] * angle, 1.0 + r[1] * scale, r[2] * shift, r[3] * shift)
+
+def affine_transform(X: Tensor, theta: Tensor, sampling: SamplingMod) -> Tensor:
+    B, C, H, W = X.shape
+    coords = (base_grid(H, W, X.device).unsqueeze(2) * theta.unsqueeze(1)).sum(-1)  # (B, H*W, 2)
+    x, y = coords[:, :, 0], coords[:, :, 1]
+    X_flat = X.reshape(B, C * H * W)
+
+    match sampling:
+      case SamplingMod.NEAREST:
+        idx = y.round().clip(0, H - 1).int() * W + x.round().clip(0, W - 1).int()
+        return X_flat.gather(1, idx).reshape(B, C, H, W)
+
+      case SamplingMod.BILINEAR:
+        x0, y0 = x.floor(), y.floor()
+        dx, dy = x - x0, y - y0
+        xs = Tensor.stack(x0, x0 + 1, x0, x0 + 1, dim=-1).clip(0, W - 1).int()
+        ys = Tensor.stack(y0, y0, y0 + 1, y0 + 1, dim=-1).clip(0, H - 1).int()
+        weights = Tensor.stack((1.0 - dx) * (1.0 - dy), dx * (1.0 - dy), (1.0 - dx) * dy, dx * dy, dim=-1)
+        # the four corners go through one gather, then a single weighted reduction
+        corners = X_flat.gather(1, (ys * W + xs).reshape(B, H * W * 4)).reshape(B, H * W, 4)
+        return (corners * weights).sum(-1).reshape(B, C, H, W)
+
+def geometric_transform(X: Tensor, angle_deg: Tensor, scale: Tensor, shift_x: Tensor, shift_y: Tensor, sampling: SamplingMod) -> Tensor:
+    return affine_transform(X, affine_params(angle_deg, scale, shift_x, shift_y), sampling)
+
+# -----------------
+# Offline augmentation
+# -----------------
+# K augmented copies of X_train are generated by a background process into a memory-mapped
+# uint8 file (K, N, 1, 28, 28); a progress file counts the finished epochs so readers (and later
+# runs with the same settings) can stream from it while generation is still going. Every epoch is
+# written in its own shuffled order, with the matching labels in a (K, N) side file, so a loader
+# reads batches as contiguous slices
+class AugmentStore:
+    def __init__(self, epochs: int, angle: float, scale: float, shift: float, sampling: SamplingMod, chunk: int = 1000):
+        self.epochs, self.params, self.chunk = epochs, (angle, scale, shift, sampling), chunk
+        self.path = dataset.CACHE_DIR / "augmented" / f"k{epochs}-a{angle}-s{scale}-t{shift}-{sampling.name.lower()}.u8"
+        self.progress_path, self.lock_path = self.path.with_suffix(".progress"), self.path.with_suffix(".lock")
+        self.labels_path = self.path.with_suffix(".labels")
+        self.shape = (epochs, *dataset.mnist_arrays()[0].shape)
+        self.worker: Optional[multiprocessing.Process] = None
+        self.data: Optional[np.memmap] = None
+        self.label_data: Optional[np.memmap] = None
+
+    def ready(self) -> int: return _progress(self.path)
+
+    def start(self):
+        if self.ready() == self.epochs: return
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        # one generator per store, even across parallel sweep workers; the lock holds the owner's pid
+        try: fd = os.open(self.lock_path, os.O_CREAT | os.O_EXCL | os.O_WRONLY)
+        except FileExistsError:
+            if self._owner_alive(): return
+            self.lock_path.unlink(missing_ok=True)
+            return self.start()
+        os.write(fd, str(os.getpid()).encode())
+        os.close(fd)
+        ctx = multiprocessing.get_context("spawn")
+        self.worker = ctx.Process(target=_generate, args=(self.path, self.shape, self.params, self.chunk), daemon=True)
+        self.worker.start()
+
+    def _owner_alive(self) -> bool:
+        try: pid = int(self.lock_path.read_text())
+        except (OSError, ValueError): return True  # being created right now
+        try: os.kill(pid, 0)
+        except OSError: return False
+        return True
+
+    def _wait(self, k: int):
+        while self.ready() <= k:
+            if self.worker is not None and not self.worker.is_alive() and self.ready() <= k:
+                raise RuntimeError(f"augmentation worker exited with code {self.worker.exitcode}")
+            if self.worker is None and not self._owner_alive(): self.start()  # the other generator died, take over
+            time.sleep(0.05)
+
+    def epoch(self, e: int) -> np.ndarray:
+        self._wait(k := e % self.epochs)
+        if self.data is None: self.data = np.memmap(self.path, dtype=np.uint8, mode="r", shape=self.shape)
+        return self.data[k]
+
+    def labels(self, e: int) -> np.ndarray:
+        self._wait(k := e % self.epochs)
+        if self.label_data is None: self.label_data = np.memmap(self.labels_path, dtype=np.uint8, mode="r", shape=self.shape[:2])
+        return self.label_data[k]
+
+    def close(self):
+        if self.worker is not None and self.worker.is_alive(): self.worker.terminate()
+        if self.worker is not None: self.lock_path.unlink(missing_ok=True)
+
+def _progress(path: Path) -> int:
+    # stores from before the shuffled layout have no labels file, they are regenerated
+    progress = path.with_suffix(".progress")
+    return int(progress.read_text()) if progress.exists() and path.with_suffix(".labels").exists() else 0
+
+def _generate(path: Path, shape: tuple[int, ...], params: tuple, chunk: int):
+    Device.DEFAULT = "CPU"  # leave the accelerator to the training process
+    angle, scale, shift, sampling = params
+    X_train, Y_train = dataset.mnist_arrays()[:2]
+    progress, done = path.with_suffix(".progress"), _progress(path)
+    out = np.memmap(path, dtype=np.uint8, mode="r+" if done else "w+", shape=shape)
+    labels = np.memmap(path.with_suffix(".labels"), dtype=np.uint8, mode="r+" if done else "w+", shape=shape[:2])
+
+    @TinyJit
+    def augment_chunk(X: Tensor) -> Tensor:
+        out = affine_transform(X, random_affine(X.shape[0], angle, scale, shift), sampling)
+        return out.round().clip(0, 255).cast(dtypes.uint8).realize()
+
+    Tensor.manual_seed(done)
+    for e in range(done, shape[0]):
+        perm = np.random.default_rng(e).permutation(len(X_train))
+        for start in range(0, len(X_train), chunk):
+            X = Tensor(X_train[perm[start:start + chunk]])
+            if X.shape[0] == chunk: out[e, start:start + chunk] = augment_chunk(X).numpy()
+            else: out[e, start:] = augment_chunk.fxn(X).numpy()  # ragged tail, skip the JIT
+        labels[e] = Y_train[perm]
+        out.flush()
+        labels.flush()
+        tmp = progress.with_suffix(".tmp")
+        tmp.write_text(str(e + 1))
+        tmp.replace(progress)
+
+# The original per-call implementation (grid and affine matrix rebuilt every step), kept only as the
+# benchmark's baseline below; training uses affine_transform()
+def reference_transform(X: Tensor, angle_deg: Tensor, scale: Tensor, shift_x: Tensor, shift_y: Tensor, sampling: SamplingMod) -> Tensor:
+    B, C, H, W = X.shape
+
+    angle = angle_deg * math.pi / 180.0
+    cos_a, sin_a = Tensor.cos(angle), Tensor.sin(angle)
+    R11, R12, T13 = cos_a * scale, -sin_a * scale, shift_x
+    R21, R22, T23 = sin_a * scale, cos_a * scale, shift_y
+    row1 = Tensor.cat(R11.reshape(B, 1), R12.reshape(B, 1), T13.reshape(B, 1), dim=1).reshape(B, 1, 3)
+    row2 = Tensor.cat(R21.reshape(B, 1), R22.reshape(B, 1), T23.reshape(B, 1), dim=1).reshape(B, 1, 3)
+    row3 = Tensor([[0.0, 0.0, 1.0]]).expand(B, 1, 3)
+    affine_matrix = Tensor.cat(row1, row2, row3, dim=1)
+
+    x_idx, y_idx = Tensor.arange(W).float(), Tensor.arange(H).float()
+    grid_y, grid_x = y_idx.reshape(-1, 1).expand(H, W), x_idx.reshape(1, -1).expand(H, W)
+    coords = Tensor.stack([grid_x.flatten(), grid_y.flatten()], dim=1)
+    coords_homo = Tensor.cat(coords, Tensor.ones(H * W, 1), dim=1).reshape(1, H * W, 3).expand(B, H * W, 3)
+    transformed_coords = coords_homo.matmul(affine_matrix.permute(0, 2, 1))
+
+    match sampling:
+      case SamplingMod.NEAREST:
+        x_idx = transformed_coords[:, :, 0].round().clip(0, W - 1).int()
+        y_idx = transformed_coords[:, :, 1].round().clip(0, H - 1).int()
+        return X.reshape(B, C * H * W).gather(1, y_idx * W + x_idx).reshape(B, C, H, W)
+
+      case SamplingMod.BILINEAR:
+        x_prime, y_prime = transformed_coords[:, :, 0],  transformed_coords[:, :, 1]
+        x0, y0 = x_prime.floor().int(), y_prime.floor().int()
+        dx, dy = x_prime - x0.float(), y_prime - y0.float()
+
+        x1, y1 = x0 + 1, y0 + 1
+        x0, y0 = x0.clip(0, W - 1), y0.clip(0, H - 1)
+        x1, y1 = x1.clip(0, W - 1), y1.clip(0, H - 1)
+
+        w00 = (1.0 - dx) * (1.0 - dy)
+        w10 = dx * (1.0 - dy)
+        w01 = (1.0 - dx) * dy
+        w11 = dx * dy
+
+        X_flat = X.reshape(B, C * H * W)
+        v00 = X_flat.gather(1, y0 * W + x0)
+        v10 = X_flat.gather(1, y0 * W + x1)
+        v01 = X_flat.gather(1, y1 * W + x0)
+        v11 = X_flat.gather(1, y1 * W + x1)
+
+        return ((w00 * v00) + (w10 * v10) + (w01 * v01) + (w11 * v11)).reshape(B, C, H, W)
+
+if __name__ == "__main__":
+    # per-step augmentation cost, reference_transform vs this module
+    B, STEPS = int(getenv("BATCH", 128)), int(getenv("STEPS", 50))
+    X = Tensor.randint(B, 1, 28, 28, high=256).realize()
+
+    def bench(fn, sampling: SamplingMod) -> float:
+        @TinyJit
+        def step() -> Tensor:
+            angle, scale = Tensor.rand(B) * 30 - 15, Tensor.rand(B) * 0.2 + 0.9
+            shift_x, shift_y = Tensor.rand(B) * 0.2 - 0.1, Tensor.rand(B) * 0.2 - 0.1
+            return fn(X, angle, scale, shift_x, shift_y, sampling).realize()
+        for _ in range(3): step()
+        Device[Device.DEFAULT].synchronize()
+        start = time.perf_counter()
+        for _ in range(STEPS): step()
+        Device[Device.DEFAULT].synchronize()
+        return (time.perf_counter() - start) * 1000 / STEPS
+
+    for sampling in SamplingMod:
+        before, after = bench(reference_transform, sampling), bench(geometric_transform, sampling)
+        print(f"{sampling.name:8s} B={B}  before: {before:7.3f} ms/step  after: {after:7.3f} ms/step  ({before / after:.2f}x)")
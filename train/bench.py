@@ -0,0 +1,172 @@
+#! /usr/bin/env python3
+# vim:fenc=utf-8
+#
+# Copyright (C) 2025 Stanley Arnaud <stantonik@stantonik-mba.local>
+#
+# Distributed under terms of the MIT license.
+
+from dataclasses import asdict, dataclass, replace
+from pathlib import Path
+from typing import Callable, Optional
+from tinygrad import Tensor, TinyJit, nn
+from tinygrad.device import Device
+from tinygrad.helpers import GlobalCounters, getenv
+from tinygrad.uop.ops import UOp
+from augment import affine_transform, random_affine
+from evaluate import Evaluator
+from metrics import MetricsRing
+from precision import mixed_precision
+from train import build_model, make_step
+from utils import HPConfig, SamplingMod
+import json
+import models
+import platform
+import sys
+import time
+
+@dataclass
+class BenchResult:
+    phase: str
+    type: str
+    backend: str
+    batch_size: int
+    width: Optional[int]
+    depth: Optional[int]
+    steps_per_s: float
+    samples_per_s: float
+    jit_s: float            # first calls, until the JIT has captured and compiled every kernel
+    mem_mb: float           # peak device memory allocated by tinygrad during the phase
+    precision: str = "fp32"
+
+    def key(self) -> str:
+        key = f"{self.phase}/{self.type}/{self.backend}/b{self.batch_size}/w{self.width}/d{self.depth}"
+        return key if self.precision == "fp32" else f"{key}/{self.precision}"
+
+def timed(fn: Callable[[], None], warmup: int, steps: int) -> tuple[float, float, float]:
+    # returns (steady seconds per call, warm-up seconds, peak MB); warmup >= 2 so the JIT is captured
+    dev = Device[Device.DEFAULT]
+    mem_start, peak = GlobalCounters.mem_used, GlobalCounters.mem_used
+    start = time.perf_counter()
+    for _ in range(max(2, warmup)):
+        fn()
+        peak = max(peak, GlobalCounters.mem_used)
+    dev.synchronize()
+    jit_s = time.perf_counter() - start
+    start = time.perf_counter()
+    for _ in range(steps):
+        fn()
+        peak = max(peak, GlobalCounters.mem_used)
+    dev.synchronize()
+    return (time.perf_counter() - start) / steps, jit_s, (peak - mem_start) / 1e6
+
+def batch(B: int) -> tuple[Tensor, Tensor]:
+    return Tensor.randint(B, 1, 28, 28, high=256).cast("uint8").realize(), Tensor.randint(B, high=10).cast("uint8").realize()
+
+def bench_train(type: models.Type, cfg: HPConfig, warmup: int, steps: int) -> tuple[float, float, float]:
+    model, _ = build_model(type, cfg)
+    opt = cfg.opt(nn.state.get_parameters(model))
+    opt.lr = Tensor(cfg.lr).contiguous().realize()
+    amp = mixed_precision(model, opt, cfg.precision)
+    ring = MetricsRing(cfg.sync_every, 2 if amp is None else 3)
+    X, Y = batch(cfg.batch_size)
+
+    @TinyJit
+    @Tensor.train()
+    def train_step(X: Tensor, Y: Tensor, slot: UOp) -> Tensor: return make_step(model, opt, ring, amp=amp)(X, Y, slot)
+
+    def run():
+        if ring.full(): ring.drain()  # same host sync cadence as train_model
+        train_step(X, Y, ring.next_slot())
+    return timed(run, warmup, steps)
+
+def bench_eval(type: models.Type, cfg: HPConfig, warmup: int, steps: int) -> tuple[float, float, float]:
+    model, _ = build_model(type, cfg)
+    X, Y = batch(cfg.batch_size)
+    evaluator = Evaluator(model, X, Y, chunk=cfg.batch_size)
+    return timed(lambda: evaluator.eval_chunk(X, Y), warmup, steps)
+
+def bench_augment(cfg: HPConfig, warmup: int, steps: int) -> tuple[float, float, float]:
+    X, _ = batch(cfg.batch_size)
+
+    @TinyJit
+    def augment(X: Tensor) -> Tensor:
+        return affine_transform(X, random_affine(cfg.batch_size, cfg.angle, cfg.scale, cfg.shift), cfg.sampling).realize()
+    return timed(lambda: augment(X), warmup, steps)
+
+def backends(requested: str) -> list[str]:
+    names = [b.strip().upper() for b in requested.split(",")] if requested else list(Device.get_available_devices())
+    usable = []
+    for name in names:
+        # listed is not enough, the compiler may still be missing
+        try:
+            (Tensor.ones(4, device=name) + 1).realize().numpy()
+            usable.append(name)
+        except Exception as e:
+            print(f"skipping {name}: {type(e).__name__}: {e}", file=sys.stderr)
+    return usable
+
+def compare(results: list[BenchResult], baseline_path: Path, threshold: float) -> list[str]:
+    baseline = {BenchResult(**r).key(): BenchResult(**r) for r in json.loads(baseline_path.read_text())["results"]}
+    regressions = []
+    for r in results:
+        if (b := baseline.get(r.key())) is None: continue
+        change = r.samples_per_s / b.samples_per_s - 1
+        if change < -threshold: regressions.append(f"{r.key()}: {b.samples_per_s:.0f} -> {r.samples_per_s:.0f} samples/s ({change * 100:+.1f}%)")
+    return regressions
+
+if __name__ == "__main__":
+    TYPES = [models.Type[t.strip().upper()] for t in getenv("TYPES", "mlp,conv").split(",")]
+    BATCHES = [int(b) for b in getenv("BATCHES", "64,128,256").split(",")]
+    WIDTHS = [int(w) for w in getenv("WIDTHS", "512,1024").split(",")]
+    DEPTHS = [int(d) for d in getenv("DEPTHS", "2,3").split(",")]
+    PHASES = [p.strip() for p in getenv("PHASES", "train,eval,augment").split(",")]
+    PRECISIONS = [p.strip() for p in getenv("PRECISIONS", "fp32").split(",")]  # training step only
+    BACKENDS = getenv("BACKENDS", "")
+    WARMUP = int(getenv("WARMUP", 3))
+    STEPS = int(getenv("STEPS", 20))
+    SAMPLING = SamplingMod(getenv("SAMPLING", SamplingMod.NEAREST.value))
+
+    OUT = Path(getenv("OUT", "bench/latest.json"))
+    BASELINE = Path(getenv("BASELINE", "bench/baseline.json"))
+    THRESHOLD = float(getenv("THRESHOLD", 0.1))     # allowed samples/s drop before failing
+    UPDATE_BASELINE = getenv("UPDATE_BASELINE", 0)
+
+    results: list[BenchResult] = []
+    default_device = Device.DEFAULT
+    for backend in backends(BACKENDS):
+        Device.DEFAULT = backend
+        for B in BATCHES:
+            cfg = HPConfig(batch_size=B, sampling=SAMPLING)
+            runs = []
+            for type in TYPES:
+                shapes = [(w, d) for w in WIDTHS for d in DEPTHS] if type == models.Type.MLP else [(None, None)]
+                for width, depth in shapes:
+                    model_cfg = replace(cfg, width=width, depth=depth) if width is not None else cfg
+                    if "train" in PHASES:
+                        for p in PRECISIONS:
+                            runs.append(("train", type.name.lower(), width, depth, p, lambda type=type, c=replace(model_cfg, precision=p): bench_train(type, c, WARMUP, STEPS)))
+                    if "eval" in PHASES: runs.append(("eval", type.name.lower(), width, depth, "fp32", lambda type=type, c=model_cfg: bench_eval(type, c, WARMUP, STEPS)))
+            if "augment" in PHASES: runs.append(("augment", SAMPLING.name.lower(), None, None, "fp32", lambda c=cfg: bench_augment(c, WARMUP, STEPS)))
+
+            for phase, name, width, depth, precision, run in runs:
+                step_s, jit_s, mem_mb = run()
+                r = BenchResult(phase, name, backend, B, width, depth, 1 / step_s, B / step_s, jit_s, mem_mb, precision)
+                results.append(r)
+                print(f"{r.key():40s} {r.steps_per_s:8.1f} steps/s {r.samples_per_s:10.0f} samples/s  jit {r.jit_s:6.2f}s  mem {r.mem_mb:7.1f} MB", flush=True)
+    Device.DEFAULT = default_device
+
+    OUT.parent.mkdir(parents=True, exist_ok=True)
+    report = dict(meta=dict(time=time.strftime("%Y-%m-%d %H:%M:%S"), machine=platform.machine(), python=platform.python_version(),
+                            warmup=WARMUP, steps=STEPS), results=[asdict(r) for r in results])
+    OUT.write_text(json.dumps(report, indent=2))
+
+    if UPDATE_BASELINE or not BASELINE.exists():
+        BASELINE.parent.mkdir(parents=True, exist_ok=True)
+        BASELINE.write_text(json.dumps(report, indent=2))
+        print(f"baseline written to {BASELINE}")
+    elif regressions := compare(results, BASELINE, THRESHOLD):
+        print(f"{len(regressions)} regression(s) over {THRESHOLD * 100:.0f}% against {BASELINE}:")
+        for line in regressions: print("  " + line)
+        sys.exit(1)
+    else:
+        print(f"no regression over {THRESHOLD * 100:.0f}% against {BASELINE}")
@@ -0,0 +1,83 @@
+#! /usr/bin/env python3
+# vim:fenc=utf-8
+#
+# Copyright (C) 2025 Stanley Arnaud <stantonik@stantonik-mba.local>
+#
+# Distributed under terms of the MIT license.
+
+from pathlib import Path
+from typing import Optional
+import json
+import os
+import threading
+import time
+import numpy as np
+from tinygrad import Tensor
+from tinygrad.nn.state import get_state_dict, inverse_safe_dtypes, safe_load, safe_load_metadata, safe_save
+
+def run_id() -> str: return f"{time.strftime('%Y%m%d-%H%M%S')}-{os.getpid()}"
+
+def write_safetensors(path: Path, arrays: dict[str, tuple[str, np.ndarray]]):
+    # plain numpy writer, safe to call from a background thread (tinygrad is not thread safe)
+    headers, offset = {}, 0
+    for k, (dtype, a) in arrays.items():
+        headers[k] = {"dtype": dtype, "shape": list(a.shape), "data_offsets": [offset, offset + a.nbytes]}
+        offset += a.nbytes
+    j = json.dumps(headers, separators=(",", ":"))
+    j += " " * (-len(j) % 8)
+    tmp = path.with_suffix(f".{os.getpid()}.tmp")
+    with open(tmp, "wb") as f:
+        f.write(np.array([len(j)], dtype="<u8").tobytes() + j.encode("utf-8"))
+        for _, a in arrays.values(): f.write(np.ascontiguousarray(a).tobytes())
+    tmp.replace(path)
+
+# Keeps the best state dict in memory: snapshot() copies the weights into preallocated buffers
+# and restore() assigns them back in place, so the JIT keeps using the same parameter buffers.
+# Without a path nothing is written, the best weights only live for the run
+class Checkpoint:
+    def __init__(self, model, path: Optional[Path] = None, device: Optional[str] = None, flush_secs: float = 0.0):
+        self.path, self.flush_secs = None if path is None else Path(path), flush_secs
+        self.state = get_state_dict(model)
+        self.best = {k: Tensor.zeros(*v.shape, dtype=v.dtype, device=device or v.device).contiguous().realize() for k, v in self.state.items()}
+        self.saved, self.dirty, self.last_flush = False, False, time.time()
+        self.writer: Optional[threading.Thread] = None
+
+    def snapshot(self):
+        Tensor.realize(*[self.best[k].assign(v.to(self.best[k].device)) for k, v in self.state.items()])
+        self.saved = self.dirty = True
+        if self.flush_secs > 0 and time.time() - self.last_flush >= self.flush_secs: self.flush(background=True)
+
+    def restore(self) -> bool:
+        if not self.saved: return False
+        Tensor.realize(*[v.assign(self.best[k].to(v.device)) for k, v in self.state.items()])
+        return True
+
+    def flush(self, background=False):
+        if not self.dirty or self.path is None: return
+        if self.writer is not None: self.writer.join()
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        arrays = {k: (inverse_safe_dtypes[v.dtype], v.numpy()) for k, v in self.best.items()}
+        self.dirty, self.last_flush = False, time.time()
+        if background:
+            self.writer = threading.Thread(target=write_safetensors, args=(self.path, arrays), daemon=True)
+            self.writer.start()
+        else:
+            write_safetensors(self.path, arrays)
+
+    def close(self):
+        self.flush()
+        if self.writer is not None: self.writer.join()
+
+# Full training state (weights, optimizer moments, lr, ...) between the rungs of a halving sweep: save_state()
+# writes the tensors with their host side counters as metadata, load_state() assigns them back in place
+def save_state(path: Path, tensors: dict[str, Tensor], meta: dict):
+    path = Path(path)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp = path.with_suffix(f".{os.getpid()}.tmp")
+    safe_save(tensors, str(tmp), metadata={k: json.dumps(v) for k, v in meta.items()})
+    tmp.replace(path)
+
+def load_state(path: Path, tensors: dict[str, Tensor]) -> dict:
+    loaded = safe_load(str(path))
+    Tensor.realize(*[v.assign(loaded[k].to(v.device).cast(v.dtype)) for k, v in tensors.items()])
+    return {k: json.loads(v) for k, v in safe_load_metadata(str(path))[2].get("__metadata__", {}).items()}
@@ -0,0 +1,51 @@
+#! /usr/bin/env python3
+# vim:fenc=utf-8
+#
+# Copyright (C) 2025 Stanley Arnaud <stantonik@stantonik-mba.local>
+#
+# Distributed under terms of the MIT license.
+
+from pathlib import Path
+from typing import Optional
+import os
+import numpy as np
+from tinygrad import Tensor
+from tinygrad.device import Device
+from tinygrad.dtype import DType
+from tinygrad.helpers import getenv
+from tinygrad.nn import datasets
+
+# Decoded MNIST is kept on disk as raw uint8 files, one per split, so every process
+# (sweep workers included) can memory-map it instead of decoding the gzipped IDX files again
+CACHE_DIR = Path(getenv("MNIST_CACHE", str(Path.home() / ".cache" / "mnist")))
+SPLITS = { "X_train": (1, 28, 28), "Y_train": (), "X_test": (1, 28, 28), "Y_test": () }
+
+_memo: dict[tuple[str, Optional[DType]], tuple[Tensor, Tensor, Tensor, Tensor]] = {}
+
+def _path(split: str) -> Path: return CACHE_DIR / f"{split}.u8"
+
+def prepare():
+    if all(_path(split).exists() for split in SPLITS): return
+    CACHE_DIR.mkdir(parents=True, exist_ok=True)
+    for split, t in zip(SPLITS, datasets.mnist()):
+        tmp = _path(split).with_suffix(f".{os.getpid()}.tmp")
+        t.numpy().astype(np.uint8).tofile(tmp)
+        tmp.replace(_path(split))  # atomic, concurrent writers end up with the same file
+
+def mnist_arrays() -> tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray]:
+    # zero-copy read-only views, for host side consumers
+    prepare()
+    return tuple(np.memmap(_path(split), dtype=np.uint8, mode="r").reshape(-1, *shape) for split, shape in SPLITS.items())
+
+def mnist(device: Optional[str] = None, dtype: Optional[DType] = None) -> tuple[Tensor, Tensor, Tensor, Tensor]:
+    # process-wide memo; `dtype` only applies to the images, labels stay uint8
+    key = (Device.canonicalize(device), dtype)
+    if key not in _memo:
+        prepare()
+        tensors = []
+        for split, shape in SPLITS.items():
+            t = Tensor(_path(split)).reshape(-1, *shape).to(key[0])
+            if dtype is not None and split.startswith("X"): t = t.cast(dtype)
+            tensors.append(t.realize())
+        _memo[key] = tuple(tensors)
+    return _memo[key]
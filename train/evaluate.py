@@ -0,0 +1,69 @@
+#! /usr/bin/env python3
+# vim:fenc=utf-8
+#
+# Copyright (C) 2025 Stanley Arnaud <stantonik@stantonik-mba.local>
+#
+# Distributed under terms of the MIT license.
+
+from typing import Callable
+import numpy as np
+from tinygrad import Tensor, TinyJit, dtypes
+from utils import normalize
+
+PAD_LABEL = 255  # out of range label, one-hot is all zeros so padded rows add no loss and never match
+
+class Evaluator:
+    def __init__(self, model: Callable[[Tensor], Tensor], X_test: Tensor, Y_test: Tensor, chunk: int = 1000, samples: int = 0, seed: int = 0):
+        self.chunk = chunk
+
+        # fixed shape chunks so a single JIT serves every evaluation, peak memory stays at one chunk
+        @TinyJit
+        def eval_chunk(X: Tensor, Y: Tensor) -> tuple[Tensor, Tensor]:
+            out = model(normalize(X))
+            return out.sparse_categorical_crossentropy(Y, ignore_index=PAD_LABEL, reduction="sum"), (out.argmax(axis=1) == Y).sum()
+        self.eval_chunk = eval_chunk
+
+        labels = Y_test.numpy()
+        self.full_set = self._chunks(X_test, Y_test, np.arange(len(labels)))
+
+        # rotating stratified subsets: every class is split evenly across the folds
+        self.folds = []
+        if 0 < samples < len(labels):
+            rng = np.random.default_rng(seed)
+            n_folds = len(labels) // samples
+            class_splits = [np.array_split(rng.permutation(np.flatnonzero(labels == c)), n_folds) for c in np.unique(labels)]
+            self.folds = [self._chunks(X_test, Y_test, np.sort(np.concatenate([s[f] for s in class_splits]))) for f in range(n_folds)]
+        self.next_fold = 0
+
+    @property
+    def sampled(self) -> bool: return len(self.folds) > 0
+
+    def _chunks(self, X: Tensor, Y: Tensor, idx: np.ndarray) -> list[tuple[Tensor, Tensor, int]]:
+        chunks = []
+        for start in range(0, len(idx), self.chunk):
+            part = idx[start:start + self.chunk]
+            sel = Tensor(part.astype(np.int32), device=X.device)
+            Xc, Yc = X[sel], Y[sel]
+            if (pad := self.chunk - len(part)) > 0:
+                # Tensor.zeros/full, not Xc.zeros: tinygrad's op wrapper turns them into bound methods
+                Xc = Xc.cat(Tensor.zeros(pad, *Xc.shape[1:], dtype=Xc.dtype, device=Xc.device))
+                Yc = Yc.cat(Tensor.full((pad,), PAD_LABEL, dtype=Yc.dtype, device=Yc.device))
+            chunks.append((Xc.contiguous().realize(), Yc.contiguous().realize(), len(part)))
+        return chunks
+
+    def _run(self, chunks: list[tuple[Tensor, Tensor, int]]) -> tuple[float, float]:
+        # real buffers: 0 + loss would fold to the JIT's output buffer, which the next chunk overwrites
+        loss_sum, correct = Tensor(0.0).contiguous().realize(), Tensor(0, dtype=dtypes.int).contiguous().realize()
+        for X, Y, _ in chunks:
+            loss, acc = self.eval_chunk(X, Y)
+            loss_sum, correct = (loss_sum + loss).realize(), (correct + acc).realize()  # accumulate on device, no sync
+        n = sum(n for *_, n in chunks)
+        return loss_sum.item() / n, correct.item() * 100 / n
+
+    def full(self) -> tuple[float, float]: return self._run(self.full_set)
+
+    def sample(self) -> tuple[float, float]:
+        if not self.sampled: return self.full()
+        fold = self.folds[self.next_fold]
+        self.next_fold = (self.next_fold + 1) % len(self.folds)
+        return self._run(fold)
@@ -7,6 +7,7 @@ from typing import Tuple, Dict, List, Optional
 from tinygrad.dtype import DType
 from tinygrad.renderer import ProgramSpec
 from tinygrad.tensor import Device, Tensor
+from tinygrad import Variable
 from tinygrad.engine.jit import TinyJit
 from tinygrad.nn.state import get_state_dict
 from tinygrad.helpers import Context, to_mv
@@ -14,6 +15,7 @@ from tinygrad.dtype import dtypes
 from tinygrad.uop.ops import Ops
 import json
 from collections import OrderedDict
+from profiler import profiler
 
 EXPORT_SUPPORTED_DEVICE = ["WEBGPU", "CPU", "CUDA", "CL"]
 
@@ -34,10 +36,51 @@ def compile_net(run:TinyJit, special_names:Dict[int,str]) -> Tuple[Dict[str,str]
           if i > 0: bufs_to_save[bufs[key][0]] = arg   # if first usage of a buffer is not an output, and it's not a special name
       cargs.append(bufs[key][0])
     cargs += [var for var in fxn.vars if getattr(var, "op", None) is Ops.DEFINE_VAR] # symbolic vars; is it necessary or sufficient to check for DEFINE_VAR?
-    statements.append((fxn.function_name, cargs, fxn.global_size, fxn.local_size))
+    # copies, export rewrites symbolic dims and the program is shared with the kernel cache
+    statements.append((fxn.function_name, cargs, list(fxn.global_size) if fxn.global_size else fxn.global_size, fxn.local_size))
 
   return functions, statements, {name:(size, dtype, key) for (name,size,dtype,key) in bufs.values()}, bufs_to_save
 
+def prune_net(functions, statements, bufs, bufs_to_save, output_prefix="output"):
+  # weights with the same dtype and bytes are stored once
+  rename, seen = {}, {}
+  for name, buf in list(bufs_to_save.items()):
+    key = (buf.dtype, bytes(buf.as_buffer()))
+    if key in seen: rename[name] = seen[key]
+    else: seen[key] = name
+  statements = [(fxn, [rename.get(a, a) if isinstance(a, str) else a for a in args], gs, ls) for fxn, args, gs, ls in statements]
+
+  # walking back from the outputs, a kernel is live if something live reads what it writes (its first buffer)
+  live, kept = {name for name in bufs if name.startswith(output_prefix)}, []
+  for statement in reversed(statements):
+    if statement[1][0] in live:
+      live.update(a for a in statement[1] if isinstance(a, str))
+      kept.append(statement)
+  statements = kept[::-1]
+
+  used = {a for _, args, _, _ in statements for a in args if isinstance(a, str)}
+  return ({name: src for name, src in functions.items() if any(fxn == name for fxn, *_ in statements)}, statements,
+          {name: v for name, v in bufs.items() if name in used}, {name: v for name, v in bufs_to_save.items() if name in used})
+
+def batch_input(max_batch:int, *shape:int, name="batch") -> Tensor:
+  # an input whose leading dimension is the symbolic `name` in [1, max_batch]: buffers are sized for max_batch and
+  # the exported program takes the actual batch as an extra argument (a uniform in WebGPU, an int in C)
+  return Tensor.randn(max_batch, *shape).realize()[:Variable(name, 1, max_batch).bind(1)]
+
+def render_js(x) -> str:
+  # symbolic dispatch sizes as JS expressions of the symbolic inputs, which the generated run() gets as `_name` arrays
+  if isinstance(x, int): return str(x)
+  if x.op is Ops.CONST: return str(x.arg)
+  if x.op is Ops.DEFINE_VAR: return f"_{x.arg[0]}[0]"
+  if x.op is Ops.BIND: return render_js(x.src[0])
+  a, b = (render_js(s) for s in x.src[:2])
+  if x.op is Ops.ADD: return f"({a} + {b})"
+  if x.op is Ops.MUL: return f"({a} * {b})"
+  if x.op is Ops.IDIV: return f"Math.floor({a} / {b})"
+  if x.op is Ops.MOD: return f"({a} % {b})"
+  if x.op is Ops.MAX: return f"Math.max({a}, {b})"
+  raise NotImplementedError(f"can't render {x.op} in a dispatch size")
+
 def jit_model(model, *args) -> Tuple[TinyJit,Dict[int,str]]:
   assert hasattr(model, "forward") or callable(model), "model needs a forward function"
   @TinyJit
@@ -48,7 +91,8 @@ def jit_model(model, *args) -> Tuple[TinyJit,Dict[int,str]]:
     return [o.realize() for o in out]
 
   # twice to run the JIT
-  for _ in range(2): the_output = run(*args)
+  with profiler.phase("export.jit"), profiler.tag("export"):
+    for _ in range(2): the_output = run(*args)
   special_names = {}
 
   # hack to put the inputs back
@@ -76,8 +120,10 @@ def export_model_clang(functions:Dict[str,str], statements:Dict[str,Tuple[str,in
     for name,cl in bufs_to_save.items():
       weight = ''.join(["\\x%02X"%x for x in bytes(to_mv(cl._buf.va_addr, cl._buf.size))])
       cprog.append(f"unsigned char {name}_data[] = \"{weight}\";")
-    cprog += [f"{dtype_map[dtype]} {name}[{len}];" if name not in bufs_to_save else f"{dtype_map[dtype]} *{name} = ({dtype_map[dtype]} *){name}_data;" for name,(len,dtype,_key) in bufs.items() if name not in input_names+output_names]
-    cprog += [f"void net({forward_args}) {{"] + [f"{name}({', '.join(args)}, {thread_id});" for (name, args, _global_size, _local_size) in statements] + ["}"]
+    cprog += [f"{dtype_map[dtype]} {name}[{len}];" if name not in bufs_to_save else f"{dtype_map[dtype]} *{name} = ({dtype_map[dtype]} *){name}_data;" for name,(len,dtype,_key) in bufs.items() if name not in input_names+output_names+list(symbolic_vars.values())]
+    # kernels from older tinygrad versions take a trailing core id
+    core_id = lambda name: f", {thread_id}" if 'core_id' in functions[name].split('{', 1)[0] else ""
+    cprog += [f"void net({forward_args}) {{"] + [f"{name}({', '.join(args)}{core_id(name)});" for (name, args, _global_size, _local_size) in statements] + ["}"]
     return '\n'.join(headers + cprog)
   else:
     if bufs_to_save:
@@ -114,14 +160,132 @@ const {model_name}_name_to_id = Object.fromEntries(weightNames.map((name, index)
 
     return '\n'.join(headers + cprog), js_wrapper
 
+def export_model_native(functions:Dict[str,str], statements:Dict[str,Tuple[str,int,int]], bufs:Dict[str,Tuple[str,int,int]],
+  bufs_to_save:Dict[str,Tensor], input_names:List[str], output_names:List[str], batch_size, symbolic_vars={}, align=64) -> Tuple[str,bytes]:
+  # shared library source plus a side-car weight blob: net_init() mmaps the blob and points the weight
+  # buffers into it, net() runs any number of samples through the batch_size kernels. With a symbolic
+  # batch (see batch_input) the kernels take the chunk size, otherwise the last chunk is zero padded
+  symbolic = not isinstance(batch_size, int)
+  batch_var, batch_size = (batch_size.unbind()[0].expr, batch_size.vmax) if symbolic else (None, batch_size)
+  assert list(symbolic_vars.values()) == ([batch_var] if symbolic else []), "native export supports the batch as its only symbolic var"
+  dtype_map = {dtypes.int: "int", dtypes.float: "float", dtypes.uchar: "unsigned char", dtypes.char: "signed char", dtypes.half: "__fp16", dtypes.uint: "unsigned int"}
+  assert len(input_names) == 1 and len(output_names) == 1, "native export expects a single input and output"
+  (inp, out) = input_names[0], output_names[0]
+  in_size, out_size = bufs[inp][0] // bufs[inp][1].itemsize // batch_size, bufs[out][0] // bufs[out][1].itemsize // batch_size  # elements per sample
+
+  blob, offsets = bytearray(), {}
+  for name, buf in bufs_to_save.items():
+    blob += b"\0" * (-len(blob) % align)
+    offsets[name] = len(blob)
+    blob += bytes(buf.as_buffer())
+
+  cprog = ["#include <stddef.h>", "#include <string.h>", "#include <fcntl.h>", "#include <unistd.h>", "#include <sys/mman.h>", "#include <sys/stat.h>", "#include <tgmath.h>"]
+  cprog += list(functions.values())
+  cprog += [f"static {dtype_map[dtype]} {name}[{size // dtype.itemsize}] __attribute__((aligned({align})));" for name, (size, dtype, _) in bufs.items() if name not in bufs_to_save and name != batch_var]
+  cprog += [f"static {dtype_map[bufs[name][1]]} *{name};" for name in bufs_to_save]
+  cprog += ["static void *blob; static size_t blob_size;"]
+  cprog += ["int net_init(const char *path) {",
+            "  int fd = open(path, O_RDONLY); struct stat st;",
+            "  if (fd < 0 || fstat(fd, &st) != 0) return -1;",
+            f"  if ((size_t)st.st_size != {len(blob)}) {{ close(fd); return -2; }}",
+            "  blob_size = st.st_size;",
+            "  blob = mmap(NULL, blob_size, PROT_READ, MAP_PRIVATE, fd, 0); close(fd);",
+            "  if (blob == MAP_FAILED) { blob = NULL; return -3; }"]
+  cprog += [f"  {name} = ({dtype_map[bufs[name][1]]} *)((char *)blob + {off});" for name, off in offsets.items()]
+  cprog += ["  return 0;", "}",
+            "void net_free(void) { if (blob) munmap(blob, blob_size); blob = NULL; }",
+            f"int net_batch_size(void) {{ return {batch_size}; }}"]
+  # kernels from older tinygrad versions take a trailing core id
+  calls = [f"    {name}({', '.join(args)}{', 0' if 'core_id' in functions[name].split('{', 1)[0] else ''});" for (name, args, _global_size, _local_size) in statements]
+  in_t, out_t = dtype_map[bufs[inp][1]], dtype_map[bufs[out][1]]
+  cprog += [f"void net(const {in_t} *input, {out_t} *output, int n) {{",
+            f"  for (int i = 0; i < n; i += {batch_size}) {{",
+            f"    int b = n - i < {batch_size} ? n - i : {batch_size};",
+            f"    memcpy({inp}, input + (size_t)i * {in_size}, (size_t)b * {in_size} * sizeof({in_t}));"]
+  if symbolic: cprog += [f"    const int {batch_var} = b;"]
+  else: cprog += [f"    if (b < {batch_size}) memset({inp} + (size_t)b * {in_size}, 0, (size_t)({batch_size} - b) * {in_size} * sizeof({in_t}));"]
+  cprog += calls
+  cprog += [f"    memcpy(output + (size_t)i * {out_size}, {out}, (size_t)b * {out_size} * sizeof({out_t}));", "  }", "}"]
+  return '\n'.join(cprog), bytes(blob)
+
 def dtype_to_js_type(dtype: DType) -> str:
   return f"{'Uint' if dtype in dtypes.uints else 'Int' if (dtype in dtypes.sints or dtype == dtypes.bool) else 'Float'}{8*dtype.itemsize}Array"
 
+# streamed weights: the safetensors header comes from a first range request, then setupNet creates the buffers and
+# compiles the pipelines while the tensors arrive as coalesced ranges, each uploaded as soon as its range lands.
+# The returned net waits for the remaining weights on its first call; net.timings has the breakdown in ms.
+# `bytes` skips the network for a file already at hand (a cache), with `keepBytes` net.weightsReady resolves
+# to the whole file assembled from the ranges so the caller can store it
+WEBGPU_STREAM_LOADER = """
+const fetchRange = async (url, start, end) => {
+  const res = await fetch(url, { headers: { Range: `bytes=${start}-${end - 1}` } });
+  if (!res.ok) throw new Error(`fetching ${url} failed with ${res.status}`);
+  // a server without range support answers 200 with the whole file
+  return { whole: res.status !== 206, bytes: new Uint8Array(await res.arrayBuffer()) };
+};
+
+const uploadWeight = (device, buf, bytes) => {
+  if (bytes.byteLength % 4) { const padded = new Uint8Array(Math.ceil(bytes.byteLength / 4) * 4); padded.set(bytes); bytes = padded; }
+  device.queue.writeBuffer(buf, 0, bytes);
+};
+
+const load = async (device, weight_path, { chunkSize = 1 << 20, concurrency = 4, headerGuess = 1 << 16, bytes = null, keepBytes = false } = {}) => {
+  const start = performance.now(), timings = {};
+  let { whole, bytes: head } = bytes ? { whole: true, bytes } : await fetchRange(weight_path, 0, headerGuess);
+  const headerEnd = 8 + Number(new DataView(head.buffer, head.byteOffset).getBigUint64(0, true));
+  if (!whole && head.byteLength < headerEnd) head = (await fetchRange(weight_path, 0, headerEnd)).bytes;
+  const metadata = getTensorMetadata(head.slice(0, headerEnd));
+  timings.header = performance.now() - start;
+
+  const state_dict = Object.fromEntries(Object.entries(metadata).map(([name, v]) => [name, { ...v }]));
+  // setupNet creates the weight buffers (state_dict[name].bytes) before its first await
+  const netReady = setupNet(device, state_dict).then((net) => { timings.pipelines = performance.now() - start; return net; });
+
+  // tensors in file order, neighbours coalesced into ranges of up to chunkSize bytes
+  const chunks = [];
+  for (const [name, { data_offsets: [s, e] }] of Object.entries(metadata).sort((a, b) => a[1].data_offsets[0] - b[1].data_offsets[0])) {
+    const last = chunks[chunks.length - 1];
+    if (last && last.end === s && e - last.start <= chunkSize) { last.end = e; last.names.push(name); }
+    else chunks.push({ start: s, end: e, names: [name] });
+  }
+  const file = keepBytes && !whole ? new Uint8Array(Math.max(headerEnd, ...Object.values(metadata).map((v) => v.data_offsets[1]))) : null;
+  if (file) file.set(head.subarray(0, headerEnd));
+  const upload = (names, bytes, base) => {
+    for (const name of names) {
+      const [s, e] = metadata[name].data_offsets;
+      if (state_dict[name].bytes) uploadWeight(device, state_dict[name].bytes, bytes.subarray(s - base, e - base));
+    }
+  };
+  let next = 0;
+  const worker = async () => {
+    while (next < chunks.length) {
+      const chunk = chunks[next++];
+      const { whole, bytes } = await fetchRange(weight_path, chunk.start, chunk.end);
+      upload(chunk.names, bytes, whole ? 0 : chunk.start);
+      if (file) file.set(whole ? bytes.subarray(chunk.start, chunk.end) : bytes, chunk.start);
+    }
+  };
+  const weightsReady = (whole ? Promise.resolve(upload(Object.keys(metadata), head, 0)) : Promise.all(Array.from({ length: concurrency }, worker)))
+    .then(() => { timings.weights = performance.now() - start; return keepBytes ? (file || head) : null; });
+  Promise.all([netReady, weightsReady]).then(() => { timings.total = performance.now() - start; }, () => {});
+
+  const net = await netReady;
+  let pending = weightsReady;
+  const run = async (...inputs) => {
+    if (pending) { await pending; pending = null; }
+    return await net(...inputs);
+  };
+  Object.defineProperty(run, "callTimings", { get: () => net.callTimings });
+  // the uploads still in flight write into the weight buffers, they are destroyed once those settle
+  const destroy = () => weightsReady.then(net.destroy, net.destroy);
+  return Object.assign(run, { timings, weightsReady, destroy });
+};
+"""
+
 def export_model_webgpu(functions, statements, bufs, weight_names, input_names, output_names, model_name, symbolic_vars={}, stream_weights=False) -> Tuple[str,int,int]:
   kernel_code = '\n\n'.join([f"const {key} = `{code.replace(key, 'main')}`;" for key, code in functions.items()])
   kernel_names = ', '.join([name for (name, _, _, _) in statements])
   input_names += list(symbolic_vars.values())
-  input_buffer_types = [dtype_to_js_type(bufs[inp_name][1]) for inp_name in input_names]
   output_buffer_types = [dtype_to_js_type(bufs[out_name][1]) for out_name in output_names]
 
   buf_type = lambda x: "uniform" if x in set(symbolic_vars.values()) else "storage"
@@ -132,22 +296,24 @@ def export_model_webgpu(functions, statements, bufs, weight_names, input_names,
     for _, (_, args, _, _) in enumerate(statements)
   ])
   layouts = f"const layouts=[{create_bind_group_layouts}]"
-  kernel_calls = '\n        '.join([f"addComputePass(device, commandEncoder, pipelines[{i}], layouts[{i}], infinityBuf, [{', '.join(args)}], [{', '.join(str(x) for x in global_size)}]);" for i, (_name, args, global_size, _local_size) in enumerate(statements) ])
+  # bind groups are built once in setupNet, every call only records the dispatches of a single compute pass
+  bind_groups = ',\n      '.join([f"createBindGroup(device, layouts[{i}], infinityBuf, [{', '.join(args)}])" for i, (_name, args, _global_size, _local_size) in enumerate(statements)])
+  kernel_calls = '\n        '.join([f"passEncoder.setPipeline(pipelines[{i}]); passEncoder.setBindGroup(0, bindGroups[{i}]); passEncoder.dispatchWorkgroups({', '.join(str(x) for x in global_size)});" for i, (_name, args, global_size, _local_size) in enumerate(statements) ])
 
   buf_type = lambda x: "createUniformBuf" if x in set(uop.arg[0] for uop in symbolic_vars) else "createEmptyBuf"
   map_to_external_weight = lambda _key: f"state_dict['{weight_names[_key]}']" if stream_weights else f"getTensorBuffer(safetensor, metadata['{weight_names[_key]}'])"
   _bufs =  '\n    '.join([f"const {name} = " + (f"{buf_type(_key)}(device, {size});" if _key not in weight_names else f"createWeightBuf(device, {size}, {map_to_external_weight(_key)})") + ";"  for name,(size,dtype,_key) in bufs.items()])
-  gpu_write_bufs =  '\n    '.join([f"const gpuWriteBuffer{i} = device.createBuffer({{size:{input_name}.size, usage: GPUBufferUsage.COPY_SRC | GPUBufferUsage.MAP_WRITE }});" for i,input_name in enumerate(input_names)])
-  input_writers = '\n    '.join([f"await gpuWriteBuffer{i}.mapAsync(GPUMapMode.WRITE);\n        new {input_buffer_types[i]}(gpuWriteBuffer{i}.getMappedRange()).set(" + f'_{inp_name});' + f"\n        gpuWriteBuffer{i}.unmap();\n        commandEncoder.copyBufferToBuffer(gpuWriteBuffer{i}, 0, {inp_name}, 0, gpuWriteBuffer{i}.size);"  for i,inp_name in enumerate(input_names)])
+  input_writers = '\n        '.join([f"device.queue.writeBuffer({inp_name}, 0, _{inp_name});" for inp_name in input_names])
   gpu_read_bufs = '\n    '.join([f"const gpuReadBuffer{i} = device.createBuffer({{size:{output_name}.size, usage: GPUBufferUsage.COPY_DST | GPUBufferUsage.MAP_READ }});" for i,output_name in enumerate(output_names)])
   outbuf_copies = '\n        '.join([f"commandEncoder.copyBufferToBuffer({output_name}, 0, gpuReadBuffer{i}, 0, output{i}.size);" for i,output_name in enumerate(output_names)])
   output_readers = '\n        '.join([f"await gpuReadBuffer{i}.mapAsync(GPUMapMode.READ);\n        const resultBuffer{i} = new {output_buffer_types[i]}(gpuReadBuffer{i}.size/{bufs[output_names[i]][1].itemsize});\n        resultBuffer{i}.set(new {output_buffer_types[i]}(gpuReadBuffer{i}.getMappedRange()));\n        gpuReadBuffer{i}.unmap();" for i in range(len(output_names))])
+  all_bufs = ', '.join(["infinityBuf", *bufs.keys(), *[f"gpuReadBuffer{i}" for i in range(len(output_names))]])
   output_return = '[{}]'.format(",".join([f'resultBuffer{i}' for i in range(len(output_names))]))
   getTensorMetadata = f"""\nconst getTensorMetadata = (safetensorBuffer) => {{
     const metadataLength = Number(new DataView(safetensorBuffer.buffer).getBigUint64(0, true));
     const metadata = JSON.parse(new TextDecoder("utf8").decode(safetensorBuffer.subarray(8, 8 + metadataLength)));
     return Object.fromEntries(Object.entries(metadata).filter(([k, v]) => k !== "__metadata__").map(([k, v]) => [k, {{...v, data_offsets: v.data_offsets.map(x => 8 + metadataLength + x)}}]));
-}};\n""" if not stream_weights else ""
+}};\n"""
   return f"""
 const {model_name} = (() => {{
 const getTensorBuffer = (safetensorBuffer, tensorMetadata) => {{
@@ -175,25 +341,19 @@ const createInfinityUniformBuf = (device) => {{
 }};
 
 const createWeightBuf = (device, size, data) => {{
-  const buf = device.createBuffer({{ size, usage: GPUBufferUsage.STORAGE{" | GPUBufferUsage.COPY_DST" if stream_weights else ", mappedAtCreation: true"} }});
+  const buf = device.createBuffer({{ {"size: Math.ceil(size / 4) * 4" if stream_weights else "size"}, usage: GPUBufferUsage.STORAGE{" | GPUBufferUsage.COPY_DST" if stream_weights else ", mappedAtCreation: true"} }});
   {"data.bytes = buf;" if stream_weights else "new Uint8Array(buf.getMappedRange()).set(data); buf.unmap();"}
   return buf;
 }};
 
-const addComputePass = (device, commandEncoder, pipeline, layout, infinityUniformBuf, bufs, workgroup) => {{
-  const bindGroup = device.createBindGroup({{
+const createBindGroup = (device, layout, infinityUniformBuf, bufs) => {{
+  return device.createBindGroup({{
     layout: layout,
     entries: [
       {{ binding: 0, resource: {{ buffer: infinityUniformBuf }} }},
       ...bufs.map((buffer, index) => ({{ binding: index + 1, resource: {{ buffer }} }}))
     ]
   }});
-
-  const passEncoder = commandEncoder.beginComputePass();
-  passEncoder.setPipeline(pipeline);
-  passEncoder.setBindGroup(0, bindGroup);
-  passEncoder.dispatchWorkgroups(...workgroup);
-  passEncoder.end();
 }};
 
 {kernel_code}
@@ -206,10 +366,12 @@ const setupNet = async (device, {"state_dict" if stream_weights else "safetensor
 
     {_bufs}
 
-    {gpu_write_bufs}
-
     {gpu_read_bufs}
 
+    const bindGroups = [
+      {bind_groups}
+    ];
+
     const kernels = [{kernel_names}];
     const pipelines = await Promise.all(kernels.map(async (name, i) => {{
       return await device.createComputePipelineAsync({{
@@ -225,54 +387,75 @@ const setupNet = async (device, {"state_dict" if stream_weights else "safetensor
       }});
   }}))
 
-    return async ({",".join([f"_{input_name}" for input_name in input_names])}) => {{
-        const commandEncoder = device.createCommandEncoder();
+    // net.callTimings holds the last call's encode (uploads + recording), submit and readback (GPU work + map) in ms
+    const net = async ({",".join([f"_{input_name}" for input_name in input_names])}) => {{
+        const start = performance.now();
         {input_writers}
+        const commandEncoder = device.createCommandEncoder();
+        const passEncoder = commandEncoder.beginComputePass();
         {kernel_calls}
+        passEncoder.end();
         {outbuf_copies}
         const gpuCommands = commandEncoder.finish();
+        const encoded = performance.now();
         device.queue.submit([gpuCommands]);
+        const submitted = performance.now();
 
         {output_readers}
+        net.callTimings = {{ encode: encoded - start, submit: submitted - encoded, readback: performance.now() - submitted }};
         return {output_return};
-    }}
+    }};
+    // frees the GPU memory of the net (weights, intermediates, readback), it can not run afterwards
+    net.destroy = () => {{ for (const buf of [{all_bufs}]) buf.destroy(); }};
+    return net;
 }}
-const load = async (device, weight_path) => {{ return await fetch(weight_path).then(x => x.arrayBuffer()).then(x => setupNet(device, new Uint8Array(x))); }}
-return {{ load, setupNet }};
+{WEBGPU_STREAM_LOADER if stream_weights else "const load = async (device, weight_path) => { return await fetch(weight_path).then(x => x.arrayBuffer()).then(x => setupNet(device, new Uint8Array(x))); }"}
+return {{ load, setupNet, streamed: {"true" if stream_weights else "false"} }};
 }})();
 export default {model_name};
 """
 
-def export_model(model, target:str, *inputs, model_name: Optional[str] = "model", stream_weights=False):
+def export_model(model, target:str, *inputs, model_name: Optional[str] = "model", stream_weights=False, prune=True):
   assert Device.DEFAULT in EXPORT_SUPPORTED_DEVICE, f"only {', '.join(EXPORT_SUPPORTED_DEVICE)} are supported"
 
   # NOTE: CPU_COUNT=1, since export does not support threading
   with Context(JIT=2): run,special_names = jit_model(model, *inputs)
   functions, statements, bufs, bufs_to_save = compile_net(run, special_names)
+  if prune: functions, statements, bufs, bufs_to_save = prune_net(functions, statements, bufs, bufs_to_save)
   state = get_state_dict(model)
+  if prune:
+    # only what the program reads ends up in the weights file (no num_batches_tracked, no duplicates)
+    keys = {key for _, _, key in bufs.values()}
+    state = {name: x for name, x in state.items() if id(x.uop.base.realized) in keys}
   weight_names = {id(x.uop.base.realized): name for name, x in state.items()}
   input_names = [name for _,name in special_names.items() if "input" in name]
   output_names = [name for _,name in special_names.items() if "output" in name]
 
   # handle symbolic variables; TODO: refactor to fix some of this stuff upstream in tinygrad
+  # a var can show up as a kernel argument (C loops over it) or only in the dispatch size (GPU kernels index with it)
   symbolic_vars = OrderedDict()
+  def add_var(var):
+    if var not in symbolic_vars:
+      symbolic_vars[var] = var.arg[0]
+      bufs[symbolic_vars[var]] = (var.dtype.itemsize, var.dtype, symbolic_vars[var])
+    return symbolic_vars[var]
+  is_var = lambda x: getattr(x, "op", None) is Ops.DEFINE_VAR and isinstance(getattr(x, "arg", None), tuple) and isinstance(x.arg[0], str)
   for i, (_, args, global_size, _) in enumerate(statements):
     for j, var in enumerate(args):
-      if getattr(var, "op", None) is Ops.DEFINE_VAR and isinstance(getattr(var, "arg", None), tuple) and isinstance(var.arg[0], str):
-        if var not in symbolic_vars:
-          symbolic_vars[var] = var.arg[0]
-          bufs[symbolic_vars[var]] = (var.dtype.itemsize, var.dtype, symbolic_vars[var])
-        statements[i][1][j] = symbolic_vars[var]
+      if is_var(var): statements[i][1][j] = add_var(var)
 
     if global_size:
       for j, dim in enumerate(global_size):
-        if getattr(dim, "op", None) is Ops.ADD and len(dim.src) == 2 and {dim.src[0].op, dim.src[1].op} == {Ops.DEFINE_VAR, Ops.CONST}:
-          name, val = dim.src if dim.src[1].op is Ops.CONST else reversed(dim.src)
-          global_size[j] = f"_{name.arg[0]}[0] + {val.arg}"
+        if isinstance(dim, int): continue
+        for var in dim.toposort():
+          if is_var(var): add_var(var)
+        global_size[j] = render_js(dim)
 
   prg = ""
   if target == "clang":
-    prg = export_model_clang(functions, statements, bufs, bufs_to_save, input_names, output_names)
+    prg = export_model_clang(functions, statements, bufs, bufs_to_save, input_names, output_names, symbolic_vars=symbolic_vars)
+  elif target == "native":
+    return export_model_native(functions, statements, bufs, bufs_to_save, input_names, output_names, inputs[0].shape[0], symbolic_vars)
   elif target == "wasm":
     return export_model_clang(functions, statements, bufs, bufs_to_save, input_names, output_names, weight_names, model_name, symbolic_vars, wasm=True)
   elif target == "webgpu":
@@ -0,0 +1,110 @@
+#! /usr/bin/env python3
+# vim:fenc=utf-8
+#
+# Copyright (C) 2025 Stanley Arnaud <stantonik@stantonik-mba.local>
+#
+# Distributed under terms of the MIT license.
+
+from pathlib import Path
+from tinygrad import Tensor, nn
+from tinygrad.device import Device
+from tinygrad.helpers import Context, getenv
+from export_model import compile_net, jit_model, prune_net
+from predict import load_model
+from dataset import mnist
+from utils import normalize
+import models
+import numpy as np
+
+# per-channel ops that commute with a positive per-channel affine map, a BatchNorm can be moved across them
+POOLS = (Tensor.max_pool2d,)
+
+def bn_affine(bn: nn.BatchNorm) -> tuple[Tensor, Tensor]:
+    # inference mode BatchNorm is y = a * x + b per channel
+    a = bn.weight * (bn.running_var + bn.eps).rsqrt() if bn.weight is not None else (bn.running_var + bn.eps).rsqrt()
+    b = (bn.bias if bn.bias is not None else 0) - bn.running_mean * a
+    return a, b
+
+def fold_backward(layer, a: Tensor, b: Tensor):
+    # layer -> BN: scale the output channels
+    shape = (-1,) + (1,) * (layer.weight.ndim - 1)
+    bias = layer.bias if layer.bias is not None else Tensor.zeros(layer.weight.shape[0])
+    layer.weight.replace((layer.weight * a.reshape(shape)).contiguous().realize())
+    layer.bias = (bias * a + b).contiguous().realize()
+
+def fold_forward(layer, a: Tensor, b: Tensor, spatial: int = 1):
+    # BN -> (pool / flatten) -> layer: scale the input channels, the shift goes into the bias.
+    # spatial is how many flattened positions each channel covers in front of a Linear
+    w = layer.weight
+    bias = layer.bias if layer.bias is not None else Tensor.zeros(w.shape[0])
+    if isinstance(layer, nn.Conv2d):
+        a_in, b_in = a.reshape(1, -1, 1, 1), b.reshape(1, -1, 1, 1)
+        layer.bias = (bias + (w * b_in).sum((1, 2, 3))).contiguous().realize()
+    else:
+        a_in, b_in = a.repeat_interleave(spatial).reshape(1, -1), b.repeat_interleave(spatial).reshape(1, -1)
+        layer.bias = (bias + (w * b_in).sum(1)).contiguous().realize()
+    w.replace((w * a_in).contiguous().realize())
+
+def fold_batchnorm(model) -> list[str]:
+    # folds every inference mode BatchNorm of a sequential model into a neighbouring Linear / Conv2d:
+    # into the previous one when it directly follows it, else into the next one across max pools
+    # (only if every scale is positive, max(a * x) = a * max(x) needs a > 0) and a flatten;
+    # a padded conv would see the shift on its zero padding, so that case is left alone
+    layers, notes, i, removed = model.layers, [], 0, 0
+    while i < len(layers):
+        bn = layers[i]
+        if not isinstance(bn, nn.BatchNorm):
+            i += 1
+            continue
+        a, b = bn_affine(bn)
+        prev = layers[i - 1] if i > 0 else None
+        if isinstance(prev, (nn.Linear, nn.Conv2d)):
+            fold_backward(prev, a, b)
+            notes.append(f"layers.{i + removed} folded into layers.{i + removed - 1}")
+            del layers[i]
+            removed += 1
+            continue
+
+        j, pooled, spatial = i + 1, False, 1
+        while j < len(layers) and (layers[j] in POOLS or layers[j] is models.flatten):
+            pooled |= layers[j] in POOLS
+            j += 1
+        nxt = layers[j] if j < len(layers) else None
+        if isinstance(nxt, nn.Linear): spatial = nxt.weight.shape[1] // a.shape[0]
+        padded = isinstance(nxt, nn.Conv2d) and any(p != 0 for p in (nxt.padding if isinstance(nxt.padding, (tuple, list)) else (nxt.padding,)))
+        if nxt is None or not isinstance(nxt, (nn.Linear, nn.Conv2d)) or padded:
+            notes.append(f"layers.{i + removed} kept, no foldable neighbour")
+        elif pooled and (a <= 0).any().item():
+            notes.append(f"layers.{i + removed} kept, non-positive scales before a max pool")
+        else:
+            fold_forward(nxt, a, b, spatial)
+            notes.append(f"layers.{i + removed} folded into layers.{j + removed}")
+            del layers[i]
+            removed += 1
+            continue
+        i += 1
+    return notes
+
+def net_stats(model, prune: bool) -> dict:
+    # kernel, dispatch and buffer counts of the program export_model would emit for this model
+    with Context(JIT=2): run, special_names = jit_model(model, Tensor.randn(1, 1, 28, 28))
+    functions, statements, bufs, bufs_to_save = compile_net(run, special_names)
+    if prune: functions, statements, bufs, bufs_to_save = prune_net(functions, statements, bufs, bufs_to_save)
+    return dict(kernels=len(functions), dispatches=len(statements), buffers=len(bufs), buffer_bytes=sum(size for size, *_ in bufs.values()),
+                weight_bytes=sum(bufs[name][0] for name in bufs_to_save))
+
+if __name__ == "__main__":
+    TYPE = getenv("TYPE", "conv").lower()
+    name = "mnist_mlp" if TYPE == "mlp" else "mnist_convnet"
+    MODEL = Path(getenv("MODEL", f"../app/public/models/{name}/{name}.safetensors"))
+    ACT_FN = Tensor.silu if getenv("ACT_FN", "silu").lower() == "silu" else Tensor.relu
+
+    X_test = mnist()[2][:1000].contiguous().realize()
+    model = load_model(MODEL, ACT_FN)[0]
+    before_stats, before = net_stats(model, prune=False), model(normalize(X_test)).numpy()
+    for note in fold_batchnorm(model): print(note)
+    after_stats, after = net_stats(model, prune=True), model(normalize(X_test)).numpy()
+
+    print(f"{Device.DEFAULT} export of {MODEL.name}")
+    for k in before_stats: print(f"  {k:13s} {before_stats[k]:9d} -> {after_stats[k]:9d}")
+    print(f"  max logit difference {np.abs(before - after).max():.2e}, top-1 agreement {(before.argmax(1) == after.argmax(1)).mean() * 100:.2f}%")
@@ -0,0 +1,79 @@
+#! /usr/bin/env python3
+# vim:fenc=utf-8
+#
+# Copyright (C) 2025 Stanley Arnaud <stantonik@stantonik-mba.local>
+#
+# Distributed under terms of the MIT license.
+
+from queue import Queue
+from typing import Optional
+import threading
+import numpy as np
+from tinygrad import Tensor, Variable
+from tinygrad.uop.ops import UOp
+from augment import AugmentStore
+
+# Device side epoch sampler: every epoch is a fresh permutation of the training set, gathered once
+# into a contiguous shard; a batch is then a symbolic slice of it (see batch()), so the training JIT
+# reads contiguous memory and an epoch sees every sample exactly once. Only the current epoch is
+# kept: the next one is gathered (synchronously) when it starts, so the loader holds one shuffled
+# copy of the training set. Batches are views of it, there is nothing to prefetch (HPConfig.prefetch only
+# sizes StoreLoader's queue). With shard=(rank, world) the data parallel ranks share the permutation
+# (same seed) and each gathers its slice of every global batch
+class EpochLoader:
+    def __init__(self, X: Tensor, Y: Tensor, batch_size: int, seed: Optional[int] = None, shard: tuple[int, int] = (0, 1)):
+        self.X, self.Y, self.batch_size, self.shard = X, Y, batch_size, shard
+        self.steps_per_epoch = X.shape[0] // (batch_size * shard[1])  # the ragged tail is left out, it is in the next permutation
+        self.rng = np.random.default_rng(seed)
+        self.epoch = self._shard()
+        self.step = 0
+
+    def _shard(self) -> tuple[Tensor, Tensor]:
+        rank, world = self.shard
+        perm = self.rng.permutation(self.X.shape[0])[:self.steps_per_epoch * self.batch_size * world]
+        perm = Tensor(perm.reshape(self.steps_per_epoch, world, self.batch_size)[:, rank].ravel().astype(np.int32), device=self.X.device)
+        return self.X[perm].contiguous().realize(), self.Y[perm].contiguous().realize()
+
+    def next(self) -> tuple[Tensor, Tensor, UOp]:
+        if self.step == self.steps_per_epoch:
+            self.epoch, self.step = self._shard(), 0
+        offset = Variable("offset", 0, (self.steps_per_epoch - 1) * self.batch_size).bind(self.step * self.batch_size)
+        self.step += 1
+        return *self.epoch, offset
+
+    @staticmethod
+    def batch(X: Tensor, Y: Tensor, offset: UOp, batch_size: int) -> tuple[Tensor, Tensor]:
+        # call inside the JIT, the offset is a bound Variable so every batch reuses the same kernels
+        return X.shrink(((offset, offset + batch_size),) + ((None,) * (X.ndim - 1))), Y.shrink(((offset, offset + batch_size),))
+
+# Host side loader for the offline augmentation store: epochs are stored pre-shuffled, so batches
+# are contiguous reads from the memmap; a reader thread keeps `prefetch` batches ready in a queue.
+# Data parallel ranks pass the same seed and their shard=(rank, world) of every global batch
+class StoreLoader:
+    def __init__(self, store: AugmentStore, batch_size: int, prefetch: int = 2, seed: Optional[int] = None, shard: tuple[int, int] = (0, 1)):
+        self.store, self.batch_size, self.shard = store, batch_size, shard
+        self.steps_per_epoch = store.shape[1] // (batch_size * shard[1])
+        self.rng = np.random.default_rng(seed)
+        self.queue: Queue = Queue(maxsize=max(1, prefetch))
+        self.stopped = threading.Event()
+        self.reader = threading.Thread(target=self._read, daemon=True)
+        self.reader.start()
+
+    def _read(self):
+        e = 0
+        while not self.stopped.is_set():
+            X, Y = self.store.epoch(e), self.store.labels(e)
+            for b in self.rng.permutation(self.steps_per_epoch):  # batch order changes when a stored epoch is reused
+                start = (b * self.shard[1] + self.shard[0]) * self.batch_size
+                s = slice(start, start + self.batch_size)
+                self.queue.put((np.array(X[s]), np.array(Y[s])))
+                if self.stopped.is_set(): return
+            e += 1
+
+    def next(self) -> tuple[Tensor, Tensor]:
+        X, Y = self.queue.get()
+        return Tensor(X), Tensor(Y)
+
+    def close(self):
+        self.stopped.set()
+        while not self.queue.empty(): self.queue.get_nowait()  # unblock the reader
@@ -0,0 +1,90 @@
+#! /usr/bin/env python3
+# vim:fenc=utf-8
+#
+# Copyright (C) 2025 Stanley Arnaud <stantonik@stantonik-mba.local>
+#
+# Distributed under terms of the MIT license.
+
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from tinygrad import Tensor
+from tinygrad.helpers import getenv
+import dataset
+import http.client
+import json
+import numpy as np
+import socket
+import threading
+import time
+
+class UnixHTTPConnection(http.client.HTTPConnection):
+    def __init__(self, path: str):
+        super().__init__("localhost")
+        self.path = path
+
+    def connect(self):
+        self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self.sock.connect(self.path)
+
+def connect(address: str) -> http.client.HTTPConnection:
+    if address.startswith("unix:"): return UnixHTTPConnection(address[len("unix:"):])
+    host, port = address.rsplit(":", 1)
+    return http.client.HTTPConnection(host, int(port))
+
+def request(conn: http.client.HTTPConnection, method: str, path: str, body: bytes = b"") -> dict:
+    conn.request(method, path, body=body, headers={"Content-Type": "application/octet-stream"})
+    return json.loads(conn.getresponse().read())
+
+# closed loop: every client sends its next single-image request as soon as the previous one answered
+def run_load(address: str, images: np.ndarray, clients: int, requests: int) -> dict:
+    request(connect(address), "POST", "/stats/reset")
+    latencies, lock = [], threading.Lock()
+
+    def client(c: int):
+        conn, local = connect(address), []
+        for i in range(requests):
+            img = images[(c * requests + i) % len(images)]
+            start = time.perf_counter()
+            request(conn, "POST", "/predict", img.tobytes())
+            local.append(time.perf_counter() - start)
+        with lock: latencies.extend(local)
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(clients) as pool: list(pool.map(client, range(clients)))
+    elapsed = time.perf_counter() - start
+    lat = np.array(latencies) * 1000
+    return dict(clients=clients, requests=len(lat), requests_per_s=len(lat) / elapsed,
+                p50_ms=float(np.percentile(lat, 50)), p99_ms=float(np.percentile(lat, 99)),
+                server=request(connect(address), "GET", "/stats"))
+
+def report(label: str, r: dict):
+    print(f"{label:12s} {r['clients']:3d} clients  {r['requests_per_s']:8.1f} req/s  p50 {r['p50_ms']:7.2f} ms  p99 {r['p99_ms']:7.2f} ms  "
+          f"(server p50 {r['server']['window_p50_ms']:.2f} ms, batches {r['server']['batches']})")
+
+if __name__ == "__main__":
+    ADDRESS = getenv("ADDRESS", "")         # host:port or unix:/path; empty starts local servers to compare
+    CLIENTS = [int(c) for c in getenv("CLIENTS", "1,8,32").split(",")]
+    REQUESTS = int(getenv("REQUESTS", 200))  # per client
+    images = dataset.mnist_arrays()[2][:1000, 0]
+
+    if ADDRESS:
+        for c in CLIENTS: report(ADDRESS, run_load(ADDRESS, images, c, REQUESTS))
+    else:
+        # batched server vs per-request inference (single bucket of 1, no wait), same model and process
+        from predict import load_model
+        from serve import Batcher, make_server
+        TYPE = getenv("TYPE", "mlp").lower()
+        name = "mnist_mlp" if TYPE == "mlp" else "mnist_convnet"
+        MODEL = Path(getenv("MODEL", f"../app/public/models/{name}/{name}.safetensors"))
+        BUCKETS = tuple(int(b) for b in getenv("BUCKETS", "1,8,32,128").split(","))
+        MAX_DELAY_MS = float(getenv("MAX_DELAY_MS", 5.0))
+        ACT_FN = Tensor.silu if getenv("ACT_FN", "silu").lower() == "silu" else Tensor.relu
+
+        model, _ = load_model(MODEL, ACT_FN)
+        for label, batcher in [("per-request", Batcher(model, (1,), 0.0)), ("batched", Batcher(model, BUCKETS, MAX_DELAY_MS / 1000))]:
+            server = make_server(batcher, port=0)
+            threading.Thread(target=server.serve_forever, daemon=True).start()
+            address = f"127.0.0.1:{server.server_address[1]}"
+            for c in CLIENTS: report(label, run_load(address, images, c, REQUESTS))
+            server.shutdown()
+            server.server_close()
@@ -0,0 +1,35 @@
+#! /usr/bin/env python3
+# vim:fenc=utf-8
+#
+# Copyright (C) 2025 Stanley Arnaud <stantonik@stantonik-mba.local>
+#
+# Distributed under terms of the MIT license.
+
+from tinygrad import Tensor, Variable
+from tinygrad.uop.ops import UOp
+
+# Device side ring buffer of per-step scalars. Rows are written by a kernel (ideally captured
+# in the training step JIT), so the host pays a single sync per drain() instead of one per .item()
+class MetricsRing:
+    def __init__(self, size: int, columns: int, device=None):
+        self.size, self.count = size, 0
+        self.buf = Tensor.zeros(size, columns, device=device).contiguous().realize()
+
+    def next_slot(self) -> UOp:
+        # a bound Variable, so every slot reuses the same compiled kernel
+        assert self.count < self.size, "ring is full, drain() it first"
+        self.count += 1
+        return Variable("slot", 0, self.size - 1).bind(self.count - 1)
+
+    def write(self, slot: UOp, *values: Tensor) -> Tensor:
+        row = Tensor.stack(*[v.reshape(()).cast(self.buf.dtype) for v in values]).reshape(1, -1)
+        return self.buf.assign((Tensor.arange(self.size, device=self.buf.device).reshape(-1, 1) == slot).where(row, self.buf))
+
+    def push(self, *values: Tensor): self.write(self.next_slot(), *values).realize()
+
+    def full(self) -> bool: return self.count == self.size
+
+    def drain(self) -> list[list[float]]:
+        rows = self.buf.tolist()[:self.count]  # whole buffer, a shrink would compile a kernel per count
+        self.count = 0
+        return rows
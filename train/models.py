@@ -9,6 +9,8 @@ from enum import Enum
 from typing import Callable
 from tinygrad import Tensor, nn
 
+def flatten(x: Tensor) -> Tensor: return x.flatten(1)
+
 class Conv:
   def __init__(self, activation_fn: Callable[[Tensor],Tensor] = Tensor.silu ):
     self.layers: list[Callable[[Tensor], Tensor]] = [
@@ -18,14 +20,14 @@ class Conv:
       nn.Conv2d(32, 64, 3), activation_fn,
       nn.Conv2d(64, 64, 3), activation_fn,
       nn.BatchNorm(64), Tensor.max_pool2d,
-      lambda x: x.flatten(1), nn.Linear(576, 10),
+      flatten, nn.Linear(576, 10),
     ]
 
   def __call__(self, x:Tensor) -> Tensor: return x.sequential(self.layers)
 
 class MLP():
     def __init__(self, width: int = 512, depth: int = 2, activation_fn: Callable[[Tensor],Tensor] = Tensor.silu):
-        self.layers: list[Callable[[Tensor], Tensor]] = [lambda x: x.flatten(1)]
+        self.layers: list[Callable[[Tensor], Tensor]] = [flatten]
         in_features = 28*28
         for _ in range(depth):
             self.layers.append(nn.Linear(in_features, width))
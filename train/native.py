@@ -0,0 +1,94 @@
+#! /usr/bin/env python3
+# vim:fenc=utf-8
+#
+# Copyright (C) 2025 Stanley Arnaud <stantonik@stantonik-mba.local>
+#
+# Distributed under terms of the MIT license.
+
+from pathlib import Path
+from tinygrad import Tensor, TinyJit
+from tinygrad.device import Device
+from tinygrad.helpers import getenv
+from export_model import batch_input, export_model
+from fold import fold_batchnorm
+from predict import load_model
+from utils import normalize
+import ctypes
+import numpy as np
+import subprocess
+import time
+
+def build(model, out_dir: Path, name: str, batch_size: int = 64, symbolic: bool = True) -> tuple[Path, Path]:
+    # <name>.c and the <name>.bin weight blob, compiled into <name>.so with the system C compiler;
+    # with a symbolic batch net() runs chunks of up to batch_size without padding, a fixed batch
+    # gets better unrolled kernels but a single sample pays for batch_size
+    device = Device.DEFAULT
+    Device.DEFAULT = "CPU"  # the kernels have to be C
+    try: src, blob = export_model(model, "native", batch_input(batch_size, 1, 28, 28) if symbolic else Tensor.randn(batch_size, 1, 28, 28))
+    finally: Device.DEFAULT = device
+    out_dir.mkdir(parents=True, exist_ok=True)
+    c_path, blob_path, so_path = out_dir / f"{name}.c", out_dir / f"{name}.bin", out_dir / f"{name}.so"
+    c_path.write_text(src)
+    blob_path.write_bytes(blob)
+    cc = getenv("CC", "cc")
+    subprocess.check_call([cc, "-O2", "-march=native", "-ffast-math", "-shared", "-fPIC", "-o", str(so_path), str(c_path), "-lm"])
+    return so_path, blob_path
+
+# ctypes runner for a built library; inputs are uint8 images like the rest of train/, normalized here
+class NativeNet:
+    def __init__(self, so_path: Path, blob_path: Path):
+        self.lib = ctypes.CDLL(str(Path(so_path).resolve()))
+        self.lib.net_init.argtypes, self.lib.net_init.restype = [ctypes.c_char_p], ctypes.c_int
+        self.lib.net.argtypes = [ctypes.c_void_p, ctypes.c_void_p, ctypes.c_int]
+        if (err := self.lib.net_init(str(blob_path).encode())) != 0: raise RuntimeError(f"net_init({blob_path}) failed with {err}")
+        self.batch_size = self.lib.net_batch_size()
+
+    def __call__(self, X: np.ndarray) -> np.ndarray:
+        X = np.ascontiguousarray(X.reshape(len(X), -1), dtype=np.float32) * (2 / 255) - 1
+        out = np.empty((len(X), 10), dtype=np.float32)
+        self.lib.net(X.ctypes.data, out.ctypes.data, len(X))
+        return out
+
+    def close(self): self.lib.net_free()
+
+if __name__ == "__main__":
+    TYPE = getenv("TYPE", "mlp").lower()
+    name = "mnist_mlp" if TYPE == "mlp" else "mnist_convnet"
+    MODEL = Path(getenv("MODEL", f"../app/public/models/{name}/{name}.safetensors"))
+    BATCH = int(getenv("BATCH", 64))
+    OUT = Path(getenv("OUT", "native"))
+    N = int(getenv("N", 2048))
+    SYMBOLIC = getenv("SYMBOLIC", 1)
+    ACT_FN = Tensor.silu if getenv("ACT_FN", "silu").lower() == "silu" else Tensor.relu
+
+    model = load_model(MODEL, ACT_FN)[0]
+    fold_batchnorm(model)
+    start = time.perf_counter()
+    so_path, blob_path = build(model, OUT, name, BATCH, bool(SYMBOLIC))
+    print(f"built {so_path} ({so_path.stat().st_size / 1024:.0f} KB) + {blob_path} ({blob_path.stat().st_size / 1024:.0f} KB) in {time.perf_counter() - start:.1f}s")
+
+    # native vs tinygrad CPU (fixed batch, padded), same input
+    X = np.random.default_rng(0).integers(0, 256, (N, 1, 28, 28), dtype=np.uint8)
+    net = NativeNet(so_path, blob_path)
+
+    @TinyJit
+    def forward(X: Tensor) -> Tensor: return model(normalize(X)).realize()
+
+    def tinygrad_run(X: np.ndarray) -> np.ndarray:
+        out = []
+        for i in range(0, len(X), BATCH):
+            part = X[i:i + BATCH]
+            padded = np.concatenate([part, np.zeros((BATCH - len(part), *part.shape[1:]), np.uint8)]) if len(part) < BATCH else part
+            out.append(forward(Tensor(padded, device="CPU")).numpy()[:len(part)])
+        return np.concatenate(out)
+
+    ref = tinygrad_run(X)
+    print(f"max logit difference vs tinygrad: {np.abs(net(X) - ref).max():.2e}")
+    for label, fn in [("tinygrad CPU", tinygrad_run), ("native", net)]:
+        for n in (1, BATCH, N):
+            runs = max(3, min(20, 2048 // n))
+            start = time.perf_counter()
+            for _ in range(runs): fn(X[:n])
+            elapsed = (time.perf_counter() - start) / runs
+            print(f"{label:13s} n={n:5d}  {elapsed * 1000:9.3f} ms  {n / elapsed:10.0f} samples/s")
+    net.close()
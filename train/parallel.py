@@ -0,0 +1,151 @@
+#! /usr/bin/env python3
+# vim:fenc=utf-8
+#
+# Copyright (C) 2025 Stanley Arnaud <stantonik@stantonik-mba.local>
+#
+# Distributed under terms of the MIT license.
+
+from multiprocessing import shared_memory
+from typing import Callable, Optional
+from tinygrad import Tensor
+from tinygrad.device import Device
+from tinygrad.helpers import getenv
+import multiprocessing
+import os
+import secrets
+import numpy as np
+
+# Data parallel training on one host: every rank (a process, one tinygrad CPU device each) trains a
+# replica on its shard of the batch. Gradients and the loss go through a shared memory all-reduce (each
+# rank writes its row, every rank reads the mean), so the replicas take the same optimizer step and stay
+# identical. Rank 0 evaluates, checkpoints and logs, and broadcasts what changes the replicas otherwise
+# (initial weights, lr decay, restored checkpoints)
+
+BARRIER_TIMEOUT = float(getenv("DP_TIMEOUT", 600.0))  # first steps compile, a dead rank fails everyone after this
+CTRL = 8  # broadcast scalars
+
+def _buffers(tensors: list[Tensor]) -> list:
+    # the realized device buffers behind the tensors, copied from / into without a kernel. Fresh optimizer
+    # state is lazy and equal constants (Adam's m and v, b1_t and b2_t) share one UOp that would realize into
+    # one buffer for all of them, so every lazy tensor gets its own buffer first. Weights are reshapes of theirs
+    for t in [t for t in tensors if t.uop.base.realized is None]: t.replace(Tensor(t.numpy(), device=t.device).realize())
+    bufs = [t.uop.base.realized for t in tensors]
+    assert all(b is not None and b.nbytes == t.nbytes() for b, t in zip(bufs, tensors)), "only whole realized tensors can be reduced or broadcast"
+    return bufs
+
+class DataParallel:
+    def __init__(self, rank: int, world: int, grad_size: int, state_nbytes: int, name: str, barrier, seed: int, create: bool = False):
+        self.rank, self.world, self.seed, self.barrier = rank, world, seed, barrier
+        row_bytes = 4 * (grad_size + 1)
+        nbytes = world * row_bytes + state_nbytes + 8 * CTRL
+        self.shm = shared_memory.SharedMemory(name=name, create=create, size=nbytes if create else 0)
+        self.rows = np.ndarray((world, grad_size + 1), dtype=np.float32, buffer=self.shm.buf)    # gradients + loss per rank
+        self.state = self.shm.buf[world * row_bytes:world * row_bytes + state_nbytes]            # rank 0's tensors, raw bytes
+        self.ctrl = np.ndarray((CTRL,), dtype=np.float64, buffer=self.shm.buf, offset=world * row_bytes + state_nbytes)
+        self.mean = np.empty(grad_size + 1, dtype=np.float32)
+        self.flat = Tensor.zeros(grad_size + 1).contiguous().realize()  # on device: gradients then loss
+        self.procs: list = []
+
+    @property
+    def root(self) -> bool: return self.rank == 0
+
+    @property
+    def loss(self) -> Tensor: return self.flat[-1]
+
+    def _wait(self):
+        try: self.barrier.wait(BARRIER_TIMEOUT)
+        except Exception:
+            self.barrier.abort()
+            raise
+
+    def write_grads(self, params: list[Tensor], loss: Tensor) -> Tensor:
+        # inside the training JIT, after backward()
+        return loss.realize(self.flat.assign(Tensor.cat(*[p.grad.flatten() for p in params], loss.reshape(1))))
+
+    def read_grads(self, params: list[Tensor]):
+        # inside the optimizer step JIT, the gradients become views of the reduced buffer
+        offset = 0
+        for p in params:
+            p.grad = self.flat[offset:offset + p.numel()].reshape(p.shape)
+            offset += p.numel()
+
+    def all_reduce(self):
+        buf = _buffers([self.flat])[0]
+        buf.copyout(memoryview(self.rows[self.rank]).cast("B"))
+        self._wait()
+        np.mean(self.rows, axis=0, out=self.mean)
+        buf.copyin(memoryview(self.mean).cast("B"))
+
+    def broadcast_values(self, *values: float) -> list[float]:
+        # rank 0's scalars to every rank; the barrier also keeps the next all_reduce from overwriting rows still read
+        if self.root: self.ctrl[:len(values)] = values
+        self._wait()
+        return self.ctrl[:len(values)].tolist()
+
+    def broadcast(self, tensors: list[Tensor]):
+        bufs, offsets = _buffers(tensors), np.cumsum([0] + [t.nbytes() for t in tensors]).tolist()
+        if self.root:
+            for buf, start, end in zip(bufs, offsets, offsets[1:]): buf.copyout(self.state[start:end])
+        self._wait()
+        if self.root: return
+        for buf, start, end in zip(bufs, offsets, offsets[1:]): buf.copyin(self.state[start:end])
+
+    def close(self, check: bool = True):
+        if self.root:
+            for p in self.procs: p.join()
+            failed = [p.exitcode for p in self.procs if p.exitcode != 0]
+        self.rows = self.ctrl = self.state = None  # views into the mapping, released before close()
+        self.shm.close()
+        if self.root:
+            self.shm.unlink()
+            if failed and check: raise RuntimeError(f"data parallel ranks exited with codes {failed}")
+
+def run_rank(train_fn: Callable, dp: DataParallel, *args, **kwargs):
+    # train_fn(*args, dp=dp) on every rank, rank 0 included: a failing rank breaks the barrier so the others
+    # stop waiting instead of timing out, and the shared memory is released (rank 0 unlinks it) either way
+    try: result = train_fn(*args, dp=dp, **kwargs)
+    except BaseException:
+        dp.barrier.abort()
+        dp.close(check=False)  # the other ranks then fail on the broken barrier, this error is the one to report
+        raise
+    dp.close()
+    return result
+
+def _rank_main(train_fn: Callable, rank: int, world: int, grad_size: int, state_nbytes: int, name: str, barrier, seed: int, device: Optional[str], args: tuple):
+    if device is not None: Device.DEFAULT = device
+    run_rank(train_fn, DataParallel(rank, world, grad_size, state_nbytes, name, barrier, seed), *args)
+
+def launch(train_fn: Callable, world: int, grad_size: int, state_nbytes: int, *args) -> DataParallel:
+    # rank 0 is the calling process, ranks 1..world-1 run train_fn(*args, dp=...) in spawned processes; the caller
+    # goes on with run_rank(), which closes the returned DataParallel
+    ctx = multiprocessing.get_context("spawn")  # fork does not play well with initialized tinygrad devices
+    barrier, seed = ctx.Barrier(world), secrets.randbits(31)
+    name = f"dp-{os.getpid()}-{secrets.token_hex(4)}"
+    dp = DataParallel(0, world, grad_size, state_nbytes, name, barrier, seed, create=True)
+    dp.procs = [ctx.Process(target=_rank_main, args=(train_fn, r, world, grad_size, state_nbytes, name, barrier, seed, Device.DEFAULT, args), daemon=True)
+                for r in range(1, world)]
+    for p in dp.procs: p.start()
+    return dp
+
+if __name__ == "__main__":
+    # scaling efficiency: samples/s of the same global batch on 1..N ranks, relative to N x one rank
+    from dataclasses import replace
+    from train import train_model
+    from utils import HPConfig
+    import models
+
+    TYPE = models.Type.MLP if getenv("TYPE", "mlp").lower() == "mlp" else models.Type.CONV
+    WORKERS = [int(w) for w in getenv("WORKERS", "1,2,4,8").split(",")]
+    STEPS, WARMUP = int(getenv("STEPS", 100)), int(getenv("WARMUP", 10))
+    cfg = HPConfig(batch_size=int(getenv("BATCH", 128)), width=int(getenv("WIDTH", 512)), eval_every=10**9, patience=10**9)
+    print(f"{os.cpu_count()} cpus, {TYPE.name.lower()} global batch {cfg.batch_size}, {STEPS} steps")
+
+    base = None
+    for n in WORKERS:
+        log = train_model(TYPE, replace(cfg, dp_workers=n), stop_step=STEPS)
+        # from the step after the warm-up, the first calls compile
+        times = log.column("time")
+        sps = (len(times) - WARMUP - 1) * cfg.batch_size / (times[-1] - times[WARMUP])
+        if n == 1: base = sps
+        eff = f"{sps / (n * base) * 100:5.1f}%" if base else "    -"
+        print(f"{n:2d} ranks  {sps:9.0f} samples/s  efficiency {eff}  final loss {log.column('train_loss')[-1]:.3f}", flush=True)
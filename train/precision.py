@@ -0,0 +1,107 @@
+#! /usr/bin/env python3
+# vim:fenc=utf-8
+#
+# Copyright (C) 2025 Stanley Arnaud <stantonik@stantonik-mba.local>
+#
+# Distributed under terms of the MIT license.
+
+from contextlib import contextmanager
+from typing import Optional
+from tinygrad import Tensor, dtypes
+from tinygrad.helpers import getenv
+from tinygrad.nn.optim import Optimizer
+from tinygrad.nn.state import get_state_dict
+from tinygrad.uop.ops import Ops, UOp
+
+# Mixed precision training: the model keeps its float32 weights, they are the master copy the optimizer
+# steps, and checkpoints, evaluation, data parallel broadcasts and the export see them unchanged. Inside
+# autocast() the layers read half precision casts of them, so the forward and the backward run in half and
+# the gradients come back to the masters in float32. fp16 gradients underflow: the loss is scaled up before
+# backward() and the gradients down after it, a step with an overflow is skipped (on device, no host sync)
+# and the scale backs off, it grows again after `interval` clean steps. bf16 has the float32 range, no scaling
+
+PRECISIONS = {"fp32": dtypes.float, "fp16": dtypes.half, "bf16": dtypes.bfloat16}
+
+def _keep_if(ok: Tensor, tensors: list[Tensor]):
+    # the optimizer assigned its new values in place, one ASSIGN per tensor: each one writes the old value back
+    # when ok is false instead. Later values read earlier assigns (Adam's weights read the new m and v), these
+    # reads are rewired to the gated assigns, so every buffer is still written once
+    gated: dict[UOp, UOp] = {}
+    for t in tensors:
+        if t.uop.op is not Ops.ASSIGN: continue
+        target, value = Tensor(t.uop.src[0]), Tensor(t.uop.src[1].substitute(gated))
+        gated[t.uop] = t.uop = target.assign(ok.where(value, target)).uop
+
+class MixedPrecision:
+    def __init__(self, model, opt: Optimizer, precision: str, init_scale: float = 2.0**16, growth: float = 2.0, backoff: float = 0.5,
+                 interval: int = 2000):
+        self.dtype, self.growth, self.backoff, self.interval = PRECISIONS[precision], growth, backoff, interval
+        self.scaled = self.dtype == dtypes.half
+        # the weights the layers read; BatchNorm running stats are buffers assigned in place, they stay float32
+        params = {id(p) for p in opt.params}
+        self.weights = [(*self._parent(model, k), v) for k, v in get_state_dict(model).items() if id(v) in params]
+        self.scale = Tensor(init_scale if self.scaled else 1.0).contiguous().realize()
+        self.good = Tensor(0).contiguous().realize()  # clean steps since the last overflow or growth
+
+    @staticmethod
+    def _parent(obj, key: str):
+        *path, attr = key.split(".")
+        for name in path: obj = obj[int(name)] if isinstance(obj, (list, tuple)) else getattr(obj, name)
+        return obj, attr
+
+    @contextmanager
+    def autocast(self):
+        # traced by the training JIT: the casts end up in its kernels, the masters are never replaced
+        for obj, attr, w in self.weights: setattr(obj, attr, w.cast(self.dtype))
+        try: yield
+        finally:
+            for obj, attr, w in self.weights: setattr(obj, attr, w)
+
+    def state(self) -> dict[str, Tensor]: return {"scale": self.scale, "good": self.good}
+
+    def backward(self, loss: Tensor, params: list[Tensor]):
+        # the float32 loss, scaled for the backward pass; the gradients land unscaled on the masters
+        (loss * self.scale).backward()
+        for p in params: p.grad = p.grad / self.scale
+
+    def schedule_step(self, opt: Optimizer) -> list[Tensor]:
+        # opt.schedule_step() on the unscaled gradients, undone on device if any of them is inf or nan
+        ok = Tensor.stack(*[p.grad.isfinite().all() for p in opt.params]).all()
+        scheduled = opt.schedule_step()
+        _keep_if(ok, scheduled)
+        if not self.scaled: return scheduled
+        good = ok.where(self.good + 1, 0)
+        grow = good >= self.interval
+        self.scale.assign(ok.where(grow.where(self.scale * self.growth, self.scale), self.scale * self.backoff))
+        self.good.assign(grow.where(0, good))
+        return scheduled + [self.scale, self.good]
+
+def mixed_precision(model, opt: Optimizer, precision: str) -> Optional[MixedPrecision]:
+    assert precision in PRECISIONS, f"unknown precision {precision}, expected one of {list(PRECISIONS)}"
+    return MixedPrecision(model, opt, precision) if precision != "fp32" else None
+
+if __name__ == "__main__":
+    # step time and memory of the training step against the accuracy reached in the same number of steps
+    from dataclasses import replace
+    from bench import bench_train
+    from train import train_model
+    from utils import HPConfig
+    import models
+    import numpy as np
+
+    TYPES = [models.Type[t.strip().upper()] for t in getenv("TYPES", "mlp,conv").split(",")]
+    # PRECISION is the single training precision of train.py, the variants compared here are PRECISIONS
+    VARIANTS = [p.strip() for p in getenv("PRECISIONS", "fp32,fp16").split(",")]
+    STEPS, BENCH_STEPS = int(getenv("STEPS", 500)), int(getenv("BENCH_STEPS", 20))
+    cfg = HPConfig(batch_size=int(getenv("BATCH", 128)), eval_every=int(getenv("EVAL_EVERY", 100)))
+
+    for type in TYPES:
+        base = None
+        for precision in VARIANTS:
+            c = replace(cfg, precision=precision)
+            step_s, _, mem_mb = bench_train(type, c, 3, BENCH_STEPS)
+            log = train_model(type, c, stop_step=STEPS)
+            skipped = int((np.diff(log.column("loss_scale")) < 0).sum())  # nan without loss scaling
+            base = base or step_s
+            print(f"{type.name.lower():4s} {precision}  step {step_s * 1e3:7.2f} ms ({base / step_s:4.2f}x)  mem {mem_mb:7.1f} MB  "
+                  f"best acc {log.best_acc:6.2f}%  final loss {log.column('train_loss')[-1]:.3f}  overflows {skipped}", flush=True)
@@ -0,0 +1,125 @@
+#! /usr/bin/env python3
+# vim:fenc=utf-8
+#
+# Copyright (C) 2025 Stanley Arnaud <stantonik@stantonik-mba.local>
+#
+# Distributed under terms of the MIT license.
+
+from pathlib import Path
+from typing import Callable, Iterator, Optional
+from tinygrad import Tensor, TinyJit
+from tinygrad.helpers import getenv, tqdm
+from tinygrad.nn.state import load_state_dict, safe_load
+from PIL import Image
+from utils import normalize
+import gzip
+import models
+import numpy as np
+import sys
+import time
+
+IDX_DTYPES = {0x08: np.uint8, 0x09: np.int8, 0x0B: ">i2", 0x0C: ">i4", 0x0D: ">f4", 0x0E: ">f8"}
+
+def load_model(path: Path, activation_fn: Callable[[Tensor], Tensor] = Tensor.silu):
+    # the architecture is read back from the state dict: conv kernels are 4D, MLP width/depth come from the linear shapes
+    state = safe_load(path)
+    if any(len(v.shape) == 4 for v in state.values()):
+        model = models.Conv(activation_fn=activation_fn)
+        load_state_dict(model, state)
+        return model, models.Type.CONV
+
+    # linear layers in order; older checkpoints number them differently, so they are matched by position
+    keys = sorted({k.rsplit(".", 1)[0] for k in state if k.endswith(".weight")}, key=lambda k: int(k.split(".")[1]))
+    widths = {state[f"{k}.weight"].shape[0] for k in keys[:-1]}
+    assert len(widths) == 1, f"hidden layers of different widths are not supported: {sorted(widths)}"
+    model = models.MLP(width=widths.pop(), depth=len(keys) - 1, activation_fn=activation_fn)
+    linears = [l for l in model.layers if hasattr(l, "weight")]
+    load_state_dict(model, {f"layers.{model.layers.index(l)}.{p}": state[f"{k}.{p}"] for l, k in zip(linears, keys) for p in ("weight", "bias")})
+    return model, models.Type.MLP
+
+# -----------------
+# Inputs
+# -----------------
+# every reader returns the sample count and an iterator of uint8 (b, 28, 28) chunks, only one chunk is in memory at a time
+def read_idx(path: Path, chunk: int) -> tuple[int, Iterator[np.ndarray]]:
+    f = gzip.open(path, "rb") if path.suffix == ".gz" else open(path, "rb")
+    _, _, dtype, ndim = f.read(4)
+    shape = tuple(int.from_bytes(f.read(4), "big") for _ in range(ndim))
+    dtype = np.dtype(IDX_DTYPES[dtype])
+    sample_bytes = int(np.prod(shape[1:])) * dtype.itemsize
+
+    def chunks():
+        with f:
+            while data := f.read(chunk * sample_bytes):
+                yield to_u8(np.frombuffer(data, dtype=dtype).reshape(-1, *shape[1:]))
+    return shape[0], chunks()
+
+def read_npy(path: Path, chunk: int) -> tuple[int, Iterator[np.ndarray]]:
+    data = np.load(path, mmap_mode="r")
+    return len(data), (to_u8(data[i:i + chunk]) for i in range(0, len(data), chunk))
+
+def read_png_dir(path: Path, chunk: int) -> tuple[int, Iterator[np.ndarray], list[str]]:
+    files = sorted(path.glob("*.png"))
+    def load(f: Path) -> np.ndarray:
+        img = Image.open(f).convert("L")
+        return np.asarray(img if img.size == (28, 28) else img.resize((28, 28), Image.BILINEAR))
+    return len(files), (np.stack([load(f) for f in files[i:i + chunk]]) for i in range(0, len(files), chunk)), [f.name for f in files]
+
+def to_u8(X: np.ndarray) -> np.ndarray:
+    # floats are taken as [0, 1] intensities, anything else as MNIST pixel values
+    X = X.reshape(len(X), 28, 28)
+    # a writable plain array: astype() keeps the np.memmap subclass of a mapped .npy, which tinygrad rejects
+    return np.array((X * 255).round().clip(0, 255) if X.dtype.kind == "f" else X, dtype=np.uint8)
+
+def open_input(path: Path, chunk: int) -> tuple[int, Iterator[np.ndarray], Optional[list[str]]]:
+    # file names for a PNG directory, the other inputs are identified by their sample index
+    if path.is_dir(): return read_png_dir(path, chunk)
+    n, chunks = read_npy(path, chunk) if path.suffix == ".npy" else read_idx(path, chunk)
+    return n, chunks, None
+
+# -----------------
+# Prediction
+# -----------------
+def predict(model, path: Path, out: Path, batch_size: int = 1024) -> float:
+    @TinyJit
+    def forward(X: Tensor) -> tuple[Tensor, Tensor]:
+        logits = model(normalize(X))
+        return logits.realize(), logits.argmax(axis=1).realize()
+
+    n, chunks, names = open_input(path, batch_size)
+    out.parent.mkdir(parents=True, exist_ok=True)
+    logits_out = np.lib.format.open_memmap(out.with_suffix(".logits.npy"), mode="w+", dtype=np.float32, shape=(n, 10))
+    start, done = time.perf_counter(), 0
+
+    with open(out.with_suffix(".csv"), "w") as csv:
+        csv.write("id,prediction\n")
+        batch = next(chunks, None)
+        with tqdm(total=n, desc="Predicting") as bar:
+            while batch is not None:
+                b = len(batch)
+                if b < batch_size: batch = np.concatenate([batch, np.zeros((batch_size - b, 28, 28), np.uint8)])  # ragged tail, same JIT
+                logits, pred = forward(Tensor(batch.reshape(batch_size, 1, 28, 28)))
+                batch = next(chunks, None)  # read the next chunk while the device works on this one
+                logits_out[done:done + b] = logits.numpy()[:b]
+                csv.writelines(f"{names[done + i] if names else done + i},{p}\n" for i, p in enumerate(pred.numpy()[:b].tolist()))
+                done += b
+                bar.update(b)
+
+    logits_out.flush()
+    return done / (time.perf_counter() - start)
+
+if __name__ == "__main__":
+    TYPE = getenv("TYPE", "mlp").lower()
+    name = "mnist_mlp" if TYPE == "mlp" else "mnist_convnet"
+    MODEL = Path(getenv("MODEL", f"../app/public/models/{name}/{name}.safetensors"))
+    BATCH = int(getenv("BATCH", 1024))
+    OUT = Path(getenv("OUT", "predictions/predictions"))
+
+    ACT_FN = getenv("ACT_FN", "silu").lower()
+    ACT_FN = Tensor.silu if ACT_FN == "silu" else Tensor.relu
+
+    if len(sys.argv) != 2: sys.exit("usage: [TYPE=mlp|conv] [MODEL=path.safetensors] [BATCH=1024] [OUT=prefix] python predict.py <file.idx[.gz] | file.npy | png_dir>")
+    model, type = load_model(MODEL, ACT_FN)
+    print(f"{type.name} from {MODEL}")
+    rate = predict(model, Path(sys.argv[1]), OUT, BATCH)
+    print(f"{rate:.0f} samples/s, logits in {OUT.with_suffix('.logits.npy')}, predictions in {OUT.with_suffix('.csv')}")
@@ -0,0 +1,126 @@
+#! /usr/bin/env python3
+# vim:fenc=utf-8
+#
+# Copyright (C) 2025 Stanley Arnaud <stantonik@stantonik-mba.local>
+#
+# Distributed under terms of the MIT license.
+
+from collections import defaultdict
+from contextlib import contextmanager, nullcontext
+from pathlib import Path
+from tinygrad.engine.realize import CompiledRunner, ExecItem
+from tinygrad.helpers import JIT, Metadata, ansistrip, getenv
+from tinygrad.tensor import _METADATA
+from tinygrad.uop.ops import sym_infer
+import json
+import os
+import time
+
+# Opt-in instrumentation (PROF=1). phase() records the host wall time of a block, tag() names the tensor ops
+# traced inside it: the kernels they end up in carry the name (their gradient kernels count as "backward"), so
+# the kernels of one fused training JIT still split into augment, forward, backward and optimizer. While it is
+# enabled every kernel run is synchronized and timed with its phase, global size and estimated bytes moved, and
+# the JITs run their kernels one by one instead of in a device graph. save() writes a Chrome / Perfetto trace
+# (chrome://tracing, ui.perfetto.dev), summary() the time per phase and the slowest kernels. Disabled, phase()
+# and tag() hand back one shared no-op context and tinygrad is left untouched
+
+_NOOP = nullcontext()
+HOST, KERNELS = 0, 1  # trace rows
+
+class Profiler:
+    def __init__(self):
+        self.enabled, self.events = False, []
+        self.start = time.perf_counter()
+
+    def enable(self):
+        if self.enabled: return
+        self.enabled, self.jit, self.run = True, JIT.value, ExecItem.run
+        JIT.value = 2  # no graphs, the JITs replay kernel by kernel through ExecItem.run
+        def run(ei: ExecItem, var_vals=None, wait=False, jit=False, do_update_stats=True):
+            st = time.perf_counter()
+            et = self.run(ei, var_vals, wait=True, jit=jit, do_update_stats=do_update_stats)
+            self._kernel(ei, (var_vals or {}) | ei.fixedvars, st, time.perf_counter())
+            return et
+        ExecItem.run = run
+
+    def disable(self):
+        if not self.enabled: return
+        ExecItem.run, JIT.value, self.enabled = self.run, self.jit, False
+
+    def _us(self, t: float) -> float: return (t - self.start) * 1e6
+
+    def _kernel(self, ei: ExecItem, var_vals: dict, st: float, en: float):
+        prg, args = ei.prg, {}
+        args["phase"] = "+".join(dict.fromkeys("backward" if m.backward else m.name for m in ei.metadata or ())) or "-"
+        if isinstance(prg, CompiledRunner):
+            name, global_size = prg.p.function_name, prg.p.launch_dims(var_vals)[0]
+            if global_size is not None: args["global_size"] = list(global_size)
+        else: name = ansistrip(prg.display_name).strip()
+        args["bytes"] = int(sym_infer(prg.estimates.mem, var_vals))
+        self.events.append(dict(name=name, cat="kernel", ph="X", ts=self._us(st), dur=(en - st) * 1e6, pid=os.getpid(), tid=KERNELS, args=args))
+
+    def phase(self, name: str):
+        return self._phase(name) if self.enabled else _NOOP
+
+    @contextmanager
+    def _phase(self, name: str):
+        st = time.perf_counter()
+        try: yield
+        finally: self.events.append(dict(name=name, cat="phase", ph="X", ts=self._us(st), dur=self._us(time.perf_counter()) - self._us(st), pid=os.getpid(), tid=HOST))
+
+    def tag(self, name: str):
+        # around graph construction (a JIT's first calls), replaying the JIT does not come back here
+        return self._tag(name) if self.enabled else _NOOP
+
+    @contextmanager
+    def _tag(self, name: str):
+        previous = _METADATA.set(Metadata(name=name, caller=""))
+        try: yield
+        finally: _METADATA.set(previous)
+
+    def save(self, path: Path) -> Path:
+        path = Path(path)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        names = [dict(name="thread_name", ph="M", pid=os.getpid(), tid=tid, args=dict(name=name)) for tid, name in ((HOST, "host"), (KERNELS, "kernels"))]
+        path.write_text(json.dumps(dict(traceEvents=names + self.events, displayTimeUnit="ms")))
+        return path
+
+    def summary(self, top: int = 15) -> str:
+        phases, kernel_phases, kernels = defaultdict(list), defaultdict(lambda: [0, 0.0, 0]), defaultdict(lambda: [0, 0.0, 0])
+        for e in self.events:
+            if e["cat"] == "phase": phases[e["name"]].append(e["dur"])
+            else:
+                for acc in (kernel_phases[e["args"]["phase"]], kernels[e["name"]]):
+                    acc[0], acc[1], acc[2] = acc[0] + 1, acc[1] + e["dur"], acc[2] + e["args"]["bytes"]
+        lines = [f"{'phase':24s} {'calls':>7s} {'total ms':>10s} {'mean ms':>9s}"]
+        lines += [f"{k:24s} {len(v):7d} {sum(v) / 1e3:10.1f} {sum(v) / len(v) / 1e3:9.3f}" for k, v in sorted(phases.items(), key=lambda kv: -sum(kv[1]))]
+        lines += ["", f"{'kernels by tag':24s} {'runs':>7s} {'total ms':>10s} {'GB/s':>9s}"]
+        lines += [f"{k[:24]:24s} {n:7d} {us / 1e3:10.1f} {b / max(us, 1e-9) / 1e3:9.2f}" for k, (n, us, b) in sorted(kernel_phases.items(), key=lambda kv: -kv[1][1])]
+        lines += ["", f"{'slowest kernels':24s} {'runs':>7s} {'total ms':>10s} {'mean us':>9s} {'GB/s':>7s}"]
+        lines += [f"{k[:24]:24s} {n:7d} {us / 1e3:10.1f} {us / n:9.1f} {b / max(us, 1e-9) / 1e3:7.2f}"
+                  for k, (n, us, b) in sorted(kernels.items(), key=lambda kv: -kv[1][1])[:top]]
+        return "\n".join(lines)
+
+profiler = Profiler()
+if getenv("PROF"): profiler.enable()
+
+if __name__ == "__main__":
+    # a short profiled run and a CPU export of the trained model, the trace goes to OUT
+    from tinygrad import Device
+    from export_model import batch_input, export_model
+    from train import build_model, train_model
+    from utils import HPConfig
+    import models
+    from profiler import profiler  # the instance train.py and export_model.py record into, not this __main__ copy
+
+    TYPE = models.Type.MLP if getenv("TYPE", "mlp").lower() == "mlp" else models.Type.CONV
+    STEPS = int(getenv("STEPS", 100))
+    OUT = Path(getenv("OUT", "profiles/trace.json"))
+    cfg = HPConfig(batch_size=int(getenv("BATCH", 128)), eval_every=int(getenv("EVAL_EVERY", 50)))
+
+    profiler.enable()
+    train_model(TYPE, cfg, stop_step=STEPS)
+    model, _ = build_model(TYPE, cfg)
+    with profiler.phase("export"): export_model(model, Device.DEFAULT.lower(), batch_input(8, 1, 28, 28))
+    print(profiler.summary())
+    print(f"trace written to {profiler.save(OUT)}")
@@ -0,0 +1,165 @@
+#! /usr/bin/env python3
+# vim:fenc=utf-8
+#
+# Copyright (C) 2025 Stanley Arnaud <stantonik@stantonik-mba.local>
+#
+# Distributed under terms of the MIT license.
+
+from pathlib import Path
+from tinygrad import Tensor, TinyJit, dtypes, nn
+from tinygrad.device import Device
+from tinygrad.helpers import getenv
+from tinygrad.nn.state import get_state_dict, safe_save
+from dataset import mnist
+from export_model import batch_input, export_model
+from fold import fold_batchnorm
+from predict import load_model
+from utils import normalize, write_manifest
+import json
+import numpy as np
+import time
+
+VARIANTS = ("fp32", "fp16", "int8")
+CLIPS = (1.0, 0.999, 0.995, 0.99, 0.98, 0.95)  # candidate fractions of the per-channel max, picked by calibration
+
+# -----------------
+# Layers
+# -----------------
+# weight-only int8, one scale per output channel; weights are dequantized inside the kernel so the
+# stored (and downloaded) buffers stay int8 while the math stays in the activation dtype
+def quantize_weight(w: Tensor, clip: float) -> tuple[Tensor, Tensor]:
+    absmax = w.abs().reshape(w.shape[0], -1).max(axis=1) * clip
+    scale = (absmax / 127).maximum(1e-12)
+    q = (w / scale.reshape(-1, *[1] * (w.ndim - 1))).round().clip(-127, 127).cast(dtypes.int8)
+    return q.contiguous().realize(), scale.contiguous().realize()
+
+class QuantLinear:
+    def __init__(self, layer: nn.Linear, clip: float = 1.0):
+        self.weight, self.scale = quantize_weight(layer.weight, clip)
+        self.bias = layer.bias
+
+    def dequantized(self, dtype=dtypes.float) -> Tensor: return self.weight.cast(dtype) * self.scale.cast(dtype).reshape(-1, 1)
+    def __call__(self, x: Tensor) -> Tensor: return x.linear(self.dequantized(x.dtype).transpose(), self.bias)
+
+class QuantConv2d:
+    def __init__(self, layer: nn.Conv2d, clip: float = 1.0):
+        self.weight, self.scale = quantize_weight(layer.weight, clip)
+        self.bias, self.groups, self.stride, self.dilation, self.padding = layer.bias, layer.groups, layer.stride, layer.dilation, layer.padding
+
+    def dequantized(self, dtype=dtypes.float) -> Tensor: return self.weight.cast(dtype) * self.scale.cast(dtype).reshape(-1, 1, 1, 1)
+    def __call__(self, x: Tensor) -> Tensor: return x.conv2d(self.dequantized(x.dtype), self.bias, self.groups, self.stride, self.dilation, self.padding)
+
+QUANT_LAYERS = {nn.Linear: QuantLinear, nn.Conv2d: QuantConv2d}
+
+# keeps the float32 input/output of the exported net (the app feeds a Float32Array) around an fp16 body
+class Half:
+    def __init__(self, model): self.model = model
+    def __call__(self, x: Tensor) -> Tensor: return self.model(x.cast(dtypes.half)).cast(dtypes.float)
+
+# -----------------
+# Quantization
+# -----------------
+def calibrate_int8(model, X_calib: Tensor) -> list[float]:
+    # walks the layers on the calibration slice, each layer keeps the clip with the lowest output error;
+    # the float activations are propagated so one layer's choice does not bias the next
+    x, clips = normalize(X_calib), []
+    for i, layer in enumerate(model.layers):
+        if (quant := QUANT_LAYERS.get(type(layer))) is not None:
+            ref = layer(x).realize()
+            errors = [((quant(layer, clip)(x) - ref) ** 2).mean().item() for clip in CLIPS]
+            clips.append(CLIPS[int(np.argmin(errors))])
+            model.layers[i] = quant(layer, clips[-1])
+            x = ref
+        else:
+            x = layer(x).realize()
+    return clips
+
+def to_half(model):
+    for v in get_state_dict(model).values():
+        if v.dtype == dtypes.float: v.replace(v.cast(dtypes.half).contiguous().realize())
+    return Half(model)
+
+def quantize(model, variant: str, X_calib: Tensor) -> tuple[object, dict]:
+    if variant == "fp16": return to_half(model), {}
+    if variant == "int8": return model, dict(clips=calibrate_int8(model, X_calib))
+    return model, {}
+
+# -----------------
+# Report
+# -----------------
+def test_logits(model, X_test: Tensor, chunk: int = 1000) -> np.ndarray:
+    @TinyJit
+    def forward(X: Tensor) -> Tensor: return model(normalize(X)).float().realize()
+    return np.concatenate([forward(X_test[i:i + chunk].contiguous()).numpy() for i in range(0, len(X_test), chunk)])
+
+def weight_bytes(model) -> int: return sum(v.nbytes() for v in get_state_dict(model).values())
+
+def latency_ms(model, batch_size: int, runs: int = 20) -> float:
+    @TinyJit
+    def forward(X: Tensor) -> Tensor: return model(normalize(X)).realize()
+    X = Tensor.zeros(batch_size, 1, 28, 28, dtype=dtypes.uint8).contiguous().realize()
+    for _ in range(3): forward(X)
+    times = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        forward(X).numpy()
+        times.append(time.perf_counter() - start)
+    return float(np.median(times) * 1000)
+
+def export_webgpu(model, out: Path, name: str):
+    # same steps as train.py's cvt_webgpu, only where the WebGPU backend is available
+    device = Device.DEFAULT
+    Device.DEFAULT = "WEBGPU"
+    try:
+        prg, *_, state = export_model(model, "webgpu", batch_input(getenv("EXPORT_BATCH", 64), 1, 28, 28), model_name=name, stream_weights=bool(getenv("STREAM_WEIGHTS", 1)))
+        safe_save(state, str(out / f"{name}.webgpu.safetensors"))
+        (out / f"{name}.js").write_text(prg)
+        write_manifest(out, name)
+    finally:
+        Device.DEFAULT = device
+
+if __name__ == "__main__":
+    TYPE = getenv("TYPE", "mlp").lower()
+    name = "mnist_mlp" if TYPE == "mlp" else "mnist_convnet"
+    MODEL = Path(getenv("MODEL", f"../app/public/models/{name}/{name}.safetensors"))
+    VARIANT_LIST = [v.strip() for v in getenv("VARIANTS", ",".join(VARIANTS)).split(",")]
+    CALIB = int(getenv("CALIB", 1024))      # training images used for calibration
+    OUT = Path(getenv("OUT", "quantized")) / name
+    WEBGPU = getenv("WEBGPU", 0)            # also export the .js / .webgpu.safetensors pair for the app
+
+    ACT_FN = getenv("ACT_FN", "silu").lower()
+    ACT_FN = Tensor.silu if ACT_FN == "silu" else Tensor.relu
+
+    X_train, _, X_test, Y_test = mnist()
+    X_calib = X_train[:CALIB].contiguous().realize()
+    OUT.mkdir(parents=True, exist_ok=True)
+
+    report, labels, reference = [], Y_test.numpy(), test_logits(load_model(MODEL, ACT_FN)[0], X_test)
+    for variant in VARIANT_LIST:
+        assert variant in VARIANTS, f"unknown variant {variant}, expected one of {VARIANTS}"
+        model = load_model(MODEL, ACT_FN)[0]
+        fold_batchnorm(model)  # before quantizing, so the folded weights are the ones calibrated
+        model, info = quantize(model, variant, X_calib)
+        logits = test_logits(model, X_test)
+        report.append(dict(
+            variant=variant,
+            accuracy=float((logits.argmax(1) == labels).mean() * 100),
+            agreement=float((logits.argmax(1) == reference.argmax(1)).mean() * 100),  # same top-1 as the fp32 model
+            max_logit_error=float(np.abs(logits - reference).max()),
+            bytes=weight_bytes(model),
+            latency_ms_b1=latency_ms(model, 1),
+            latency_ms_b128=latency_ms(model, 128),
+            **info,
+        ))
+
+        variant_name = f"{name}.{variant}"
+        safe_save(get_state_dict(model), str(OUT / f"{variant_name}.safetensors"))
+        if WEBGPU: export_webgpu(model, OUT, variant_name)
+
+    base = report[0]
+    print(f"{'variant':8s} {'accuracy':>9s} {'delta':>7s} {'agree':>8s} {'logit err':>10s} {'size':>10s} {'ratio':>6s} {'b=1 ms':>8s} {'b=128 ms':>9s}")
+    for r in report:
+        print(f"{r['variant']:8s} {r['accuracy']:8.2f}% {r['accuracy'] - base['accuracy']:+6.2f}% {r['agreement']:7.2f}% {r['max_logit_error']:10.4f} "
+              f"{r['bytes'] / 1024:8.1f}KB {r['bytes'] / base['bytes']:6.2f} {r['latency_ms_b1']:8.3f} {r['latency_ms_b128']:9.3f}")
+    (OUT / "report.json").write_text(json.dumps(report, indent=2))
+    print(f"artifacts and report.json in {OUT}")
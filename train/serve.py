@@ -0,0 +1,185 @@
+#! /usr/bin/env python3
+# vim:fenc=utf-8
+#
+# Copyright (C) 2025 Stanley Arnaud <stantonik@stantonik-mba.local>
+#
+# Distributed under terms of the MIT license.
+
+from collections import deque
+from concurrent.futures import Future
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from queue import Empty, Queue
+from socketserver import ThreadingMixIn, UnixStreamServer
+from tinygrad import Tensor, TinyJit
+from tinygrad.helpers import getenv
+from predict import load_model, to_u8
+from utils import normalize
+import json
+import numpy as np
+import os
+import threading
+import time
+
+# Coalesces concurrent requests into micro-batches. A single worker thread owns tinygrad (it is not
+# thread safe): it waits for the first request, then keeps collecting until the largest bucket is
+# full or max_delay has passed since that first arrival, and runs the smallest bucket that fits
+class Batcher:
+    def __init__(self, model, buckets: tuple[int, ...] = (1, 8, 32, 128), max_delay: float = 0.005, window: int = 10000):
+        self.buckets, self.max_delay = sorted(buckets), max_delay
+        self.queue: Queue = Queue()
+        self.latencies: deque = deque(maxlen=window)
+        self.batch_sizes: dict[int, int] = {b: 0 for b in self.buckets}
+        self.requests, self.served, self.start = 0, 0, time.perf_counter()  # totals since start / reset_stats
+        self.lock = threading.Lock()
+
+        # one JIT per bucket, compiled up front so no request pays for it
+        def forward(X: Tensor) -> tuple[Tensor, Tensor]:
+            logits = model(normalize(X))
+            return logits.realize(), logits.argmax(axis=1).realize()
+        self.forward = {b: TinyJit(forward) for b in self.buckets}
+        for b, jit in self.forward.items():
+            for _ in range(2): jit(Tensor.zeros(b, 1, 28, 28, dtype="uint8").contiguous())
+
+        self.worker = threading.Thread(target=self._serve, daemon=True)
+        self.worker.start()
+
+    def submit(self, X: np.ndarray) -> Future:
+        future: Future = Future()
+        self.queue.put((to_u8(X), future, time.perf_counter()))
+        return future
+
+    def _collect(self) -> list:
+        first = self.queue.get()
+        pending, n, deadline = [first], len(first[0]), first[2] + self.max_delay
+        while n < self.buckets[-1]:
+            try: item = self.queue.get(timeout=max(0.0, deadline - time.perf_counter()))
+            except Empty: break
+            pending.append(item)
+            n += len(item[0])
+        return pending
+
+    def _serve(self):
+        while True:
+            pending = self._collect()
+            X = np.concatenate([x for x, *_ in pending])
+            try: logits, preds = self._run(X)
+            except Exception as e:
+                for _, future, _ in pending: future.set_exception(e)
+                continue
+
+            done, offset = time.perf_counter(), 0
+            with self.lock:
+                for x, future, arrived in pending:
+                    future.set_result((logits[offset:offset + len(x)], preds[offset:offset + len(x)]))
+                    self.latencies.append(done - arrived)
+                    offset += len(x)
+                self.requests += len(pending)
+                self.served += len(X)
+
+    def _run(self, X: np.ndarray) -> tuple[np.ndarray, np.ndarray]:
+        logits, preds = [], []
+        for start in range(0, len(X), self.buckets[-1]):  # an oversized request is split over full buckets
+            part = X[start:start + self.buckets[-1]]
+            b = next(b for b in self.buckets if b >= len(part))
+            padded = np.concatenate([part, np.zeros((b - len(part), 28, 28), np.uint8)]) if b > len(part) else part
+            out, pred = self.forward[b](Tensor(padded.reshape(b, 1, 28, 28)))
+            logits.append(out.numpy()[:len(part)])
+            preds.append(pred.numpy()[:len(part)])
+            self.batch_sizes[b] += 1
+        return np.concatenate(logits), np.concatenate(preds)
+
+    def stats(self) -> dict:
+        with self.lock:
+            lat = np.array(self.latencies) * 1000
+            requests, served, elapsed = self.requests, self.served, time.perf_counter() - self.start
+        # the percentiles cover only the last `window` requests, the counts and throughput everything since start
+        return dict(
+            requests=requests, samples=served, samples_per_s=served / elapsed,
+            window_requests=len(lat),
+            window_p50_ms=float(np.percentile(lat, 50)) if len(lat) else None,
+            window_p99_ms=float(np.percentile(lat, 99)) if len(lat) else None,
+            batches=dict(self.batch_sizes),
+        )
+
+    def reset_stats(self):
+        with self.lock:
+            self.latencies.clear()
+            self.batch_sizes = {b: 0 for b in self.buckets}
+            self.requests, self.served, self.start = 0, 0, time.perf_counter()
+
+# -----------------
+# HTTP
+# -----------------
+# POST /predict   raw uint8 pixels (n * 784 bytes, application/octet-stream) or JSON {"images": [[784 values in [0, 1]], ...]}
+# GET  /stats     latency percentiles, throughput and bucket usage since start (or the last POST /stats/reset)
+class Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"  # keep-alive, the load generator reuses its connection
+    batcher: Batcher
+
+    def _reply(self, code: int, body: dict):
+        data = json.dumps(body).encode()
+        self.send_response(code)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def do_GET(self):
+        if self.path == "/stats": self._reply(200, self.batcher.stats())
+        else: self._reply(404, dict(error="not found"))
+
+    def do_POST(self):
+        body = self.rfile.read(int(self.headers.get("Content-Length", 0)))
+        if self.path == "/stats/reset":
+            self.batcher.reset_stats()
+            return self._reply(200, {})
+        if self.path != "/predict": return self._reply(404, dict(error="not found"))
+        try:
+            if self.headers.get("Content-Type") == "application/json": X = np.array(json.loads(body)["images"], dtype=np.float32)
+            else: X = np.frombuffer(body, dtype=np.uint8)
+            X = X.reshape(-1, 28, 28)  # floats (JSON) are [0, 1] intensities, like predict.py
+            if not len(X): raise ValueError("no images")
+        except (ValueError, KeyError, TypeError) as e:  # TypeError: JSON that is not an object
+            return self._reply(400, dict(error=str(e)))
+        try: logits, preds = self.batcher.submit(X).result()
+        except Exception as e: return self._reply(500, dict(error=str(e)))
+        self._reply(200, dict(predictions=preds.tolist(), logits=logits.tolist()))
+
+    def address_string(self) -> str: return str(self.client_address[0]) if self.client_address else "unix"
+    def log_message(self, format, *args): pass
+
+class ThreadingUnixHTTPServer(ThreadingMixIn, UnixStreamServer):
+    daemon_threads = True
+
+def make_server(batcher: Batcher, host: str = "127.0.0.1", port: int = 8000, socket: str = ""):
+    # no Nagle on TCP, headers and body go out as separate writes and would wait on the client's delayed ack
+    handler = type("BoundHandler", (Handler,), dict(batcher=batcher, disable_nagle_algorithm=not socket))
+    if socket:
+        if os.path.exists(socket): os.unlink(socket)
+        return ThreadingUnixHTTPServer(socket, handler)
+    server = ThreadingHTTPServer((host, port), handler)
+    server.daemon_threads = True
+    return server
+
+if __name__ == "__main__":
+    TYPE = getenv("TYPE", "mlp").lower()
+    name = "mnist_mlp" if TYPE == "mlp" else "mnist_convnet"
+    MODEL = Path(getenv("MODEL", f"../app/public/models/{name}/{name}.safetensors"))
+    BUCKETS = tuple(int(b) for b in getenv("BUCKETS", "1,8,32,128").split(","))
+    MAX_DELAY_MS = float(getenv("MAX_DELAY_MS", 5.0))
+    HOST, PORT = getenv("HOST", "127.0.0.1"), int(getenv("PORT", 8000))
+    SOCKET = getenv("SOCKET", "")
+
+    ACT_FN = getenv("ACT_FN", "silu").lower()
+    ACT_FN = Tensor.silu if ACT_FN == "silu" else Tensor.relu
+
+    model, model_type = load_model(MODEL, ACT_FN)
+    batcher = Batcher(model, BUCKETS, MAX_DELAY_MS / 1000)
+    server = make_server(batcher, HOST, PORT, SOCKET)
+    print(f"{model_type.name} from {MODEL}, buckets {BUCKETS}, max delay {MAX_DELAY_MS} ms, listening on {SOCKET or f'http://{HOST}:{PORT}'}")
+    try: server.serve_forever()
+    except KeyboardInterrupt: pass
+    finally:
+        server.server_close()
+        print(json.dumps(batcher.stats()))
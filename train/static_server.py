@@ -0,0 +1,83 @@
+#! /usr/bin/env python3
+# vim:fenc=utf-8
+#
+# Copyright (C) 2025 Stanley Arnaud <stantonik@stantonik-mba.local>
+#
+# Distributed under terms of the MIT license.
+
+from functools import partial
+from http.server import SimpleHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from tinygrad.helpers import getenv
+import os
+import re
+import time
+
+# static file server with single Range requests (http.server has none), to test the streamed weight loading
+# locally; THROTTLE_KBPS and LATENCY_MS make it behave like a slow network
+
+class RangeHandler(SimpleHTTPRequestHandler):
+    def __init__(self, *args, base: str = "/", latency: float = 0.0, throttle: float = 0.0, **kwargs):
+        self.base, self.latency, self.throttle = base, latency, throttle
+        super().__init__(*args, **kwargs)
+
+    def translate_path(self, path: str) -> str:
+        # the built app lives under its vite base (/mnist/)
+        if path.startswith(self.base): path = "/" + path[len(self.base):]
+        return super().translate_path(path)
+
+    def end_headers(self):
+        self.send_header("Accept-Ranges", "bytes")
+        super().end_headers()
+
+    def copyfile(self, source, outputfile):
+        # only the requested bytes, in throttled blocks
+        remaining = getattr(self, "remaining", None)
+        while remaining is None or remaining > 0:
+            block = source.read(64 * 1024 if remaining is None else min(64 * 1024, remaining))
+            if not block: break
+            outputfile.write(block)
+            if remaining is not None: remaining -= len(block)
+            if self.throttle > 0: time.sleep(len(block) / (self.throttle * 1024))
+
+    def send_head(self):
+        if self.latency > 0: time.sleep(self.latency)
+        self.remaining = None
+        match = re.fullmatch(r"bytes=(\d*)-(\d*)", self.headers.get("Range", "").strip())
+        path = self.translate_path(self.path)
+        if match is None or not os.path.isfile(path): return super().send_head()
+
+        size = os.path.getsize(path)
+        start, end = match.groups()
+        if start: start, end = int(start), min(int(end) if end else size - 1, size - 1)
+        elif end: start, end = max(size - int(end), 0), size - 1  # suffix range, the last N bytes
+        else: return super().send_head()
+        if start > end or start >= size:
+            self.send_response(416)
+            self.send_header("Content-Range", f"bytes */{size}")
+            self.send_header("Content-Length", "0")
+            self.end_headers()
+            return None
+
+        f = open(path, "rb")
+        f.seek(start)
+        self.remaining = end - start + 1
+        self.send_response(206)
+        self.send_header("Content-Type", self.guess_type(path))
+        self.send_header("Content-Range", f"bytes {start}-{end}/{size}")
+        self.send_header("Content-Length", str(self.remaining))
+        self.end_headers()
+        return f
+
+if __name__ == "__main__":
+    ROOT = Path(getenv("ROOT", "../app/dist"))  # npm run build; ../app/public serves the models alone
+    BASE = getenv("BASE", "/mnist/")
+    HOST = getenv("HOST", "127.0.0.1")
+    PORT = int(getenv("PORT", 8000))
+    LATENCY_MS = float(getenv("LATENCY_MS", 0.0))
+    THROTTLE_KBPS = float(getenv("THROTTLE_KBPS", 0.0))
+
+    handler = partial(RangeHandler, directory=str(ROOT), base=BASE, latency=LATENCY_MS / 1000, throttle=THROTTLE_KBPS)
+    server = ThreadingHTTPServer((HOST, PORT), handler)
+    print(f"serving {ROOT} at http://{HOST}:{server.server_address[1]}{BASE}")
+    server.serve_forever()
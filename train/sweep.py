@@ -0,0 +1,171 @@
+#! /usr/bin/env python3
+# vim:fenc=utf-8
+#
+# Copyright (C) 2025 Stanley Arnaud <stantonik@stantonik-mba.local>
+#
+# Distributed under terms of the MIT license.
+
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from dataclasses import dataclass, fields
+from pathlib import Path
+from typing import Callable, Iterator, Optional
+import hashlib
+import json
+import math
+import multiprocessing
+import pickle
+import shutil
+import tempfile
+import time
+
+import dataset
+import models
+from trainlog import RunLog
+from utils import HPConfig, train_steps
+
+TrainFn = Callable[..., RunLog]
+
+def config_key(type: models.Type, cfg: HPConfig) -> str:
+    # repr() of callables embeds memory addresses, so hash their names instead
+    values = {f.name: getattr(getattr(cfg, f.name), "__name__", getattr(cfg, f.name)) for f in fields(cfg)}
+    values["type"] = type.name
+    return hashlib.sha1(json.dumps(values, sort_keys=True, default=str).encode()).hexdigest()[:16]
+
+def _init_worker(device: Optional[str]):
+    # runs in a fresh (spawned) process before tinygrad opens any device
+    if device is not None:
+        from tinygrad.device import Device
+        Device.DEFAULT = device
+
+def _run(train_model: TrainFn, type: models.Type, cfg: HPConfig, **kwargs) -> RunLog:
+    return train_model(type=type, cfg=cfg, cvt_webgpu=False, **kwargs)
+
+def _save(path: Path, logs):
+    tmp = path.with_suffix(".tmp")
+    with open(tmp, "wb") as f: pickle.dump(logs, f)
+    tmp.replace(path)  # atomic, a crash never leaves a half written result behind
+
+def iter_sweep(type: models.Type, configs: list[HPConfig], train_model: TrainFn, workers: int = 1,
+               resume_dir: Optional[Path] = None, device: Optional[str] = None) -> Iterator[tuple[int, RunLog]]:
+    # yields (config index, log) in completion order. With a resume_dir the logs are written next to the results,
+    # which only keep their path
+    pending = list(range(len(configs)))
+
+    if resume_dir is not None:
+        resume_dir = Path(resume_dir)
+        resume_dir.mkdir(parents=True, exist_ok=True)
+        done = [i for i in pending if (resume_dir / f"{config_key(type, configs[i])}.pkl").exists()]
+        if done: print(f"Resuming sweep from {resume_dir}: {len(done)}/{len(configs)} runs already done")
+        for i in done:
+            with open(resume_dir / f"{config_key(type, configs[i])}.pkl", "rb") as f: yield i, pickle.load(f)
+        pending = [i for i in pending if i not in done]
+
+    runs = {i: (configs[i], {} if resume_dir is None else dict(log_path=resume_dir / f"{config_key(type, configs[i])}.log")) for i in pending}
+    for i, log in _iter_runs(type, runs, train_model, workers, device):
+        if resume_dir is not None: _save(resume_dir / f"{config_key(type, configs[i])}.pkl", log)
+        print(f"Sweep: run {i + 1}/{len(configs)} done (best: {log.best_acc:.2f}%)")
+        yield i, log
+
+def _iter_runs(type: models.Type, runs: dict[int, tuple[HPConfig, dict]], train_model: TrainFn, workers: int = 1,
+               device: Optional[str] = None) -> Iterator[tuple[int, RunLog]]:
+    # train_model(cfg, **kwargs) for every run, yields (run key, log) in completion order
+    if workers <= 1 or len(runs) <= 1:
+        for i, (cfg, kwargs) in runs.items(): yield i, _run(train_model, type, cfg, **kwargs)
+        return
+
+    dataset.prepare()  # decode once here, workers then only map the cached files
+    workers = min(workers, len(runs))
+    ctx = multiprocessing.get_context("spawn")  # fork does not play well with initialized tinygrad devices
+    with ProcessPoolExecutor(max_workers=workers, mp_context=ctx, initializer=_init_worker, initargs=(device,)) as pool:
+        futures = {pool.submit(_run, train_model, type, cfg, **kwargs): i for i, (cfg, kwargs) in runs.items()}
+        for future in as_completed(futures):
+            yield futures[future], future.result()
+
+def run_sweep(type: models.Type, configs: list[HPConfig], train_model: TrainFn, workers: int = 1,
+              resume_dir: Optional[Path] = None, device: Optional[str] = None) -> list[RunLog]:
+    # gathers every run, logs are returned in the same order as `configs`
+    results: list[Optional[RunLog]] = [None] * len(configs)
+    for i, log in iter_sweep(type, configs, train_model, workers, resume_dir, device): results[i] = log
+    return results
+
+@dataclass
+class HalvingConfig:
+    eta: int = 2                # 1/eta of the configs is promoted at every rung
+    rungs: int = 0              # 0 picks enough rungs to end with a single config
+    budget_steps: int = 0       # if > 0, total training steps (all configs) the sweep may spend
+    budget_secs: float = 0.0    # if > 0, wall time the sweep may spend
+
+def rung_steps(total: int, eta: int, rungs: int) -> list[int]:
+    # cumulative steps at the end of every rung, the last one is the full run
+    return [max(1, math.ceil(total / eta ** (rungs - 1 - r))) for r in range(rungs)]
+
+def _score(log: RunLog) -> float: return log.best_acc
+
+def _budget_left(halving: HalvingConfig, cost: int, spent_steps: int, run_steps: int, elapsed: float) -> float:
+    # the fraction of `cost` more steps the budget still covers, time is estimated from the steps/s measured so far
+    left = [1.0]
+    if halving.budget_steps > 0: left.append((halving.budget_steps - spent_steps) / max(cost, 1))
+    if halving.budget_secs > 0 and run_steps > 0: left.append((halving.budget_secs - elapsed) / max(cost * elapsed / run_steps, 1e-9))
+    return min(left)
+
+def halving_sweep(type: models.Type, configs: list[HPConfig], train_model: TrainFn, halving: HalvingConfig = HalvingConfig(),
+                  workers: int = 1, resume_dir: Optional[Path] = None, device: Optional[str] = None) -> list[RunLog]:
+    # Successive halving: every config trains to the first rung, only the top 1/eta (by best_acc) continue
+    # to the next one from where they stopped, and so on until the full run. Returns the logs in the same
+    # order as `configs`, cut configs only have the steps they got: every slice appends to the config's log.
+    # A spent budget ends the sweep early, the leader so far wins
+    n_train = len(dataset.mnist_arrays()[0])
+    rungs = halving.rungs or int(math.log(len(configs), halving.eta) + 1e-9) + 1
+    targets = [rung_steps(train_steps(cfg, n_train), halving.eta, rungs) for cfg in configs]
+    logs = [RunLog({}).close() for _ in configs]
+    done = [0] * len(configs)
+    spent_steps, run_steps, start = 0, 0, time.time()  # run_steps: trained by this call, resumed slices cost no time
+
+    tmp = None
+    if resume_dir is None: resume_dir = Path(tmp := tempfile.mkdtemp(prefix="halving-"))
+    resume_dir = Path(resume_dir)
+    resume_dir.mkdir(parents=True, exist_ok=True)
+    # slices, states and logs are only reused under the same schedule, another budget or eta starts over
+    schedule = hashlib.sha1(json.dumps([halving.eta, rungs, halving.budget_steps, halving.budget_secs]).encode()).hexdigest()[:8]
+    keys = [f"{config_key(type, cfg)}-{schedule}" for cfg in configs]
+
+    alive = list(range(len(configs)))
+    for r in range(rungs):
+        if r > 0:
+            keep = max(1, math.ceil(len(alive) / halving.eta))
+            alive = sorted(alive, key=lambda i: _score(logs[i]), reverse=True)[:keep]
+        stops = {i: targets[i][r] for i in alive}
+
+        cached = [i for i in alive if (resume_dir / f"{keys[i]}.rung{r}.pkl").exists()]
+        if cached: print(f"Resuming rung {r + 1}/{rungs} from {resume_dir}: {len(cached)}/{len(alive)} runs already done")
+        for i in cached:
+            prev = done[i]
+            with open(resume_dir / f"{keys[i]}.rung{r}.pkl", "rb") as f: logs[i], done[i] = pickle.load(f)
+            spent_steps, stops[i] = spent_steps + done[i] - prev, done[i]
+
+        pending, ran = [i for i in alive if i not in cached], bool(cached)
+        while pending:
+            # shrink the rest of the rung to what is left of the budget. The time budget needs a measured steps/s:
+            # until a run has finished, runs go one at a time
+            left = _budget_left(halving, sum(stops[i] - done[i] for i in pending), spent_steps, run_steps, time.time() - start)
+            if left < 1: stops.update({i: done[i] + int((stops[i] - done[i]) * max(left, 0)) for i in pending})
+            group = pending[:1] if halving.budget_secs > 0 and run_steps == 0 else pending
+            pending = pending[len(group):]
+            runs = {i: (configs[i], dict(stop_step=stops[i], state_path=resume_dir / f"{keys[i]}.state.safetensors", log_path=resume_dir / f"{keys[i]}.log"))
+                    for i in group if stops[i] > done[i]}
+            for i, new in _iter_runs(type, runs, train_model, workers, device):
+                run_steps += stops[i] - done[i]
+                logs[i], spent_steps, done[i], ran = new, spent_steps + stops[i] - done[i], stops[i], True
+                _save(resume_dir / f"{keys[i]}.rung{r}.pkl", (logs[i], done[i]))
+                print(f"Halving: rung {r + 1}/{rungs}, run {i + 1}/{len(configs)} at step {done[i]} (best: {_score(logs[i]):.2f}%)")
+
+        if any(stops[i] < targets[i][r] for i in alive):
+            print(f"Halving: budget spent {'during' if ran else 'before'} rung {r + 1}/{rungs}")
+            break
+
+    best = max(alive, key=lambda i: _score(logs[i]))
+    print(f"Halving: run {best + 1}/{len(configs)} wins with {_score(logs[best]):.2f}%, {spent_steps} steps in {time.time() - start:.0f} s")
+    if tmp is not None:
+        logs = [log.load() for log in logs]  # the files go with the temporary folder
+        shutil.rmtree(tmp, ignore_errors=True)
+    return logs
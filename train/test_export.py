@@ -0,0 +1,47 @@
+#! /usr/bin/env python3
+# vim:fenc=utf-8
+#
+# Copyright (C) 2025 Stanley Arnaud <stantonik@stantonik-mba.local>
+#
+# Distributed under terms of the MIT license.
+
+from tinygrad import Tensor
+from tinygrad.device import Device
+from tinygrad.helpers import getenv
+from verify_export import TARGETS, reference
+import models
+import numpy as np
+import pytest
+import shutil
+
+# verify_export.py as tests: every export target against batched tinygrad inference, on freshly initialized
+# models (no trained weights needed). Targets whose backend or compiler is missing are skipped
+
+MAX_BATCH, TOL = 16, 1e-3
+BATCHES = [1, 7, MAX_BATCH, MAX_BATCH * 2 + 3]
+MODELS = {"mlp": lambda: models.MLP(width=64, depth=2), "conv": lambda: models.Conv(activation_fn=Tensor.silu)}
+
+def missing(target: str) -> str:
+    available = list(Device.get_available_devices())
+    if target == "webgpu": return "" if "WEBGPU" in available else "no WEBGPU device"
+    if "CPU" not in available: return "no CPU device"
+    return "" if shutil.which(getenv("CC", "cc")) else "no C compiler"
+
+@pytest.fixture(scope="module", params=list(MODELS))
+def model(request):
+    Tensor.manual_seed(0)
+    return MODELS[request.param]()
+
+@pytest.fixture(scope="module")
+def images() -> np.ndarray: return np.random.default_rng(0).integers(0, 256, (max(BATCHES), 1, 28, 28), dtype=np.uint8)
+
+@pytest.mark.parametrize("target", list(TARGETS))
+def test_export(model, images, target, tmp_path):
+    if reason := missing(target): pytest.skip(reason)
+    run = TARGETS[target](model, MAX_BATCH, tmp_path)
+    if run is None: return  # webgpu: the program is checked, it only runs in a browser
+    for b in BATCHES:
+        # the C net() takes at most MAX_BATCH at once, the native one loops over chunks
+        if target == "clang" and b > MAX_BATCH: continue
+        err = float(np.abs(run(images[:b]) - reference(model, images[:b])).max())
+        assert err <= TOL, f"{target} batch {b}: max logit difference {err:.2e}"
@@ -0,0 +1,41 @@
+#! /usr/bin/env python3
+# vim:fenc=utf-8
+#
+# Copyright (C) 2025 Stanley Arnaud <stantonik@stantonik-mba.local>
+#
+# Distributed under terms of the MIT license.
+
+from pathlib import Path
+from predict import predict
+import gzip
+import models
+import numpy as np
+import pytest
+
+# predict.py over every input format: same images, same predictions, ids by sample index
+
+N, BATCH = 10, 4  # a ragged last batch
+
+@pytest.fixture(scope="module")
+def images() -> np.ndarray: return np.random.default_rng(0).integers(0, 256, (N, 28, 28), dtype=np.uint8)
+
+@pytest.fixture(scope="module")
+def model(): return models.MLP(width=32, depth=2)
+
+def write_idx(path: Path, X: np.ndarray):
+    with gzip.open(path, "wb") as f: f.write(bytes([0, 0, 0x08, 3]) + b"".join(d.to_bytes(4, "big") for d in X.shape) + X.tobytes())
+
+@pytest.fixture(scope="module")
+def expected(model, images, tmp_path_factory) -> np.ndarray:
+    tmp = tmp_path_factory.mktemp("idx")
+    write_idx(tmp / "images.idx.gz", images)
+    predict(model, tmp / "images.idx.gz", tmp / "out", BATCH)
+    return np.load(tmp / "out.logits.npy")
+
+@pytest.mark.parametrize("dtype", [np.uint8, np.float32])
+def test_npy(model, images, expected, tmp_path, dtype):
+    np.save(tmp_path / "images.npy", images if dtype == np.uint8 else images.astype(dtype) / 255)
+    predict(model, tmp_path / "images.npy", tmp_path / "out", BATCH)
+    np.testing.assert_allclose(np.load(tmp_path / "out.logits.npy"), expected, rtol=1e-5, atol=1e-5)
+    lines = (tmp_path / "out.csv").read_text().splitlines()
+    assert lines[0] == "id,prediction" and [l.split(",")[0] for l in lines[1:]] == [str(i) for i in range(N)]
@@ -0,0 +1,62 @@
+#! /usr/bin/env python3
+# vim:fenc=utf-8
+#
+# Copyright (C) 2025 Stanley Arnaud <stantonik@stantonik-mba.local>
+#
+# Distributed under terms of the MIT license.
+
+from dataclasses import replace
+from sweep import HalvingConfig, _budget_left, halving_sweep, rung_steps
+from train import train_model
+from utils import HPConfig
+import models
+import numpy as np
+import pytest
+
+# successive halving: the rung schedule, the budget and a tiny sweep resumed from its folder
+
+# 0.02 epochs of MNIST at batch 128 is 10 steps, 2 rungs of 5 and 10
+CFG = HPConfig(epochs=0.02, width=32, eval_every=3, sync_every=4)
+CONFIGS = [replace(CFG, lr=1e-3), replace(CFG, lr=1e-2)]
+
+def test_rung_steps():
+    assert rung_steps(10, 2, 2) == [5, 10]
+    assert rung_steps(469, 2, 2) == [235, 469]
+    assert rung_steps(100, 3, 3) == [12, 34, 100]
+    assert rung_steps(3, 2, 4) == [1, 1, 2, 3]  # every rung trains at least a step
+
+def test_budget_left():
+    assert _budget_left(HalvingConfig(), 1000, 500, 500, 10.0) == 1.0
+    assert _budget_left(HalvingConfig(budget_steps=100), 50, 75, 75, 1.0) == pytest.approx(0.5)
+    assert _budget_left(HalvingConfig(budget_steps=100), 50, 120, 120, 1.0) < 0
+    # no steps measured yet, the time budget cannot be estimated
+    assert _budget_left(HalvingConfig(budget_secs=10), 200, 0, 0, 5.0) == 1.0
+    # 20 steps/s, 200 more steps take 10 s and 5 s are left
+    assert _budget_left(HalvingConfig(budget_secs=10), 200, 100, 100, 5.0) == pytest.approx(0.5)
+    # resumed steps count against the step budget, only the trained ones set the rate
+    assert _budget_left(HalvingConfig(budget_steps=100, budget_secs=10), 50, 75, 100, 5.0) == pytest.approx(0.5)
+
+def test_halving_resume(tmp_path):
+    calls = []
+    def train(**kwargs):
+        calls.append(kwargs["stop_step"])
+        return train_model(**kwargs)
+
+    logs = halving_sweep(models.Type.MLP, CONFIGS, train, HalvingConfig(eta=2, rungs=2), resume_dir=tmp_path)
+    assert sorted(calls) == [5, 5, 10]
+    assert sorted(len(log) for log in logs) == [5, 10]
+    winner = max(logs, key=len)
+    # the second slice continued the first one: one log, consecutive steps, evaluated at the end of both slices
+    assert np.array_equal(winner.column("step"), np.arange(10))
+    assert {4, 9} <= set(winner.column("step", "evals").tolist())
+    assert all(log.best_acc > 0 for log in logs)
+
+    def fail(**kwargs): raise AssertionError("a finished slice was trained again")
+    resumed = halving_sweep(models.Type.MLP, CONFIGS, fail, HalvingConfig(eta=2, rungs=2), resume_dir=tmp_path)
+    assert [len(log) for log in resumed] == [len(log) for log in logs]
+    assert [log.best_acc for log in resumed] == [log.best_acc for log in logs]
+
+    # another budget is another schedule, nothing is reused
+    calls.clear()
+    halving_sweep(models.Type.MLP, CONFIGS, train, HalvingConfig(eta=2, rungs=2, budget_steps=10), resume_dir=tmp_path)
+    assert sorted(calls) == [5, 5]
@@ -0,0 +1,65 @@
+#! /usr/bin/env python3
+# vim:fenc=utf-8
+#
+# Copyright (C) 2025 Stanley Arnaud <stantonik@stantonik-mba.local>
+#
+# Distributed under terms of the MIT license.
+
+from trainlog import RunLog
+import numpy as np
+import pickle
+import pytest
+
+# RunLog written in small chunks, then read back from its files, in memory and after a resume
+
+META = dict(model="mnist_mlp", batch_size=128, width=512, depth=2, opt_name="Adam", precision="fp32")
+N, CHUNK = 11, 4  # rows cross two chunk boundaries
+
+def write(path, evals=True) -> RunLog:
+    log = RunLog(META, path, chunk=CHUNK)
+    for start in range(0, N, 3):  # extends of 3 rows against chunks of 4
+        steps = np.arange(start, min(start + 3, N))
+        log.extend(step=steps, train_loss=steps / 10, lr=np.full(len(steps), 1e-3), best_acc=steps * 1.0, time=steps * 0.5, eval_frac=np.zeros(len(steps)))
+        if evals and start % 2 == 0: log.add_eval(int(steps[-1]), 0.25, float(steps[-1]))
+    log.set_last(lr=5e-4)  # a decay after the last step
+    return log
+
+@pytest.mark.parametrize("in_memory", [False, True])
+def test_round_trip(tmp_path, in_memory):
+    log = write(None if in_memory else tmp_path / "run")
+    assert len(log) == N and log[-1].lr == pytest.approx(5e-4)  # readable while open
+    log.close()
+    if not in_memory:
+        log = RunLog.open(tmp_path / "run")
+        assert isinstance(log.column("train_loss"), np.memmap)
+    assert len(log) == N
+    np.testing.assert_array_equal(log.column("step"), np.arange(N))
+    np.testing.assert_allclose(log.column("train_loss"), np.arange(N) / 10, rtol=1e-6)
+    assert np.isnan(log.column("loss_scale")).all()
+    np.testing.assert_array_equal(log.column("step", "evals"), [2, 8])
+    assert log.best_acc == N - 1
+    last = log[-1]
+    assert (last.step, last.lr, last.test_acc, last.loss_scale, last.batch_size, last.opt_name) == (N - 1, pytest.approx(5e-4), None, None, 128, "Adam")
+    assert (log[2].test_loss, log[2].test_acc) == (0.25, 2.0)
+    assert [row.step for row in log] == list(range(N))
+    # pickles (sweep results) keep the row counts, not the rows
+    assert len(pickle.loads(pickle.dumps(log))) == N
+    assert len(log.load()) == N
+
+def test_no_evals(tmp_path):
+    write(tmp_path / "run", evals=False).close()
+    log = RunLog.open(tmp_path / "run")
+    assert len(log.column("test_acc", "evals")) == 0
+    assert log[-1].test_acc is None and log.best_acc == N - 1
+    assert RunLog({}).close().best_acc == 0.0
+
+def test_resume_truncates(tmp_path):
+    # a slice that crashed after step 8 resumes from step 6: the rows (and evals) from step 6 on are dropped
+    write(tmp_path / "run").close()
+    log = RunLog(META, tmp_path / "run", chunk=CHUNK, start_step=6)
+    log.extend(step=[6, 7], train_loss=[0.0, 0.0], lr=[1e-3, 1e-3], best_acc=[9.0, 9.0], time=[3.0, 3.5], eval_frac=[0.0, 0.0])
+    log.close()
+    log = RunLog.open(tmp_path / "run")
+    np.testing.assert_array_equal(log.column("step"), np.arange(8))
+    np.testing.assert_array_equal(log.column("step", "evals"), [2])
+    assert log.best_acc == 9.0
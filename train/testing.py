@@ -5,12 +5,21 @@
 #
 # Distributed under terms of the MIT license.
 
+from dataclasses import replace
+from pathlib import Path
 from tinygrad import Tensor, nn
+from sweep import HalvingConfig, halving_sweep, run_sweep
 from utils import HPConfig
 from matplotlib import pyplot as plt
 import numpy as np
 
-def mlp_testing(TYPE, TESTS, train_model):
+def sweep(TYPE, TESTS, train_model, configs, workers, halving=None):
+    resume_dir = Path("sweeps") / f"{TYPE.name.lower()}_tests{TESTS}"
+    # successive halving cuts the losing configs early, their logs stop where they were cut
+    if halving is not None: return halving_sweep(TYPE, configs, train_model, halving, workers=workers, resume_dir=resume_dir.with_name(resume_dir.name + "_halving"))
+    return run_sweep(TYPE, configs, train_model, workers=workers, resume_dir=resume_dir)
+
+def mlp_testing(TYPE, TESTS, train_model, workers=1, halving: HalvingConfig = None):
     # To Test
     lrs = [ 3e-4, 1e-3, 3e-3, 1e-2 ]
     depths = [ 2, 3 ]
@@ -22,10 +31,9 @@ def mlp_testing(TYPE, TESTS, train_model):
     config = HPConfig()
 
     if TESTS == 1:
-        for bs in batch_sizes:
-            config.batch_size = bs
-            logs = train_model(type=TYPE, cfg=config, cvt_webgpu=False)
-            plt.plot(list(map(lambda x: x.step, logs)), list(map(lambda x: x.train_loss, logs)), label=f"bs={config.batch_size}")
+        configs = [replace(config, batch_size=bs) for bs in batch_sizes]
+        for cfg, log in zip(configs, sweep(TYPE, TESTS, train_model, configs, workers, halving)):
+            plt.plot(log.column("step"), log.column("train_loss"), label=f"bs={cfg.batch_size}")
         plt.xlabel("Training Steps")
         plt.ylabel("Training Loss")
         plt.title("Training Loss vs Steps for Different Batch Sizes")
@@ -35,13 +43,10 @@ def mlp_testing(TYPE, TESTS, train_model):
         plt.show()
 
     if TESTS == 2:
+        configs = [replace(config, lr=lr, activation_fn=acti_fn) for acti_fn in activation_fns for lr in lrs]
+        results = iter(sweep(TYPE, TESTS, train_model, configs, workers, halving))
         for acti_fn in activation_fns:
-            best_acc = []
-            for lr in lrs:
-                config.lr = lr
-                config.activation_fn = acti_fn
-                logs = train_model(type=TYPE, cfg=config, cvt_webgpu=False)
-                best_acc.append(logs[-1].best_acc)
+            best_acc = [next(results).best_acc for _ in lrs]
             plt.plot(lrs, best_acc, label=f"{acti_fn.__name__}", linewidth=0.5)
         plt.xlabel("Learning Step")
         plt.ylabel("Training Accuracy")
@@ -53,13 +58,10 @@ def mlp_testing(TYPE, TESTS, train_model):
 
     if TESTS == 3:
         # LR and Optimizer
+        configs = [replace(config, lr=lr, opt=opt) for opt in opts for lr in lrs]
+        results = iter(sweep(TYPE, TESTS, train_model, configs, workers, halving))
         for opt in opts:
-            best_acc = []
-            for lr in lrs:
-                config.lr = lr
-                config.opt = opt
-                logs = train_model(type=TYPE, cfg=config, cvt_webgpu=False)
-                best_acc.append(logs[-1].best_acc)
+            best_acc = [next(results).best_acc for _ in lrs]
             plt.plot(lrs, best_acc, label=f"{opt.__name__}", linewidth=0.5)
         plt.xlabel("Learning Step")
         plt.ylabel("Training Accuracy")
@@ -80,18 +82,11 @@ def mlp_testing(TYPE, TESTS, train_model):
     opts = [ nn.optim.Adam, nn.optim.SGD ]
 
     if TESTS == 4:
+        configs = [replace(config, depth=depth, lr=lr, opt=opt) for depth in depths for opt in opts for lr in lrs]
+        results = iter(sweep(TYPE, TESTS, train_model, configs, workers, halving))
         for depth in depths:
             for opt in opts:
-                best_acc_list = []
-                for lr in lrs:
-                    # Update config
-                    config.depth = depth
-                    config.lr = lr
-                    config.opt = opt
-
-                    # Train and get logs
-                    logs = train_model(type=TYPE, cfg=config, cvt_webgpu=False)
-                    best_acc_list.append(logs[-1].best_acc)
+                best_acc_list = [next(results).best_acc for _ in lrs]
 
                 # Plot curve for this optimizer + depth
                 plt.plot(
@@ -128,11 +123,9 @@ def mlp_testing(TYPE, TESTS, train_model):
         best_accs = []
 
         # Run all final configs
-        for cfg in final_configs:
-            logs = train_model(type=TYPE, cfg=cfg, cvt_webgpu=False)
-
+        for cfg, log in zip(final_configs, sweep(TYPE, TESTS, train_model, final_configs, workers, halving)):
             # Best test accuracy
-            best_test_acc = max(log.test_acc for log in logs if log.test_acc is not None)
+            best_test_acc = log.best_acc  # 0.0 for a config cut before its first evaluation
             best_accs.append(best_test_acc)
 
             # Label for x-axis
@@ -175,7 +168,7 @@ def mlp_testing(TYPE, TESTS, train_model):
         plt.tight_layout()
         plt.show()
 
-def conv_testing(TYPE, TESTS, train_model):
+def conv_testing(TYPE, TESTS, train_model, workers=1, halving: HalvingConfig = None):
     # To Test
     lrs = [ 3e-4, 1e-3, 3e-3, 1e-2 ]
     batch_sizes = [ 64, 128, 256 ]
@@ -185,11 +178,8 @@ def conv_testing(TYPE, TESTS, train_model):
     config = HPConfig()
 
     if TESTS == 1:
-        best_acc = []
-        for bs in batch_sizes:
-            config.batch_size = bs
-            logs = train_model(type=TYPE, cfg=config, cvt_webgpu=False)
-            best_acc.append(logs[-1].best_acc)
+        configs = [replace(config, batch_size=bs) for bs in batch_sizes]
+        best_acc = [log.best_acc for log in sweep(TYPE, TESTS, train_model, configs, workers, halving)]
         plt.plot(batch_sizes, best_acc, linewidth=1)
         plt.xlabel("Batch Size")
         plt.ylabel("Best Accuracy")
@@ -199,13 +189,10 @@ def conv_testing(TYPE, TESTS, train_model):
         plt.show()
 
     if TESTS == 2:
+        configs = [replace(config, lr=lr, activation_fn=acti_fn) for acti_fn in activation_fns for lr in lrs]
+        results = iter(sweep(TYPE, TESTS, train_model, configs, workers, halving))
         for acti_fn in activation_fns:
-            best_acc = []
-            for lr in lrs:
-                config.lr = lr
-                config.activation_fn = acti_fn
-                logs = train_model(type=TYPE, cfg=config, cvt_webgpu=False)
-                best_acc.append(logs[-1].best_acc)
+            best_acc = [next(results).best_acc for _ in lrs]
             plt.plot(lrs, best_acc, label=f"{acti_fn.__name__}", linewidth=0.5)
         plt.xlabel("Learning Step")
         plt.ylabel("Training Accuracy")
@@ -217,13 +204,10 @@ def conv_testing(TYPE, TESTS, train_model):
 
     if TESTS == 3:
         # LR and Optimizer
+        configs = [replace(config, lr=lr, opt=opt) for opt in opts for lr in lrs]
+        results = iter(sweep(TYPE, TESTS, train_model, configs, workers, halving))
         for opt in opts:
-            best_acc = []
-            for lr in lrs:
-                config.lr = lr
-                config.opt = opt
-                logs = train_model(type=TYPE, cfg=config, cvt_webgpu=False)
-                best_acc.append(logs[-1].best_acc)
+            best_acc = [next(results).best_acc for _ in lrs]
             plt.plot(lrs, best_acc, label=f"{opt.__name__}", linewidth=0.5)
         plt.xlabel("Learning Step")
         plt.ylabel("Training Accuracy")
@@ -253,11 +237,9 @@ def conv_testing(TYPE, TESTS, train_model):
         best_accs = []
 
         # Run all final configs
-        for cfg in final_configs:
-            logs = train_model(type=TYPE, cfg=cfg, cvt_webgpu=False)
-
+        for cfg, log in zip(final_configs, sweep(TYPE, TESTS, train_model, final_configs, workers, halving)):
             # Best test accuracy
-            best_test_acc = max(log.test_acc for log in logs if log.test_acc is not None)
+            best_test_acc = log.best_acc  # 0.0 for a config cut before its first evaluation
             best_accs.append(best_test_acc)
 
             # Label for x-axis
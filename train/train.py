@@ -9,130 +9,267 @@ from pathlib import Path
 from mpl_toolkits.mplot3d.art3d import math
 from tinygrad import Tensor, TinyJit, nn
 from tinygrad.device import Device
-from tinygrad.helpers import getenv, trange
-from tinygrad.nn.datasets import mnist
+from tinygrad.helpers import getenv, tqdm
 from tinygrad.nn.state import get_state_dict, load_state_dict, safe_load, safe_save
-from export_model import export_model
+from tinygrad.uop.ops import UOp
+from augment import AugmentStore, affine_transform, random_affine
+from checkpoint import Checkpoint, load_state, run_id, save_state
+from dataset import mnist
+from evaluate import Evaluator
+from export_model import batch_input, export_model
+from fold import fold_batchnorm
+from loader import EpochLoader, StoreLoader
+from metrics import MetricsRing
+from parallel import DataParallel, launch, run_rank
+from precision import MixedPrecision, mixed_precision
+from profiler import profiler
+from trainlog import RunLog
 import models
+from sweep import HalvingConfig
 from testing import conv_testing, mlp_testing
-from utils import HPConfig, SamplingMod, TrainLog, geometric_transform, normalize
+from utils import HPConfig, SamplingMod, normalize, train_steps, write_manifest
 from matplotlib import pyplot as plt
+import shutil
 import time
+from typing import Optional
 plt.style.use("dark_background")
 
-def train_model(type: models.Type, cfg: HPConfig, cvt_webgpu=False) -> list[TrainLog]:
+def build_model(type: models.Type, cfg: HPConfig):
     if type == models.Type.MLP:
-        model = models.MLP(width=cfg.width, depth=cfg.depth, activation_fn=cfg.activation_fn)
-        model_name = "mnist_mlp"
+        return models.MLP(width=cfg.width, depth=cfg.depth, activation_fn=cfg.activation_fn), "mnist_mlp"
     elif type == models.Type.CONV:
-        model = models.Conv(activation_fn=cfg.activation_fn)
-        model_name = "mnist_convnet"
+        return models.Conv(activation_fn=cfg.activation_fn), "mnist_convnet"
+
+def schedule_step(opt, ring: MetricsRing, slot: UOp, loss: Tensor, amp: Optional[MixedPrecision] = None) -> list[Tensor]:
+    # the optimizer step and the metrics row (loss, lr and with mixed precision the loss scale)
+    with profiler.tag("optimizer"): scheduled = opt.schedule_step() if amp is None else amp.schedule_step(opt)
+    with profiler.tag("metrics"): return [*scheduled, ring.write(slot, loss, opt.lr, *([] if amp is None else [amp.scale]))]
+
+def make_step(model, opt, ring: MetricsRing, dp: Optional[DataParallel] = None, amp: Optional[MixedPrecision] = None):
+    # one optimizer step, the loss and lr land in the metrics ring; wrap it in a JIT with the batch source.
+    # Data parallel: only the gradients, the all-reduce and the optimizer step (make_dp_apply) follow
+    def step(X: Tensor, Y: Tensor, slot: UOp) -> Tensor:
+        opt.zero_grad()
+        # the gradients of tagged ops are tagged "backward"
+        with profiler.tag("forward"):
+            if amp is None: loss = model(normalize(X)).sparse_categorical_crossentropy(Y)
+            else:
+                with amp.autocast(): logits = model(normalize(X, amp.dtype))
+                loss = logits.float().sparse_categorical_crossentropy(Y)
+        if amp is None: loss.backward()
+        else: amp.backward(loss, opt.params)
+        if dp is not None: return dp.write_grads(opt.params, loss)
+        return loss.realize(*schedule_step(opt, ring, slot, loss, amp))
+    return step
+
+def make_dp_apply(opt, ring: MetricsRing, dp: DataParallel, amp: Optional[MixedPrecision] = None):
+    # the optimizer step on the reduced gradients, with the mean loss of all ranks
+    @TinyJit
+    @Tensor.train()
+    def apply(slot: UOp) -> Tensor:
+        dp.read_grads(opt.params)
+        return dp.loss.realize(*schedule_step(opt, ring, slot, dp.loss, amp))
+    return apply
+
+def train_state(model, opt, ckpt: Optional[Checkpoint] = None, amp: Optional[MixedPrecision] = None) -> dict[str, Tensor]:
+    # everything a resumed run (or a data parallel replica) needs on device, the parameters appear once (under model.)
+    state = {f"model.{k}": v for k, v in get_state_dict(model).items()}
+    state.update({f"opt.{k}": v for k, v in get_state_dict(opt).items() if not k.startswith("params.")})
+    if amp is not None: state.update({f"amp.{k}": v for k, v in amp.state().items()})
+    if ckpt is not None: state.update({f"best.{k}": v for k, v in ckpt.best.items()})
+    return state
+
+# stop_step ends the run early, state_path continues it from (and saves it to) a training state file:
+# a halving sweep trains each config in slices, see sweep.halving_sweep. `dp` is set in the data parallel
+# ranks started by rank 0 (cfg.dp_workers > 1), see parallel.py
+def train_model(type: models.Type, cfg: HPConfig, cvt_webgpu=False, stop_step: Optional[int] = None, state_path: Optional[Path] = None,
+                dp: Optional[DataParallel] = None, log_path: Optional[Path] = None, ckpt_path: Optional[Path] = None) -> RunLog:
+    model, model_name = build_model(type, cfg)
 
     dir_name = Path("../app/public/models") / model_name
-    dir_name.mkdir(exist_ok=True)
+    # the best weights go to disk when they are exported or the caller asks for them, sweeps keep them in memory
+    if ckpt_path is None and cvt_webgpu: ckpt_path = Path("checkpoints") / f"{model_name}-{run_id()}.safetensors"
+    ckpt = Checkpoint(model, ckpt_path if dp is None or dp.root else None, flush_secs=cfg.flush_secs)
 
     X_train, Y_train, X_test, Y_test = mnist()
     opt = cfg.opt(nn.state.get_parameters(model))
-    opt.lr = Tensor(cfg.lr)
+    opt.lr = Tensor(cfg.lr).contiguous().realize()
+    amp = mixed_precision(model, opt, cfg.precision)
+    ring = MetricsRing(cfg.sync_every, 2 if amp is None else 3)
+
+    # data parallel: every rank takes its shard of the batch, rank 0 (the caller) starts the others and then runs
+    # the same training as they do, under the same failure handling (this model only sized the shared memory)
+    if dp is None and cfg.dp_workers > 1:
+        replica = train_state(model, opt, amp=amp).values()
+        dp = launch(train_model, cfg.dp_workers, sum(p.numel() for p in opt.params), sum(t.nbytes() for t in replica), type, cfg)
+        return run_rank(train_model, dp, type, cfg, cvt_webgpu, stop_step, state_path, log_path=log_path, ckpt_path=ckpt_path)
+    root = dp is None or dp.root
+    batch_size, shard, seed = cfg.batch_size, (0, 1), None
+    if dp is not None:
+        assert cfg.batch_size % dp.world == 0, f"batch size {cfg.batch_size} does not split over {dp.world} ranks"
+        batch_size, shard, seed = cfg.batch_size // dp.world, (dp.rank, dp.world), dp.seed
+        Tensor.manual_seed(dp.seed + dp.rank)  # augmentation and random batches differ per rank, the weights come from rank 0
 
     # -----------------
     # Training step
     # -----------------
+    step = make_step(model, opt, ring, dp, amp)
+    dp_apply = make_dp_apply(opt, ring, dp, amp) if dp is not None else None
+
     @TinyJit
     @Tensor.train()
-    def train_step() -> Tensor:
-        samples = Tensor.randint(cfg.batch_size, high=int(X_train.shape[0]))
-        angle_deg = (Tensor.rand(cfg.batch_size) * 2 * cfg.angle - cfg.angle)
-        scale = 1.0 + (Tensor.rand(cfg.batch_size) * 2 * cfg.scale - cfg.scale)
-        shift_x = (Tensor.rand(cfg.batch_size) * 2 * cfg.shift - cfg.shift)
-        shift_y = (Tensor.rand(cfg.batch_size) * 2 * cfg.shift - cfg.shift)
+    def train_step(slot: UOp) -> Tensor:
+        with profiler.tag("augment"):
+            samples = Tensor.randint(batch_size, high=int(X_train.shape[0]))
+            theta = random_affine(batch_size, cfg.angle, cfg.scale, cfg.shift)
+            X, Y = affine_transform(X_train[samples], theta, cfg.sampling), Y_train[samples]
+        return step(X, Y, slot)
 
-        opt.zero_grad()
-        input = normalize(geometric_transform(X_train[samples], angle_deg, scale, shift_x, shift_y, SamplingMod.NEAREST))
-        loss = model(input).sparse_categorical_crossentropy(Y_train[samples]).backward()
-        return loss.realize(*opt.schedule_step())
+    # epoch sampler, batches are contiguous slices of the current shuffled shard
+    @TinyJit
+    @Tensor.train()
+    def train_step_epoch(X: Tensor, Y: Tensor, offset: UOp, slot: UOp) -> Tensor:
+        with profiler.tag("augment"):
+            X, Y = EpochLoader.batch(X, Y, offset, batch_size)
+            X = affine_transform(X, random_affine(batch_size, cfg.angle, cfg.scale, cfg.shift), cfg.sampling)
+        return step(X, Y, slot)
+
+    # offline mode, batches come already augmented (and shuffled) from the store
+    store, loader = None, None
+    if cfg.aug_epochs > 0:
+        store = AugmentStore(cfg.aug_epochs, cfg.angle, cfg.scale, cfg.shift, cfg.sampling)
+        store.start()
+        loader = StoreLoader(store, batch_size, cfg.prefetch, seed, shard)
+    elif cfg.sampler == "epoch":
+        loader = EpochLoader(X_train, Y_train, batch_size, seed, shard)
+
+    @TinyJit
+    @Tensor.train()
+    def train_step_stored(X: Tensor, Y: Tensor, slot: UOp) -> Tensor: return step(X, Y, slot)
 
     # -----------------
-    # Evaluation step
+    # Evaluation
     # -----------------
-    @TinyJit
-    def eval_step() -> tuple[Tensor, Tensor]:
-        out = model(normalize(X_test))
-        test_loss = out.sparse_categorical_crossentropy(Y_test)
-        test_acc = (out.argmax(axis=1) == Y_test).mean() * 100
-        return test_loss, test_acc
+    # rank 0 only, like the checkpoint snapshots
+    evaluator = Evaluator(model, X_test, Y_test, chunk=cfg.eval_chunk, samples=cfg.eval_samples) if root else None
 
     # -----------------
     # Training loop
     # -----------------
-    steps_cnt = math.ceil((len(X_train) / cfg.batch_size) * cfg.epochs)
-    logs: list[TrainLog] = []
-    best_acc, best_since = 0.0, 0
-    start_time = time.time()
+    steps_cnt = train_steps(cfg, len(X_train))
+    pending: list[tuple] = []  # (step, best_acc, time, eval_frac) until the ring drains
+    first_step, best_acc, best_since, time_offset = 0, 0.0, 0, 0.0
+    if root and state_path is not None and Path(state_path).exists():
+        # the loaders start a fresh shuffle, everything else continues where the last slice stopped
+        meta = load_state(state_path, train_state(model, opt, ckpt, amp))
+        first_step, best_acc, best_since, time_offset, ckpt.saved = meta["step"], meta["best_acc"], meta["best_since"], meta["time"], meta["saved"]
+    last_step = steps_cnt if stop_step is None else min(stop_step, steps_cnt)
+    if dp is not None:
+        # the replicas start from rank 0's (possibly resumed) state and run its step range
+        first_step, last_step = map(int, dp.broadcast_values(first_step, last_step))
+        dp.broadcast(list(train_state(model, opt, amp=amp).values()))
+    # rank 0 logs, a resumed run appends to its log from the resumed step; the other ranks only drain their
+    # metrics ring and return an empty log
+    meta = dict(model=model_name, batch_size=cfg.batch_size, width=cfg.width, depth=cfg.depth, opt_name=opt.__class__.__name__, precision=cfg.precision)
+    log = RunLog(meta, log_path, start_step=first_step) if root else RunLog(meta, chunk=0).close()
+    start_time = time.time() - time_offset
+    last_eval, eval_time = time.time(), 0.0
 
-    for i in (t := trange(steps_cnt, desc="Training")):
-        loss = train_step()
+    for i in (t := tqdm(range(first_step, last_step), desc="Training", disable=not root)):
+        slot = ring.next_slot()
+        with profiler.phase("loader"): batch = loader.next() if loader is not None else ()
+        with profiler.phase("train_step"):
+            if store is not None: loss = train_step_stored(*batch, slot)
+            elif loader is not None: loss = train_step_epoch(*batch, slot)
+            else: loss = train_step(slot)
+        if dp is not None:
+            with profiler.phase("all_reduce"): dp.all_reduce()
+            with profiler.phase("optimizer"): loss = dp_apply(slot)
         elapsed = time.time() - start_time
 
         test_loss, test_acc = None, None
-        if i % 10 == 9:  # periodic evaluation
-            test_loss, test_acc = eval_step()
-            test_loss = test_loss.item()
-            test_acc = test_acc.item()
+        # the last step of a run (or of a halving slice) is always evaluated, a cut config still gets a score
+        if root and (i == last_step - 1 or ((time.time() - last_eval >= cfg.eval_secs) if cfg.eval_secs > 0 else (i % cfg.eval_every == cfg.eval_every - 1))):
+            last_eval = time.time()
+            with profiler.phase("eval"), profiler.tag("eval"):
+                test_loss, test_acc = evaluator.sample()
+                # a subset score only nominates a new best, the full test set confirms it
+                if evaluator.sampled and test_acc > best_acc: test_loss, test_acc = evaluator.full()
+            eval_time += time.time() - last_eval
 
             if test_acc > best_acc:
                 best_acc = test_acc
                 best_since = 0
-                state_dict = get_state_dict(model)
-                safe_save(state_dict, str(dir_name / f"{model_name}.safetensors"))
-                del state_dict
+                with profiler.phase("checkpoint"), profiler.tag("checkpoint"): ckpt.snapshot()
             else:
                 best_since += 1
         else:
             best_since += 1
 
         # LR decay if plateau
-        if best_since % cfg.patience == cfg.patience - 1:
+        decayed = best_since % cfg.patience == cfg.patience - 1
+        # rank 0 decides, this is also the barrier that ends the step for every rank
+        if dp is not None: decayed = dp.broadcast_values(decayed)[0] > 0
+        if decayed:
             best_since = 0
-            opt.lr *= cfg.lr_decay
-            state_dict = safe_load(dir_name / f"{model_name}.safetensors")
-            load_state_dict(model, state_dict)
-            del state_dict
+            opt.lr.assign(opt.lr * cfg.lr_decay).realize()  # in place, the JIT holds this buffer
+            with profiler.phase("checkpoint"), profiler.tag("checkpoint"): ckpt.restore()
+            if dp is not None:
+                with profiler.phase("broadcast"): dp.broadcast(list(get_state_dict(model).values()))
 
         # -----------------
         # Logging
         # -----------------
-        logs.append(TrainLog(
-            step=i,
-            train_loss=loss.item(),
-            test_loss=test_loss,
-            test_acc=test_acc,
-            best_acc=best_acc,
-            lr=opt.lr.item(),
-            time=elapsed,
-            batch_size=cfg.batch_size,
-            width=cfg.width,
-            depth=cfg.depth,
-            opt_name=opt.__class__.__name__,
-        ))
-
-        t.set_description(f"lr: {opt.lr.item():.2e}  loss: {loss.item():.2f}  best: {best_acc:.2f}%")
+        # loss and lr stay on device (written by train_step) until the next flush
+        if test_acc is not None: log.add_eval(i, test_loss, test_acc)
+        if root: pending.append((i, best_acc, elapsed, eval_time / max(time.time() - start_time - time_offset, 1e-9)))
+
+        if ring.full() or test_acc is not None or decayed or i == last_step - 1:
+            with profiler.phase("sync"): rows = ring.drain()
+            if not root: continue
+            steps, best, times, eval_frac = zip(*pending)
+            train_loss, lr, *scale = zip(*rows)
+            log.extend(step=steps, train_loss=train_loss, lr=lr, best_acc=best, time=times, eval_frac=eval_frac, **({"loss_scale": scale[0]} if scale else {}))
+            pending.clear()
+            train_loss, lr = train_loss[-1], lr[-1]
+            if decayed: log.set_last(lr=(lr := opt.lr.item()))  # train_step recorded the lr from before the decay
+            t.set_description(f"lr: {lr:.2e}  loss: {train_loss:.2f}  best: {best_acc:.2f}%")
+
+    log.close()
+    if root and ckpt.path is not None and not ckpt.saved:
+        with profiler.phase("checkpoint"): ckpt.snapshot()  # no evaluation improved, the file gets the last weights
+    with profiler.phase("checkpoint"): ckpt.close()
+    if root and state_path is not None:
+        meta = dict(step=max(first_step, last_step), best_acc=best_acc, best_since=best_since, time=time.time() - start_time, saved=ckpt.saved)
+        with profiler.phase("checkpoint"): save_state(state_path, train_state(model, opt, ckpt, amp), meta)
+    if store is not None:
+        loader.close()
+        store.close()
 
     if cvt_webgpu:
+        dir_name.mkdir(exist_ok=True)
+        shutil.copyfile(ckpt.path, dir_name / f"{model_name}.safetensors")
         Device.DEFAULT = "WEBGPU"
         model = models.Conv() if TYPE == models.Type.CONV else models.MLP()
         state_dict = safe_load(dir_name / f"{model_name}.safetensors")
         load_state_dict(model, state_dict)
-        input = Tensor.randn(1, 1, 28, 28)
-        prg, *_, state = export_model(model, Device.DEFAULT.lower(), input, model_name=model_name)
+        fold_batchnorm(model)
+        input = batch_input(getenv("EXPORT_BATCH", 64), 1, 28, 28)  # one program for batches of 1..EXPORT_BATCH
+        # the generated load() streams the weights with range requests unless STREAM_WEIGHTS=0
+        with profiler.phase("export"): prg, *_, state = export_model(model, Device.DEFAULT.lower(), input, model_name=model_name, stream_weights=bool(getenv("STREAM_WEIGHTS", 1)))
         safe_save(state, str(dir_name / f"{model_name}.webgpu.safetensors"))
         with open(dir_name / f"{model_name}.js", "w") as text_file: text_file.write(prg)
+        write_manifest(dir_name, model_name)
 
-    return logs
+    return log
 
 if __name__ == "__main__":
     TYPE = models.Type.MLP if getenv("TYPE", "mlp").lower() == "mlp" else models.Type.CONV
     TESTS = getenv("TESTS", 0)
+    WORKERS = int(getenv("WORKERS", 1))
+    # HALVING=1 runs the studies as successive halving sweeps
+    HALVING = HalvingConfig(eta=int(getenv("ETA", 2)), rungs=int(getenv("RUNGS", 0)), budget_steps=int(getenv("BUDGET_STEPS", 0)),
+                            budget_secs=float(getenv("BUDGET_SECS", 0.0))) if getenv("HALVING", 0) else None
 
     # Hyperparameters from environment
     B = int(getenv("BATCH", 128))
@@ -144,6 +281,9 @@ if __name__ == "__main__":
     SCALE = float(getenv("SCALE", 0.1))
     SHIFT = float(getenv("SHIFT", 0.1))
     SAMPLING = SamplingMod(getenv("SAMPLING", SamplingMod.NEAREST.value))
+    AUG_EPOCHS = int(getenv("AUG_EPOCHS", 0))
+    SAMPLER = getenv("SAMPLER", "epoch").lower()
+    PREFETCH = int(getenv("PREFETCH", 2))  # AUG_EPOCHS stores only, the epoch sampler's batches are slices of an epoch already on device
 
     OPT = getenv("OPT", "Adam").lower()
     OPT = nn.optim.Adam if OPT == "adam" else nn.optim.SGD
@@ -155,6 +295,15 @@ if __name__ == "__main__":
     WIDTH = int(getenv("WIDTH", 512))
     EPOCHS = int(getenv("EPOCHS", 1))
 
+    EVAL_EVERY = int(getenv("EVAL_EVERY", 10))
+    EVAL_SECS = float(getenv("EVAL_SECS", 0.0))
+    EVAL_SAMPLES = int(getenv("EVAL_SAMPLES", 0))
+    EVAL_CHUNK = int(getenv("EVAL_CHUNK", 1000))
+    SYNC_EVERY = int(getenv("SYNC_EVERY", 50))
+    FLUSH_SECS = float(getenv("FLUSH_SECS", 0.0))
+    DP_WORKERS = int(getenv("DP_WORKERS", 1))
+    PRECISION = getenv("PRECISION", "fp32").lower()
+
     # Final configuration object
     config = HPConfig()
     config.batch_size = B
@@ -169,14 +318,31 @@ if __name__ == "__main__":
     config.angle = ANGLE
     config.scale = SCALE
     config.shift = SHIFT
+    config.sampling = SAMPLING
+    config.aug_epochs = AUG_EPOCHS
+    config.sampler = SAMPLER
+    config.prefetch = PREFETCH
+    config.eval_every = EVAL_EVERY
+    config.eval_secs = EVAL_SECS
+    config.eval_samples = EVAL_SAMPLES
+    config.eval_chunk = EVAL_CHUNK
+    config.sync_every = SYNC_EVERY
+    config.flush_secs = FLUSH_SECS
+    config.dp_workers = DP_WORKERS
+    config.precision = PRECISION
 
     print("Loaded training configuration:")
     print(config)
 
     if TESTS == 0:
-        train_model(TYPE, config, cvt_webgpu=True)
+        log = train_model(TYPE, config, cvt_webgpu=True, log_path=Path("logs") / f"{TYPE.name.lower()}-{run_id()}")
+        print(f"{len(log)} steps logged to {log.path}")
+        if profiler.enabled:
+            # PROF=1, the run of this process (rank 0 with DP_WORKERS)
+            print(profiler.summary())
+            print(f"trace written to {profiler.save(Path('profiles') / f'trace-{run_id()}.json')}")
     elif TYPE == models.Type.MLP:
-        mlp_testing(TYPE, TESTS, train_model)
+        mlp_testing(TYPE, TESTS, train_model, workers=WORKERS, halving=HALVING)
     elif TYPE == models.Type.CONV:
-        conv_testing(TYPE, TESTS, train_model)
+        conv_testing(TYPE, TESTS, train_model, workers=WORKERS, halving=HALVING)
 
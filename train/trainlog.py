@@ -0,0 +1,190 @@
+#! /usr/bin/env python3
+# vim:fenc=utf-8
+#
+# Copyright (C) 2025 Stanley Arnaud <stantonik@stantonik-mba.local>
+#
+# Distributed under terms of the MIT license.
+
+from pathlib import Path
+from typing import Iterator, Optional
+from utils import TrainLog
+import json
+import numpy as np
+
+# Columnar training log. The per-step scalars go into preallocated typed arrays, `chunk` rows at a time, the
+# evaluations (one step in eval_every) are EvalRow records until the chunk is flushed, and the run's config
+# (batch size, width, optimizer...) is stored once. With a path every full chunk is appended to one raw file
+# per column (steps.<column>.bin, evals.<column>.bin) and the arrays are reused, so a run of any length holds
+# a single chunk; log.json keeps the row counts and the config, and column() memory maps the files. Without
+# a path the chunks stay in memory. log[i] still gives a TrainLog row, for analysis code that wants one
+
+STEP_COLUMNS = dict(step=np.int32, train_loss=np.float32, lr=np.float32, best_acc=np.float32, time=np.float64, eval_frac=np.float32,
+                    loss_scale=np.float32)  # nan without mixed precision
+EVAL_COLUMNS = dict(step=np.int32, test_loss=np.float32, test_acc=np.float32)
+TABLES = {"steps": STEP_COLUMNS, "evals": EVAL_COLUMNS}
+INDEX = "log.json"
+
+class EvalRow:
+    __slots__ = ("step", "test_loss", "test_acc")
+
+    def __init__(self, step: int, test_loss: float, test_acc: float): self.step, self.test_loss, self.test_acc = step, test_loss, test_acc
+
+class RunLog:
+    def __init__(self, meta: dict, path: Optional[Path] = None, chunk: int = 4096, start_step: int = 0):
+        self.meta, self.path = meta, None if path is None else Path(path)
+        self.rows = {table: 0 for table in TABLES}      # flushed rows, on disk or in self.chunks
+        self.chunks = {table: [] for table in TABLES}   # without a path
+        self.buf = {name: np.empty(chunk, dtype=dtype) for name, dtype in STEP_COLUMNS.items()}
+        self.n, self.evals = 0, []
+        if self.path is not None: self._open(start_step)
+
+    @classmethod
+    def open(cls, path: Path) -> "RunLog":
+        # a finished (or interrupted) run's log, read only
+        index = json.loads((Path(path) / INDEX).read_text())
+        log = cls(index["meta"]).close()
+        log.path, log.rows = Path(path), index["rows"]
+        return log
+
+    def _file(self, table: str, name: str) -> Path: return self.path / f"{table}.{name}.bin"
+
+    def _memmap(self, table: str, name: str, rows: int) -> np.ndarray:
+        dtype = TABLES[table][name]
+        return np.memmap(self._file(table, name), dtype=dtype, mode="r", shape=(rows,)) if rows else np.empty(0, dtype=dtype)
+
+    def _open(self, start_step: int):
+        # a resumed run keeps the rows before start_step, the rest belongs to a slice that did not finish
+        self.path.mkdir(parents=True, exist_ok=True)
+        if (self.path / INDEX).exists():
+            rows = json.loads((self.path / INDEX).read_text())["rows"]
+            self.rows = {table: int(np.searchsorted(self._memmap(table, "step", rows[table]), start_step)) for table in TABLES}
+        for table, columns in TABLES.items():
+            for name, dtype in columns.items():
+                with open(self._file(table, name), "ab") as f: f.truncate(self.rows[table] * np.dtype(dtype).itemsize)
+        self._write_index()
+
+    def _write_index(self):
+        index = dict(meta=self.meta, rows=self.rows, columns={table: {k: np.dtype(v).str for k, v in columns.items()} for table, columns in TABLES.items()})
+        tmp = self.path / f"{INDEX}.tmp"
+        tmp.write_text(json.dumps(index, indent=2) + "\n")
+        tmp.replace(self.path / INDEX)  # atomic, the counts never cover bytes that are not written yet
+
+    def extend(self, **columns):
+        # one value per row for every step column, the missing ones are nan
+        assert self.buf is not None, "the log is closed"
+        n, done = len(columns["step"]), 0
+        while done < n:
+            if self.n == len(self.buf["step"]): self.flush()
+            take = min(n - done, len(self.buf["step"]) - self.n)
+            for name, buf in self.buf.items(): buf[self.n:self.n + take] = columns[name][done:done + take] if name in columns else np.nan
+            self.n, done = self.n + take, done + take
+
+    def set_last(self, **values):
+        # chunks are flushed when the next rows need the room, the last row is always still buffered
+        assert self.n > 0, "no buffered row"
+        for name, value in values.items(): self.buf[name][self.n - 1] = value
+
+    def add_eval(self, step: int, test_loss: float, test_acc: float): self.evals.append(EvalRow(step, test_loss, test_acc))
+
+    def _tail(self, table: str) -> dict[str, np.ndarray]:
+        if table == "evals": return {name: np.array([getattr(e, name) for e in self.evals], dtype=dtype) for name, dtype in EVAL_COLUMNS.items()}
+        return {name: buf[:self.n] for name, buf in (self.buf or {}).items()}
+
+    def flush(self):
+        for table in TABLES:
+            columns = self._tail(table)
+            if not columns or not len(columns["step"]): continue
+            if self.path is None: self.chunks[table].append({name: values.copy() for name, values in columns.items()})
+            else:
+                for name, values in columns.items():
+                    with open(self._file(table, name), "ab") as f: values.tofile(f)
+            self.rows[table] += len(columns["step"])
+        self.n, self.evals = 0, []
+        if self.path is not None: self._write_index()
+
+    def close(self) -> "RunLog":
+        # flushes and frees the chunk; in memory the chunks become one array per column
+        if self.buf is None: return self
+        self.flush()
+        self.buf = None
+        for table, chunks in self.chunks.items():
+            if len(chunks) > 1: self.chunks[table] = [{name: np.concatenate([c[name] for c in chunks]) for name in TABLES[table]}]
+        return self
+
+    def load(self) -> "RunLog":
+        # an in memory copy, it outlives the files
+        log = RunLog(self.meta, chunk=max(len(self), 1))
+        log.extend(**{name: self.column(name) for name in STEP_COLUMNS})
+        log.evals = [EvalRow(*row) for row in zip(*(self.column(name, "evals").tolist() for name in EVAL_COLUMNS))]
+        return log.close()
+
+    def column(self, name: str, table: str = "steps") -> np.ndarray:
+        # a memory map of the file once the log is closed, no copy
+        parts = [self._memmap(table, name, self.rows[table])] if self.path is not None else []
+        parts += [chunk[name] for chunk in self.chunks[table]]
+        tail = self._tail(table)
+        if tail: parts.append(tail[name])
+        parts = [p for p in parts if len(p)]
+        if len(parts) == 1: return parts[0]
+        return np.concatenate(parts) if parts else np.empty(0, dtype=TABLES[table][name])
+
+    def __len__(self) -> int: return self.rows["steps"] + self.n
+
+    @property
+    def best_acc(self) -> float: return float(self.column("best_acc")[-1]) if len(self) else 0.0
+
+    def _columns(self) -> tuple[dict[str, np.ndarray], dict[str, np.ndarray]]:
+        # every column once, an open log concatenates its chunks here
+        return {name: self.column(name) for name in STEP_COLUMNS}, {name: self.column(name, "evals") for name in EVAL_COLUMNS}
+
+    def _row(self, i: int, steps: dict[str, np.ndarray], evals: dict[str, np.ndarray]) -> TrainLog:
+        row = {name: values[i].item() for name, values in steps.items()}
+        j = int(np.searchsorted(evals["step"], row["step"]))
+        evaluated = j < len(evals["step"]) and evals["step"][j] == row["step"]
+        test_loss, test_acc = (evals[name][j].item() if evaluated else None for name in ("test_loss", "test_acc"))
+        scale = row.pop("loss_scale")
+        return TrainLog(test_loss=test_loss, test_acc=test_acc, loss_scale=None if np.isnan(scale) else scale, **row,
+                        **{k: self.meta.get(k) for k in ("batch_size", "width", "depth", "opt_name")})
+
+    def __getitem__(self, i: int) -> TrainLog: return self._row(range(len(self))[i], *self._columns())
+
+    def __iter__(self) -> Iterator[TrainLog]:
+        columns = self._columns()
+        return (self._row(i, *columns) for i in range(len(self)))
+
+if __name__ == "__main__":
+    # host memory of a long run's log: a list of TrainLog rows against the columnar log, and the append cost
+    from dataclasses import asdict
+    from tinygrad.helpers import getenv
+    import pickle
+    import tempfile
+    import time
+    import tracemalloc
+
+    ROWS, EVAL_EVERY = int(getenv("ROWS", 200_000)), int(getenv("EVAL_EVERY", 10))
+    steps = np.arange(ROWS)
+    columns = dict(step=steps, train_loss=np.random.rand(ROWS), lr=np.full(ROWS, 1e-3), best_acc=np.linspace(0, 99, ROWS), time=steps * 0.01,
+                   eval_frac=np.full(ROWS, 0.1))
+    meta = dict(batch_size=128, width=512, depth=2, opt_name="Adam")
+
+    tracemalloc.start()
+    st = time.perf_counter()
+    rows = [TrainLog(step=i, train_loss=float(columns["train_loss"][i]), test_loss=0.1 if i % EVAL_EVERY == 0 else None,
+                     test_acc=98.0 if i % EVAL_EVERY == 0 else None, best_acc=float(columns["best_acc"][i]), lr=1e-3, time=i * 0.01, eval_frac=0.1, **meta)
+            for i in range(ROWS)]
+    list_s, list_mb = time.perf_counter() - st, tracemalloc.get_traced_memory()[0] / 1e6
+    print(f"list of TrainLog  {list_s * 1e6 / ROWS:6.2f} us/row  held {list_mb:7.2f} MB  pickled {len(pickle.dumps(rows)) / 1e6:7.2f} MB  ({len(asdict(rows[0]))} fields per row)")
+    del rows
+    tracemalloc.reset_peak()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        st = time.perf_counter()
+        log = RunLog(meta, Path(tmp) / "run")
+        for start in range(0, ROWS, 50):  # one extend per host sync (sync_every=50)
+            log.extend(**{name: values[start:start + 50] for name, values in columns.items()})
+            for s in range(start - start % EVAL_EVERY, start + 50, EVAL_EVERY): log.add_eval(s, 0.1, 98.0)
+        log.close()
+        log_s, peak_mb = time.perf_counter() - st, tracemalloc.get_traced_memory()[1] / 1e6
+        disk_mb = sum(f.stat().st_size for f in (Path(tmp) / "run").iterdir()) / 1e6
+        print(f"RunLog on disk    {log_s * 1e6 / ROWS:6.2f} us/row  peak {peak_mb:7.2f} MB  files {disk_mb:7.2f} MB  pickled {len(pickle.dumps(log)) / 1e3:.1f} kB  "
+              f"best {log.best_acc:.1f}%  rows {len(log)}")
@@ -8,11 +8,19 @@
 from dataclasses import dataclass
 from enum import Enum
 from typing import Callable, Optional
-from tinygrad import Tensor, nn
+from pathlib import Path
+from tinygrad import Tensor, dtypes, nn
+from tinygrad.dtype import DType
+import hashlib
+import json
 import math
 
 from tinygrad.nn.optim import Optimizer
 
+class SamplingMod(Enum):
+  BILINEAR = 0
+  NEAREST = 1
+
 @dataclass
 class HPConfig():
     batch_size: int = 128
@@ -28,6 +36,19 @@ class HPConfig():
     angle: int = 15
     scale: float = 0.1
     shift: float = 0.1
+    sampling: SamplingMod = SamplingMod.NEAREST
+    aug_epochs: int = 0         # if > 0, train from this many augmented epochs generated offline
+    sampler: str = "epoch"      # "epoch" walks a fresh permutation every epoch, "random" draws batches with replacement
+    prefetch: int = 2           # batches the offline store's reader thread keeps ready ahead of the training step
+
+    eval_every: int = 10        # steps between evaluations
+    eval_secs: float = 0.0      # if > 0, evaluate every eval_secs seconds instead
+    eval_samples: int = 0       # size of the rotating test subset, 0 evaluates the full test set
+    eval_chunk: int = 1000      # forward pass chunk size during evaluation
+    sync_every: int = 50        # steps between host syncs of the logged loss and lr
+    flush_secs: float = 0.0     # if > 0, also write the best checkpoint to disk at most every flush_secs seconds
+    dp_workers: int = 1         # if > 1, data parallel training: each process takes batch_size / dp_workers of every batch
+    precision: str = "fp32"     # "fp16" or "bf16" trains in half precision on float32 master weights, see precision.py
 
 @dataclass
 class TrainLog:
@@ -43,58 +64,18 @@ class TrainLog:
     width: Optional[int] = None
     depth: Optional[int] = None
     opt_name: Optional[str] = None
+    eval_frac: Optional[float] = None   # fraction of wall time spent evaluating so far
+    loss_scale: Optional[float] = None  # mixed precision only, drops when a step overflowed and was skipped
 
 
-class SamplingMod(Enum):
-  BILINEAR = 0
-  NEAREST = 1
-
-def geometric_transform(X: Tensor, angle_deg: Tensor, scale: Tensor, shift_x: Tensor, shift_y: Tensor, sampling: SamplingMod) -> Tensor:
-    B, C, H, W = X.shape
-
-    angle = angle_deg * math.pi / 180.0
-    cos_a, sin_a = Tensor.cos(angle), Tensor.sin(angle)
-    R11, R12, T13 = cos_a * scale, -sin_a * scale, shift_x
-    R21, R22, T23 = sin_a * scale, cos_a * scale, shift_y
-    row1 = Tensor.cat(R11.reshape(B, 1), R12.reshape(B, 1), T13.reshape(B, 1), dim=1).reshape(B, 1, 3)
-    row2 = Tensor.cat(R21.reshape(B, 1), R22.reshape(B, 1), T23.reshape(B, 1), dim=1).reshape(B, 1, 3)
-    row3 = Tensor([[0.0, 0.0, 1.0]]).expand(B, 1, 3)
-    affine_matrix = Tensor.cat(row1, row2, row3, dim=1)
-
-    x_idx, y_idx = Tensor.arange(W).float(), Tensor.arange(H).float()
-    grid_y, grid_x = y_idx.reshape(-1, 1).expand(H, W), x_idx.reshape(1, -1).expand(H, W)
-    coords = Tensor.stack([grid_x.flatten(), grid_y.flatten()], dim=1)
-    coords_homo = Tensor.cat(coords, Tensor.ones(H * W, 1), dim=1).reshape(1, H * W, 3).expand(B, H * W, 3)
-    transformed_coords = coords_homo.matmul(affine_matrix.permute(0, 2, 1))
-
-    match sampling:
-      case SamplingMod.NEAREST:
-        x_idx = transformed_coords[:, :, 0].round().clip(0, W - 1).int()
-        y_idx = transformed_coords[:, :, 1].round().clip(0, H - 1).int()
-        return X.reshape(B, C * H * W).gather(1, y_idx * W + x_idx).reshape(B, C, H, W)
-
-      case SamplingMod.BILINEAR:
-        x_prime, y_prime = transformed_coords[:, :, 0],  transformed_coords[:, :, 1]
-        x0, y0 = x_prime.floor().int(), y_prime.floor().int()
-        dx, dy = x_prime - x0.float(), y_prime - y0.float()
-
-        x1, y1 = x0 + 1, y0 + 1
-        x0, y0 = x0.clip(0, W - 1), y0.clip(0, H - 1)
-        x1, y1 = x1.clip(0, W - 1), y1.clip(0, H - 1)
-
-        w00 = (1.0 - dx) * (1.0 - dy)
-        w10 = dx * (1.0 - dy)
-        w01 = (1.0 - dx) * dy
-        w11 = dx * dy
-
-        X_flat = X.reshape(B, C * H * W)
-        v00 = X_flat.gather(1, y0 * W + x0)
-        v10 = X_flat.gather(1, y0 * W + x1)
-        v01 = X_flat.gather(1, y1 * W + x0)
-        v11 = X_flat.gather(1, y1 * W + x1)
-
-        return ((w00 * v00) + (w10 * v10) + (w01 * v01) + (w11 * v11)).reshape(B, C, H, W)
+def train_steps(cfg: HPConfig, n_train: int) -> int:
+    return math.ceil((n_train / cfg.batch_size) * cfg.epochs)
 
-def normalize(X: Tensor) -> Tensor:
-  return X * 2 / 255 - 1
+def normalize(X: Tensor, dtype: DType = dtypes.float) -> Tensor:
+  return X.cast(dtype) * 2 / 255 - 1
 
+def write_manifest(out_dir: Path, name: str):
+    # content hashes of an exported module and its weights, the app caches both under these versions
+    files = {"js": out_dir / f"{name}.js", "weights": out_dir / f"{name}.webgpu.safetensors"}
+    manifest = {k: hashlib.sha256(path.read_bytes()).hexdigest()[:16] for k, path in files.items()}
+    (out_dir / f"{name}.manifest.json").write_text(json.dumps(manifest, indent=2) + "\n")
@@ -0,0 +1,90 @@
+#! /usr/bin/env python3
+# vim:fenc=utf-8
+#
+# Copyright (C) 2025 Stanley Arnaud <stantonik@stantonik-mba.local>
+#
+# Distributed under terms of the MIT license.
+
+from pathlib import Path
+from tinygrad import Tensor
+from tinygrad.device import Device
+from tinygrad.helpers import getenv
+from export_model import batch_input, export_model
+from native import NativeNet, build
+from predict import load_model
+from utils import normalize
+import ctypes
+import numpy as np
+import subprocess
+import sys
+import tempfile
+
+# one export with a symbolic batch has to give the logits of batched tinygrad inference at every batch size
+
+def reference(model, X: np.ndarray) -> np.ndarray:
+    return model(normalize(Tensor(X))).numpy()
+
+def run_clang(model, max_batch: int, tmp: Path):
+    # the embedded-weights C program, net(input0, batch, output0)
+    device = Device.DEFAULT
+    Device.DEFAULT = "CPU"
+    try: src, *_ = export_model(model, "clang", batch_input(max_batch, 1, 28, 28))
+    finally: Device.DEFAULT = device
+    assert "int batch" in src.split("void net(", 1)[1].split(")", 1)[0], "net() does not take the batch"
+    (tmp / "clang.c").write_text(src)
+    subprocess.check_call([getenv("CC", "cc"), "-O2", "-shared", "-fPIC", "-o", str(tmp / "clang.so"), str(tmp / "clang.c"), "-lm"])
+    lib = ctypes.CDLL(str(tmp / "clang.so"))
+    lib.net.argtypes = [ctypes.c_void_p, ctypes.c_int, ctypes.c_void_p]
+
+    def run(X: np.ndarray) -> np.ndarray:
+        x = np.ascontiguousarray(X.reshape(len(X), -1), dtype=np.float32) * (2 / 255) - 1
+        out = np.empty((len(X), 10), dtype=np.float32)
+        lib.net(x.ctypes.data, len(X), out.ctypes.data)
+        return out
+    return run
+
+def run_native(model, max_batch: int, tmp: Path):
+    return NativeNet(*build(model, tmp, "native", max_batch, symbolic=True))
+
+def check_webgpu(model, max_batch: int, tmp: Path):
+    # the generated program only runs in a browser, check that the batch reaches net() and the dispatches
+    device = Device.DEFAULT
+    Device.DEFAULT = "WEBGPU"
+    try: prg, *_ = export_model(model, "webgpu", batch_input(max_batch, 1, 28, 28), model_name="model")
+    finally: Device.DEFAULT = device
+    assert "const net = async (_input0,_batch) =>" in prg, "net() does not take the batch"
+    assert "_batch[0]" in prg, "no dispatch size depends on the batch"
+    return None
+
+TARGETS = {"clang": run_clang, "native": run_native, "webgpu": check_webgpu}
+
+if __name__ == "__main__":
+    TYPE = getenv("TYPE", "mlp").lower()
+    name = "mnist_mlp" if TYPE == "mlp" else "mnist_convnet"
+    MODEL = Path(getenv("MODEL", f"../app/public/models/{name}/{name}.safetensors"))
+    MAX_BATCH = int(getenv("MAX_BATCH", 64))
+    BATCHES = [int(b) for b in getenv("BATCHES", f"1,7,{MAX_BATCH},{MAX_BATCH * 2 + 3}").split(",")]
+    TARGET_LIST = [t.strip() for t in getenv("TARGETS", ",".join(TARGETS)).split(",")]
+    TOL = float(getenv("TOL", 1e-3))
+    ACT_FN = Tensor.silu if getenv("ACT_FN", "silu").lower() == "silu" else Tensor.relu
+
+    model = load_model(MODEL, ACT_FN)[0]
+    X = np.random.default_rng(0).integers(0, 256, (max(BATCHES), 1, 28, 28), dtype=np.uint8)
+    available, failed = list(Device.get_available_devices()), False
+    with tempfile.TemporaryDirectory() as tmp:
+        for target in TARGET_LIST:
+            if target == "webgpu" and "WEBGPU" not in available:
+                print(f"{target:7s} skipped, no WEBGPU device")
+                continue
+            run = TARGETS[target](model, MAX_BATCH, Path(tmp))
+            if run is None:
+                print(f"{target:7s} ok, generated program takes the batch")
+                continue
+            for b in BATCHES:
+                # the C net() takes at most MAX_BATCH at once, the native one loops over chunks
+                if target == "clang" and b > MAX_BATCH: continue
+                err = float(np.abs(run(X[:b]) - reference(model, X[:b])).max())
+                ok = err <= TOL
+                failed |= not ok
+                print(f"{target:7s} batch {b:4d}  max logit difference {err:.2e}  {'ok' if ok else 'FAIL'}")
+    sys.exit(1 if failed else 0)